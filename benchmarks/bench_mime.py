@@ -0,0 +1,102 @@
+"""
+Message building benchmark: MailSender.prepare_message against MessageBuilder.
+
+    python benchmarks/bench_mime.py
+    python benchmarks/bench_mime.py --messages 20000 --attachment-kb 256
+
+Both build the same messages: prepare_message(...).as_string() encoded to
+CRLF bytes the way smtplib does before sending, and MessageBuilder.build(),
+which writes those bytes directly. Each case reports microseconds per message
+and the speedup.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+from tabulate import tabulate  # noqa: E402
+
+from smartmailer.core.mailer import MailSender  # noqa: E402
+from smartmailer.utils.new_logger import Logger  # noqa: E402
+
+TEXT = "Hi {name},\n\nYour plan renews on 2026-11-01 for $42.\n\nThanks,\nThe Billing Team\n"
+HTML = "<html><body><h1>Hi {name},</h1><p>Your plan renews on <b>2026-11-01</b> for $42.</p></body></html>\n"
+
+
+def legacy_bytes(sender: MailSender, **kwargs: Any) -> bytes:
+    # what smtplib.sendmail did with the string before it went on the wire
+    message = sender.prepare_message(**kwargs).as_string()
+    return re.sub(r"(?:\r\n|\n|\r(?!\n))", "\r\n", message).encode("ascii")
+
+
+def time_per_message(build: Callable[[int], Any], count: int) -> float:
+    start = time.perf_counter()
+    for i in range(count):
+        build(i)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def run(messages: int, attachment_kb: int) -> List[Dict[str, Any]]:
+    sender = MailSender("bench@example.com", "password")
+    attachment = os.path.join(tempfile.mkdtemp(prefix="smartmailer-bench-"), "brochure.pdf")
+    with open(attachment, "wb") as f:
+        f.write(os.urandom(attachment_kb * 1024))
+
+    cases: Dict[str, Callable[[int], Dict[str, Any]]] = {
+        "text": lambda i: {"text_content": TEXT.format(name=i)},
+        "text+html": lambda i: {"text_content": TEXT.format(name=i), "html_content": HTML.format(name=i)},
+        "text+html (utf-8)": lambda i: {
+            "subject": f"Ihre Verlängerung, Empfänger {i}",
+            "text_content": TEXT.format(name=f"Jürgen {i}"),
+            "html_content": HTML.format(name=f"Jürgen {i}"),
+        },
+        f"text+html+{attachment_kb}KB attachment": lambda i: {
+            "text_content": TEXT.format(name=i), "html_content": HTML.format(name=i),
+            "attachment_paths": [attachment],
+        },
+    }
+
+    results = []
+    for name, make in cases.items():
+        def kwargs(i: int) -> Dict[str, Any]:
+            return {"to_email": f"recipient{i}@example.com", "subject": f"Renewal {i}", **make(i)}
+
+        legacy_us = time_per_message(lambda i: legacy_bytes(sender, **kwargs(i)), messages)
+        builder_us = time_per_message(lambda i: sender.message_builder.build(**kwargs(i)), messages)
+        results.append({
+            "case": name,
+            "prepare_message_us": legacy_us,
+            "builder_us": builder_us,
+            "speedup": legacy_us / builder_us if builder_us else 0.0,
+        })
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--attachment-kb", type=int, default=64)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    Logger(log_level="ERROR")
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = run(args.messages, args.attachment_kb)
+
+    print(tabulate(results, headers="keys", floatfmt=".2f"))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Session store benchmark: the SQLAlchemy backend against the sqlite3 one.
+
+    python benchmarks/bench_session_store.py
+    python benchmarks/bench_session_store.py --rows 50000 --batch-size 500
+
+For each backend, on a fresh session file: single-row inserts (what sending
+with db_batch_size=1 does), buffered inserts with --batch-size, single-hash
+lookups through check_recipient_sent, half of them hits, and get_sent_hashes
+over the whole list. The same lookups are then answered from a SentSet loaded
+from the store, as SessionManager does, exactly and through a Bloom filter.
+Each reports operations per second.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+from tabulate import tabulate  # noqa: E402
+
+from smartmailer.session_management.sent_set import SentSet  # noqa: E402
+from smartmailer.session_management.session_manager import SESSION_BACKENDS, get_store_class  # noqa: E402
+from smartmailer.utils.new_logger import Logger  # noqa: E402
+from smartmailer.utils.strings import get_hash  # noqa: E402
+
+
+def per_second(operation: Callable[[], Any], count: int) -> float:
+    start = time.perf_counter()
+    operation()
+    elapsed = time.perf_counter() - start
+    return count / elapsed if elapsed > 0 else 0.0
+
+
+def run(backend: str, rows: int, batch_size: int) -> Dict[str, Any]:
+    store_class = get_store_class(backend)
+    folder = tempfile.mkdtemp(prefix="smartmailer-bench-")
+    hashes = [get_hash(f"recipient{i}@example.com") for i in range(rows)]
+    misses = [get_hash(f"unsent{i}@example.com") for i in range(rows)]
+    # every other lookup is a recipient that was sent
+    lookups = [h for pair in zip(hashes[: rows // 2], misses) for h in pair]
+
+    store = store_class(os.path.join(folder, "single.db"))
+    try:
+        insert = per_second(lambda: [store.insert_recipient(h) for h in hashes], rows)
+        lookup = per_second(lambda: [store.check_recipient_sent(h) for h in lookups], len(lookups))
+        bulk = per_second(lambda: store.get_sent_hashes(hashes + misses), 2 * rows)
+        cached = {
+            mode: per_second(lambda: SentSet.load(store, mode).get_sent_hashes(lookups, store), len(lookups))
+            for mode in ("set", "bloom")
+        }
+    finally:
+        store.close()
+
+    store = store_class(os.path.join(folder, "buffered.db"), batch_size=batch_size, flush_interval=60)
+    try:
+        buffered = per_second(lambda: ([store.insert_recipient(h) for h in hashes], store.flush()), rows)
+    finally:
+        store.close()
+
+    return {
+        "backend": backend,
+        "inserts_per_s": insert,
+        f"buffered_inserts_per_s (batch {batch_size})": buffered,
+        "lookups_per_s": lookup,
+        "get_sent_hashes_per_s": bulk,
+        "set_lookups_per_s": cached["set"],
+        "bloom_lookups_per_s": cached["bloom"],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--backends", nargs="+", default=list(SESSION_BACKENDS), choices=list(SESSION_BACKENDS))
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    Logger(log_level="ERROR")
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [run(backend, args.rows, args.batch_size) for backend in args.backends]
+
+    print(tabulate(results, headers="keys", floatfmt=".0f"))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
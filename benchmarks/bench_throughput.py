@@ -0,0 +1,251 @@
+"""
+End-to-end throughput benchmark for SmartMailer.send_emails.
+
+    python benchmarks/bench_throughput.py
+    python benchmarks/bench_throughput.py --sizes 1000 10000 --pool-size 4 --db-batch-size 100
+
+Every size runs in a fresh process against a loopback SMTP sink, with a
+fresh session database in a temporary directory. For each run it reports:
+
+- end-to-end throughput in messages per second
+- p50/p99 latency of a single send (MIME build + SMTP transaction)
+- peak resident memory of the process
+- the per-message cost of each stage on its own: TemplateEngine.render,
+  MailSender.prepare_message, MessageBuilder.build (what sending uses),
+  the SMTP sendmail call and the session DB insert
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import smtplib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+from jinja2 import Environment  # noqa: E402
+from tabulate import tabulate  # noqa: E402
+
+from smartmailer import SmartMailer, TemplateEngine, TemplateModel  # noqa: E402
+from smartmailer.core.rate_limiter import AdaptiveRateLimiter  # noqa: E402
+from smartmailer.core.template import JinjaTemplateParser, JinjaTemplateRenderer, TemplateValidator  # noqa: E402
+from smartmailer.session_management.session_manager import SessionManager  # noqa: E402
+from smtp_sink import SMTPSink  # noqa: E402
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+STAGE_SAMPLE = 2_000
+
+SUBJECT = "Your {{ plan }} plan renews soon, {{ name }}"
+TEXT = """Hi {{ name }},
+
+Your {{ plan }} plan at {{ company }} renews on {{ renewal_date }} for ${{ amount }}.
+{% for item in items %}- {{ item }}
+{% endfor %}
+Thanks,
+The Billing Team
+"""
+HTML = """<html><body>
+<h1>Hi {{ name }},</h1>
+<p>Your <strong>{{ plan }}</strong> plan at {{ company }} renews on {{ renewal_date }} for <em>${{ amount }}</em>.</p>
+<ul>{% for item in items %}<li>{{ item }}</li>{% endfor %}</ul>
+</body></html>
+"""
+
+
+class BenchRecipient(TemplateModel):
+    name: str
+    email: str
+    company: str
+    plan: str
+    renewal_date: str
+    amount: int
+    items: List[str]
+
+
+def make_recipients(count: int) -> Iterator[BenchRecipient]:
+    for i in range(count):
+        yield BenchRecipient(
+            name=f"Recipient {i}",
+            email=f"recipient{i}@example.com",
+            company=f"Company {i % 97}",
+            plan=("basic", "pro", "enterprise")[i % 3],
+            renewal_date=f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            amount=10 + i % 90,
+            items=[f"Seat {j}" for j in range(i % 5 + 1)],
+        )
+
+
+def make_engine() -> TemplateEngine:
+    env = Environment()
+    return TemplateEngine(
+        parser=JinjaTemplateParser(env),
+        validator=TemplateValidator(),
+        renderer=JinjaTemplateRenderer(env),
+        subject=SUBJECT,
+        text=TEXT,
+        html=HTML,
+    )
+
+
+def peak_memory_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(samples: List[float], pct: int) -> float:
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1]
+
+
+def time_per_call(func: Callable[[Any], Any], items: List[Any]) -> float:
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def measure_stages(mailer: SmartMailer, address: Any, size: int) -> Dict[str, float]:
+    engine = make_engine()
+    models = list(make_recipients(min(size, STAGE_SAMPLE)))
+    sender = mailer.mailer
+
+    rendered = [engine.render(model) for model in models]
+    messages = [
+        sender.prepare_message(
+            to_email=model.email,
+            subject=r["subject"],
+            text_content=r["text"],
+            html_content=r["html"],
+        ).as_string()
+        for model, r in zip(models, rendered)
+    ]
+
+    stages = {
+        "render_us": time_per_call(engine.render, models),
+        "prepare_message_us": time_per_call(
+            lambda pair: sender.prepare_message(
+                to_email=pair[0].email,
+                subject=pair[1]["subject"],
+                text_content=pair[1]["text"],
+                html_content=pair[1]["html"],
+            ).as_string(),
+            list(zip(models, rendered)),
+        ),
+        "build_message_us": time_per_call(
+            lambda pair: sender.message_builder.build(
+                to_email=pair[0].email,
+                subject=pair[1]["subject"],
+                text_content=pair[1]["text"],
+                html_content=pair[1]["html"],
+            ),
+            list(zip(models, rendered)),
+        ),
+    }
+
+    server = smtplib.SMTP(*address)
+    server.login("bench@example.com", "password")
+    stages["sendmail_us"] = time_per_call(
+        lambda msg: server.sendmail("bench@example.com", ["recipient@example.com"], msg), messages
+    )
+    server.quit()
+
+    session = SessionManager(f"bench-stages-{size}", batch_size=mailer.session_manager.db.batch_size)
+    stages["db_insert_us"] = time_per_call(session.add_recipient, models)
+    session.flush()
+    return stages
+
+
+def run_single(size: int, pool_size: int, db_batch_size: int) -> Dict[str, Any]:
+    os.chdir(tempfile.mkdtemp(prefix="smartmailer-bench-"))
+    engine = make_engine()
+
+    with SMTPSink() as sink:
+        mailer = SmartMailer(
+            "bench@example.com", "password", "gmail", f"bench-{size}",
+            log_level="ERROR", pool_size=pool_size, db_batch_size=db_batch_size,
+        )
+        mailer.mailer.smtp_server, mailer.mailer.smtp_port = sink.address
+        mailer.mailer.use_starttls = False
+        # the sink has no provider limits to respect
+        mailer.mailer.rate_limiter = AdaptiveRateLimiter()
+
+        latencies: List[float] = []
+        deliver = mailer.mailer._deliver
+
+        def timed_deliver(*args: Any, **kwargs: Any) -> Optional[str]:
+            start = time.perf_counter()
+            try:
+                return deliver(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+        mailer.mailer._deliver = timed_deliver  # type: ignore[method-assign]
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                mailer.send_emails(make_recipients(size), "email", engine, show_preview=False)
+            except SystemExit:
+                pass
+        elapsed = time.perf_counter() - start
+        delivered = sink.messages
+
+        stages = measure_stages(mailer, sink.address, size)
+
+    return {
+        "recipients": size,
+        "delivered": delivered,
+        "seconds": elapsed,
+        "msgs_per_sec": delivered / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "peak_mb": peak_memory_mb(),
+        **stages,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--pool-size", type=int, default=1)
+    parser.add_argument("--db-batch-size", type=int, default=1)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.single is not None:
+        print(json.dumps(run_single(args.single, args.pool_size, args.db_batch_size)))
+        return
+
+    results = []
+    for size in args.sizes:
+        # a fresh process per size keeps peak memory figures independent
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--single", str(size),
+             "--pool-size", str(args.pool_size), "--db-batch-size", str(args.db_batch_size)],
+            check=True, capture_output=True, text=True,
+        )
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(tabulate(results, headers="keys", floatfmt=".2f"))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Loopback SMTP server that accepts and discards everything, for benchmarks.
+
+It speaks just enough ESMTP for SmartMailer's senders: EHLO/HELO, AUTH
+PLAIN/LOGIN (any credentials), MAIL, RCPT, DATA, RSET, NOOP and QUIT.
+STARTTLS isn't offered, so senders must run with use_starttls=False.
+"""
+import socketserver
+import threading
+from typing import Optional, Tuple
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    server: "_SinkServer"
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self) -> None:
+        self.reply("220 smartmailer-sink ready")
+        recipients = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").rstrip("\r\n")
+            verb = command[:4].upper()
+
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(
+                    b"250-smartmailer-sink\r\n"
+                    b"250-PIPELINING\r\n"
+                    b"250-8BITMIME\r\n"
+                    b"250 AUTH PLAIN LOGIN\r\n"
+                )
+            elif verb == "AUTH":
+                if command.upper().startswith("AUTH LOGIN"):
+                    self.reply("334 VXNlcm5hbWU6")
+                    self.rfile.readline()
+                    self.reply("334 UGFzc3dvcmQ6")
+                    self.rfile.readline()
+                self.reply("235 authenticated")
+            elif verb == "MAIL":
+                recipients = 0
+                self.reply("250 ok")
+            elif verb == "RCPT":
+                recipients += 1
+                self.reply("250 ok")
+            elif verb == "DATA":
+                self.reply("354 end with <CRLF>.<CRLF>")
+                size = 0
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk == b".\r\n":
+                        break
+                    size += len(chunk)
+                self.server.record(recipients, size)
+                self.reply("250 queued")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 ok")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 command not implemented")
+            self.wfile.flush()
+
+
+class _SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int]) -> None:
+        super().__init__(address, _SinkHandler)
+        self._lock = threading.Lock()
+        self.messages = 0
+        self.recipients = 0
+        self.bytes = 0
+
+    def record(self, recipients: int, size: int) -> None:
+        with self._lock:
+            self.messages += 1
+            self.recipients += recipients
+            self.bytes += size
+
+
+class SMTPSink:
+    """
+    Runs the sink on a background thread while used as a context manager.
+
+        with SMTPSink() as sink:
+            host, port = sink.address
+            ...
+        print(sink.messages)
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._server = _SinkServer((host, port))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        host, port = self._server.server_address[:2]
+        return str(host), int(port)
+
+    @property
+    def messages(self) -> int:
+        return self._server.messages
+
+    @property
+    def recipients(self) -> int:
+        return self._server.recipients
+
+    @property
+    def bytes(self) -> int:
+        return self._server.bytes
+
+    def start(self) -> "SMTPSink":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="smtp-sink", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "SMTPSink":
+        return self.start()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.stop()
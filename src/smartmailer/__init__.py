@@ -1,4 +1,36 @@
-from .smartmailer import SmartMailer
-from .core.mailer import MailSender
-from .core.template import TemplateEngine, TemplateModel
-from .session_management.session_manager import SessionManager
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, List
+
+if TYPE_CHECKING:
+    from .smartmailer import SmartMailer
+    from .core.mailer import MailSender
+    from .core.async_mailer import AsyncMailSender
+    from .core.template import TemplateEngine, TemplateModel
+    from .session_management.session_manager import SessionManager
+
+# each public name and the module it lives in. They're imported on first use,
+# so `import smartmailer` doesn't load SQLAlchemy, pydantic or Jinja2 up front
+_EXPORTS = {
+    "SmartMailer": ".smartmailer",
+    "MailSender": ".core.mailer",
+    "AsyncMailSender": ".core.async_mailer",
+    "TemplateEngine": ".core.template",
+    "TemplateModel": ".core.template",
+    "SessionManager": ".session_management.session_manager",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    # later lookups find it directly and skip this function
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,460 @@
+import asyncio
+import base64
+import re
+import smtplib
+import ssl
+import sys
+from functools import partial
+from typing import TYPE_CHECKING, Optional, Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Set, Tuple, Union
+
+from smartmailer.core.mailer import MailSender, failure_reply, invalid_row_reply
+from smartmailer.core.rate_limiter import AdaptiveRateLimiter, QuotaExceededError
+from smartmailer.utils.metrics import SendStats
+
+if TYPE_CHECKING:
+    from smartmailer.session_management.session_manager import SessionManager
+
+CRLF = b"\r\n"
+_EOL_PATTERN = re.compile(rb"\r\n|\r|\n")
+_LEADING_DOT_PATTERN = re.compile(rb"(?m)^\.")
+
+
+def quote_data(data: bytes) -> bytes:
+    """
+    Normalize line endings to CRLF and dot-stuff the message, as required for the DATA command.
+    """
+    data = _EOL_PATTERN.sub(CRLF, data)
+    data = _LEADING_DOT_PATTERN.sub(b"..", data)
+    if not data.endswith(CRLF):
+        data += CRLF
+    return data
+
+
+async def _aiter(items: Union[Iterable[Any], AsyncIterable[Any]]) -> AsyncIterator[Any]:
+    if hasattr(items, "__aiter__"):
+        async for item in items:  # type: ignore[union-attr]
+            yield item
+    else:
+        for item in items:  # type: ignore[union-attr]
+            yield item
+
+
+async def _anext_or_none(items: AsyncIterator[Any]) -> Any:
+    try:
+        return await items.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def _prepend(first: Any, rest: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    if first is not None:
+        yield first
+    async for item in rest:
+        yield item
+
+
+class AsyncSMTPConnection:
+    """
+    Minimal SMTP client over asyncio streams.
+    Supports EHLO, STARTTLS, AUTH PLAIN/LOGIN and sending a single message per transaction.
+    Errors are raised as the matching `smtplib` exceptions.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float = 30.0) -> None:
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.esmtp_features: Dict[str, str] = {}
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self) -> Tuple[int, str]:
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        code, message = await self._read_reply()
+        if code != 220:
+            self.close()
+            raise smtplib.SMTPConnectError(code, message)
+        return code, message
+
+    async def _read_reply(self) -> Tuple[int, str]:
+        if self._reader is None:
+            raise smtplib.SMTPServerDisconnected("Not connected.")
+
+        lines: List[str] = []
+        while True:
+            try:
+                line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+            except BaseException:
+                # a reply that arrives late would be read as the answer to the
+                # next command, so a connection that missed one can't be reused
+                self.close()
+                raise
+            if not line:
+                self.close()
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed.")
+            text = line.decode("utf-8", "replace").rstrip("\r\n")
+            try:
+                code = int(text[:3])
+            except ValueError:
+                self.close()
+                raise smtplib.SMTPResponseException(-1, f"Malformed reply: {text!r}")
+            lines.append(text[4:])
+            if text[3:4] != "-":
+                return code, "\n".join(lines)
+
+    async def _write(self, data: bytes) -> None:
+        if self._writer is None:
+            raise smtplib.SMTPServerDisconnected("Not connected.")
+        try:
+            self._writer.write(data)
+            await self._writer.drain()
+        except BaseException:
+            self.close()
+            raise
+
+    async def command(self, line: str) -> Tuple[int, str]:
+        await self._write(line.encode("utf-8") + CRLF)
+        return await self._read_reply()
+
+    async def ehlo(self, name: str = "localhost") -> Tuple[int, str]:
+        code, message = await self.command(f"EHLO {name}")
+        if code != 250:
+            raise smtplib.SMTPHeloError(code, message)
+
+        self.esmtp_features = {}
+        for line in message.split("\n")[1:]:
+            keyword, _, params = line.partition(" ")
+            self.esmtp_features[keyword.lower()] = params
+        return code, message
+
+    def has_extn(self, name: str) -> bool:
+        return name.lower() in self.esmtp_features
+
+    async def starttls(self, context: Optional[ssl.SSLContext] = None) -> None:
+        if not self.has_extn("starttls"):
+            raise smtplib.SMTPNotSupportedError("STARTTLS extension not supported by server.")
+
+        code, message = await self.command("STARTTLS")
+        if code != 220:
+            raise smtplib.SMTPResponseException(code, message)
+
+        context = context or ssl.create_default_context()
+        assert self._writer is not None
+        if sys.version_info >= (3, 11):
+            await self._writer.start_tls(context, server_hostname=self.host)
+        else:  # pragma: no cover
+            loop = asyncio.get_running_loop()
+            transport = self._writer.transport
+            new_transport = await loop.start_tls(
+                transport, transport.get_protocol(), context, server_hostname=self.host
+            )
+            self._writer._transport = new_transport  # type: ignore[attr-defined]
+
+        # the server forgets everything it told us before the TLS handshake
+        await self.ehlo()
+
+    async def login(self, user: str, password: str) -> None:
+        mechanisms = self.esmtp_features.get("auth", "").upper().split()
+
+        if "PLAIN" in mechanisms or not mechanisms:
+            token = base64.b64encode(f"\0{user}\0{password}".encode("utf-8")).decode("ascii")
+            code, message = await self.command(f"AUTH PLAIN {token}")
+        elif "LOGIN" in mechanisms:
+            code, message = await self.command("AUTH LOGIN")
+            if code == 334:
+                code, message = await self.command(base64.b64encode(user.encode("utf-8")).decode("ascii"))
+            if code == 334:
+                code, message = await self.command(base64.b64encode(password.encode("utf-8")).decode("ascii"))
+        else:
+            raise smtplib.SMTPException(f"No supported authentication method in {mechanisms}.")
+
+        if code != 235:
+            raise smtplib.SMTPAuthenticationError(code, message)
+
+    async def sendmail(self, from_addr: str, to_addrs: List[str], msg: bytes) -> Dict[str, Tuple[int, str]]:
+        code, message = await self.command(f"MAIL FROM:<{from_addr}>")
+        if code != 250:
+            await self.command("RSET")
+            raise smtplib.SMTPSenderRefused(code, message, from_addr)
+
+        refused: Dict[str, Tuple[int, str]] = {}
+        for addr in to_addrs:
+            code, message = await self.command(f"RCPT TO:<{addr}>")
+            if code not in (250, 251):
+                refused[addr] = (code, message)
+        if len(refused) == len(to_addrs):
+            await self.command("RSET")
+            raise smtplib.SMTPRecipientsRefused(refused)  # type: ignore[arg-type]
+
+        code, message = await self.command("DATA")
+        if code != 354:
+            await self.command("RSET")
+            raise smtplib.SMTPDataError(code, message)
+
+        await self._write(quote_data(msg) + b"." + CRLF)
+        code, message = await self._read_reply()
+        if code != 250:
+            await self.command("RSET")
+            raise smtplib.SMTPDataError(code, message)
+        return refused
+
+    async def quit(self) -> None:
+        try:
+            await self.command("QUIT")
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = None
+        self._writer = None
+
+
+class AsyncMailSender(MailSender):
+    """
+    asyncio counterpart of MailSender.
+    Up to `concurrency` SMTP sessions send at once; sessions are reused between recipients.
+    """
+
+    def __init__(
+        self,
+        sender_email: str,
+        password: str,
+        provider: str = "gmail",
+        concurrency: int = 10,
+        use_starttls: bool = True,
+        timeout: float = 30.0,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
+    ) -> None:
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1.")
+        super().__init__(sender_email, password, provider, use_starttls=use_starttls, rate_limiter=rate_limiter)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._idle: List[AsyncSMTPConnection] = []
+
+    async def _connect_async(self) -> AsyncSMTPConnection:
+        connection = AsyncSMTPConnection(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        await connection.connect()
+        try:
+            await connection.ehlo()
+            if self.use_starttls:
+                await connection.starttls()
+            await connection.login(self.sender_email, self.password)
+        except BaseException:
+            connection.close()
+            raise
+        self.logger.info(f"Connected to SMTP server {self.smtp_server} as {self.sender_email}")
+        return connection
+
+    async def _acquire(self) -> AsyncSMTPConnection:
+        # the semaphore caps how many sessions exist, so the idle list never overflows
+        while self._idle:
+            connection = self._idle.pop()
+            if connection.is_connected:
+                return connection
+        return await self._connect_async()
+
+    def _release(self, connection: AsyncSMTPConnection) -> None:
+        # connections close themselves when a command doesn't get its full
+        # reply, so only ones in a clean state go back to the pool
+        if connection.is_connected:
+            self._idle.append(connection)
+        else:
+            connection.close()
+
+    async def _close_idle(self) -> None:
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            try:
+                await connection.quit()
+            except Exception:
+                connection.close()
+
+    async def send_individual_mail(  # type: ignore[override]
+        self,
+        server: AsyncSMTPConnection,
+        to_email: str,
+        subject: Optional[str] = None,
+        text_content: Optional[str] = None,
+        html_content: Optional[str] = None,
+        attachment_paths: Optional[List[str]] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+    ) -> bool:
+        return await self._deliver(server, to_email, subject, text_content, html_content, attachment_paths, cc, bcc) is None
+
+    async def _deliver(  # type: ignore[override]
+        self,
+        server: AsyncSMTPConnection,
+        to_email: str,
+        subject: Optional[str] = None,
+        text_content: Optional[str] = None,
+        html_content: Optional[str] = None,
+        attachment_paths: Optional[List[str]] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+    ) -> Optional[str]:
+        self._validate_email(to_email)
+
+        if not text_content and not html_content:
+            self.logger.warning("Attempted to send an email with no content.")
+            raise ValueError("At least one content type must be provided.")
+
+        build = partial(
+            self.message_builder.build,
+            to_email=to_email,
+            subject=subject,
+            text_content=text_content,
+            html_content=html_content,
+            attachment_paths=attachment_paths,
+            cc=cc,
+            bcc=bcc)
+        with self.stats.timer("mime"):
+            # attachments may be read from disk, which would block the event loop
+            message = await asyncio.to_thread(build) if attachment_paths else build()
+
+        delay = self.rate_limiter.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            with self.stats.timer("sendmail"):
+                await server.sendmail(self.sender_email,
+                                      [to_email] + (cc or []) + (bcc or []),
+                                      message)
+            self.rate_limiter.on_success()
+            self.logger.info(f"Email sent to {to_email} successfully.")
+            return None
+        except Exception as e:
+            self.rate_limiter.refund()
+            self._on_send_error(e)
+            self.logger.error(f"Couldn't send email to {to_email}: {e}")
+            return failure_reply(e)
+
+    async def _send_row_async(
+        self,
+        semaphore: asyncio.Semaphore,
+        row: Dict[str, Any],
+        attachment_paths: Optional[List[str]] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+    ) -> Tuple[bool, Optional[str]]:
+        to_email = row.get("to_email")
+        if not to_email:
+            self.logger.error("Recipient email address is missing.")
+            return False, invalid_row_reply("Recipient email address is missing.")
+
+        async with semaphore:
+            connection = await self._acquire()
+            try:
+                reply = await self._deliver(
+                    server=connection,
+                    to_email=to_email,
+                    subject=row.get("subject"),
+                    text_content=row.get("text_content"),
+                    html_content=row.get("html_content"),
+                    attachment_paths=row.get("attachments", attachment_paths),
+                    cc=row.get("cc", cc),
+                    bcc=row.get("bcc", bcc)
+                )
+            except ValueError as e:
+                return False, invalid_row_reply(e)
+            finally:
+                self._release(connection)
+
+        if reply is not None:
+            self.logger.warning(f"Couldn't send email to {to_email}.")
+            return False, reply
+        return True, None
+
+    async def send_bulk_mail(  # type: ignore[override]
+        self,
+        recipients: Union[Iterable[Dict[str, Any]], AsyncIterable[Dict[str, Any]]],
+        session_manager: "SessionManager",
+        attachment_paths: Optional[List[str]] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+        show_preview: bool = True,
+        preview_timer: int = 5,
+        stats: Optional[SendStats] = None
+    ) -> SendStats:
+        self.stats = stats if stats is not None else SendStats()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        # keep a bounded number of tasks alive instead of one per recipient
+        max_pending = self.concurrency * 4
+        pending: Set["asyncio.Task[Tuple[bool, Optional[str]]]"] = set()
+        rows: Dict["asyncio.Task[Tuple[bool, Optional[str]]]", Dict[str, Any]] = {}
+
+        quota_error: Optional[QuotaExceededError] = None
+
+        def collect(done: Set["asyncio.Task[Tuple[bool, Optional[str]]]"]) -> None:
+            nonlocal quota_error
+            for task in done:
+                row = rows.pop(task)
+                if task.cancelled():
+                    continue
+                try:
+                    sent, reply = task.result()
+                except QuotaExceededError as e:
+                    # this row didn't go out, but rows still in flight may have
+                    quota_error = quota_error or e
+                    continue
+                except Exception as e:
+                    self.logger.error(f"Error during email sending: {e}")
+                    self.stats.count("failed")
+                    continue
+                self._record_result(session_manager, row, sent, reply, attachment_paths, cc, bcc)
+
+        try:
+            # log in once up front so bad credentials fail before anything is queued
+            self._release(await self._connect_async())
+
+            items = _aiter(recipients)
+            first = await _anext_or_none(items)
+            if show_preview and first:
+                self.preview_email(first, timer=preview_timer)
+                if preview_timer and preview_timer > 0:
+                    await asyncio.sleep(preview_timer)
+
+            async for row in _prepend(first, items):
+                if quota_error is not None:
+                    break
+                task = asyncio.ensure_future(self._send_row_async(semaphore, row, attachment_paths, cc, bcc))
+                rows[task] = row
+                pending.add(task)
+                if len(pending) >= max_pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    collect(done)
+
+            # tasks still waiting for a connection hit the quota before sending,
+            # so waiting for all of them records every row that did go out
+            if pending:
+                done, pending = await asyncio.wait(pending)
+                collect(done)
+
+            if quota_error is not None:
+                self.logger.error(f"{quota_error} Stopping here, the rest can be sent later.")
+
+        except asyncio.CancelledError:
+            self.logger.info("Email sending canceled.")
+            # rows that already went out are recorded before stopping, so a
+            # resume doesn't send them again; the rest are abandoned
+            collect({task for task in pending if task.done()})
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+            raise
+        except Exception as e:
+            self.logger.error(f"Error connecting to server: {e}")
+        finally:
+            self._end_campaign(session_manager)
+            await self._close_idle()
+            self.logger.info("SMTP connections closed.")
+        return self.stats
@@ -0,0 +1,84 @@
+import os
+import threading
+from collections import OrderedDict
+from email.mime.application import MIMEApplication
+from typing import Callable, Generic, NamedTuple, Tuple, TypeVar, Union
+
+# keyed by path, modification time and size, so an edited file is re-read
+CacheKey = Tuple[str, int, int]
+
+# an encoded part, either as an email object or already serialized
+Part = TypeVar("Part", bound=Union[MIMEApplication, bytes])
+
+
+def payload_size(part: Union[MIMEApplication, bytes]) -> int:
+    if isinstance(part, bytes):
+        return len(part)
+    return len(part.get_payload())
+
+class AttachmentCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    max_bytes: int
+    current_bytes: int
+    entries: int
+
+class AttachmentCache(Generic[Part]):
+    """
+    Campaign-scoped cache of encoded attachment parts.
+    A file shared by many recipients is read and base64-encoded once, and the
+    same part is attached to every message. Least recently used parts are
+    evicted once their encoded size passes `max_bytes`.
+    """
+
+    def __init__(self, encode: Callable[[str], Part], max_bytes: int = 64 * 1024 * 1024) -> None:
+        if max_bytes < 0:
+            raise ValueError("Cache size can't be negative.")
+        self.encode = encode
+        self.max_bytes = max_bytes
+        self._parts: "OrderedDict[CacheKey, Tuple[Part, int]]" = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, file_path: str) -> Part:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            # let encode() raise the real error, or read it if stat is unsupported
+            return self.encode(file_path)
+
+        key: CacheKey = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._parts.get(key)
+            if entry is not None:
+                self._parts.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        part = self.encode(file_path)
+        size = payload_size(part)
+        if size > self.max_bytes:
+            return part
+
+        with self._lock:
+            if key not in self._parts:
+                self._parts[key] = (part, size)
+                self._current_bytes += size
+            while self._current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._parts.popitem(last=False)
+                self._current_bytes -= evicted_size
+        return part
+
+    def cache_info(self) -> AttachmentCacheInfo:
+        with self._lock:
+            return AttachmentCacheInfo(self.hits, self.misses, self.max_bytes, self._current_bytes, len(self._parts))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._parts.clear()
+            self._current_bytes = 0
+            self.hits = 0
+            self.misses = 0
@@ -2,37 +2,224 @@ import smtplib
 import re
 import os
 import time
-import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
 import json
-from typing import Optional, Any, Dict, List, Tuple
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional, Any, Callable, Dict, Iterable, Iterator, List, Tuple, Union
 
-from smartmailer.session_management.session_manager import SessionManager
+from smartmailer.core.attachments import AttachmentCache
+from smartmailer.core.mime import MessageBuilder, serialize_part
+from smartmailer.core.outbox import Outbox
+from smartmailer.core.rate_limiter import AdaptiveRateLimiter, QuotaExceededError, smtp_reply_code
+from smartmailer.session_management.store import SessionStore
+from smartmailer.utils.iterables import batch_by_key, peek
+from smartmailer.utils.metrics import SendStats
 from smartmailer.utils.new_logger import Logger
-from smartmailer.utils.types import TemplateModelType
+
+if TYPE_CHECKING:
+    # only for annotations, the session brings in SQLAlchemy
+    from smartmailer.session_management.session_manager import SessionManager
+
+# what a failed row needs to be sent again later, without rendering it again
+RETRY_FIELDS = ("to_email", "subject", "text_content", "html_content", "attachments", "cc", "bcc")
+
+# a message sent to many recipients at once doesn't name any of them
+SHARED_TO_HEADER = "undisclosed-recipients:;"
+# how many distinct contents can wait for more recipients before being sent as they are
+FAN_OUT_WINDOW = 256
+
+
+def format_reply(code: int, message: Union[str, bytes]) -> str:
+    # keep the SMTP code in front, so a stored reply reads like the server's own
+    if isinstance(message, bytes):
+        message = message.decode("utf-8", "replace")
+    return f"{code} {message}"
+
+
+def failure_reply(error: Exception) -> str:
+    if isinstance(error, smtplib.SMTPRecipientsRefused) and error.recipients:
+        return format_reply(*next(iter(error.recipients.values())))
+    elif isinstance(error, smtplib.SMTPResponseException):
+        return format_reply(error.smtp_code, error.smtp_error)
+    return str(error) or type(error).__name__
+
+
+def is_permanent_failure(reply: str) -> bool:
+    # 5xx replies won't change on a retry, 4xx and connection errors might
+    return reply[:3].isdigit() and reply.startswith("5")
+
+
+def invalid_row_reply(reason: Union[str, Exception]) -> str:
+    # a row with a bad address or no content fails the same way on every
+    # retry, so it's recorded with a 5xx like a server's permanent rejection
+    return format_reply(550, str(reason))
+
+
+def _settings_path() -> str:
+    return os.path.join(os.path.dirname(__file__), "settings.json")
+
+
+@lru_cache(maxsize=None)
+def load_settings(path: str) -> Dict[str, Any]:
+    """
+    The provider settings in `path`, read once per process.
+    Call load_settings.cache_clear() to pick up changes to the file.
+    """
+    with open(path, 'r') as f:
+        settings: Dict[str, Any] = json.load(f)
+    return settings
+
+class SMTPConnectionPool:
+    """
+    Fixed-size pool of logged-in SMTP connections.
+    Connections are opened lazily through `factory` and reused until the pool is closed.
+    """
+
+    def __init__(self, factory: Callable[[], smtplib.SMTP], size: int = 1) -> None:
+        if size < 1:
+            raise ValueError("Pool size must be at least 1.")
+        self.factory = factory
+        self.size = size
+        self._idle: List[smtplib.SMTP] = []
+        self._opened = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> smtplib.SMTP:
+        with self._cond:
+            while not self._idle and self._opened >= self.size:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._opened += 1
+
+        try:
+            return self.factory()
+        except BaseException:
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, server: smtplib.SMTP, discard: bool = False) -> None:
+        with self._cond:
+            if discard:
+                self._opened -= 1
+            else:
+                self._idle.append(server)
+            self._cond.notify()
+
+        if discard:
+            self._quit(server)
+
+    @contextmanager
+    def connection(self) -> Iterator[smtplib.SMTP]:
+        server = self.acquire()
+        try:
+            yield server
+        except smtplib.SMTPServerDisconnected:
+            self.release(server, discard=True)
+            raise
+        except BaseException:
+            self.release(server)
+            raise
+        else:
+            self.release(server)
+
+    def close(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+            self._cond.notify_all()
+
+        for server in idle:
+            self._quit(server)
+
+    @staticmethod
+    def _quit(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
 
 class MailSender:
-    def __init__(self, sender_email: str, password: str, provider: str = "gmail") -> None:
+    def __init__(
+        self,
+        sender_email: str,
+        password: str,
+        provider: str = "gmail",
+        pool_size: int = 1,
+        use_starttls: bool = True,
+        attachment_cache_bytes: int = 64 * 1024 * 1024,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
+    ) -> None:
         self.logger = Logger()
         
         self._validate_email(sender_email)
         self.sender_email = sender_email
         self.password = password
-        self.smtp_server, self.smtp_port = self._get_settings(provider)
+        self.provider = provider
+        provider_settings = self._get_provider_settings(provider)
+        self.smtp_server, self.smtp_port = provider_settings["host"], provider_settings["port"]
+        # paces sends to the provider's rate and daily quota unless a limiter is passed in
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter.from_settings(provider_settings)
+        self.use_starttls = use_starttls
+        self.pool_size = pool_size
+        self.pool = SMTPConnectionPool(self._connect, pool_size)
+        # shared attachments are encoded and serialized once per campaign, and dropped
+        # when it ends. Messages are sent as bytes from the builder, which takes them from here
+        self.serialized_attachment_cache: AttachmentCache[bytes] = AttachmentCache(
+            self._serialize_attachment, attachment_cache_bytes
+        )
+        self.message_builder = MessageBuilder(sender_email, self.serialized_attachment_cache.get)
+        # replaced at the start of every send_bulk_mail
+        self.stats = SendStats()
 
         self.logger.info(f"MailSender initialized for {sender_email} using {provider} provider.")
 
-    def _get_settings(self, provider: str) -> Tuple[str, int]:
-        settings_path = os.path.join(os.path.dirname(__file__), "settings.json")
-        with open(settings_path, 'r') as f:
-            settings: Dict[str, List[Any]] = json.load(f)
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        try:
+            if self.use_starttls:
+                server.starttls()
+            server.login(self.sender_email, self.password)
+        except BaseException:
+            server.close()
+            raise
+        self.logger.info(f"Connected to SMTP server {self.smtp_server} as {self.sender_email}")
+        return server
+
+    def _get_provider_settings(self, provider: str) -> Dict[str, Any]:
+        settings = load_settings(_settings_path())
 
         if provider not in settings:
             self.logger.error(f"Provider '{provider}' not found in settings.")
             raise ValueError("Invalid provider.")
-        return tuple(settings[provider])  # type: ignore
+
+        entry = settings[provider]
+        if isinstance(entry, list):
+            # older settings files only list [host, port]
+            host, port = entry
+            return {"host": host, "port": port}
+        return dict(entry)
+
+    def _get_settings(self, provider: str) -> Tuple[str, int]:
+        entry = self._get_provider_settings(provider)
+        return entry["host"], entry["port"]
+
+    def _on_send_error(self, error: Exception) -> None:
+        if self.rate_limiter.on_reply(smtp_reply_code(error)):
+            rate = self.rate_limiter.per_minute
+            pace = f" to {rate:.0f} emails a minute" if rate else ""
+            self.logger.warning(f"{self.provider} is throttling sends, slowing down{pace}.")
 
     #check email format using regex
     def _is_valid_email(self, email: str) -> bool:
@@ -47,6 +234,18 @@ class MailSender:
             raise ValueError("Invalid email address format.")
         return True
     
+    def _encode_attachment(self, file_path: str) -> MIMEApplication:
+        with open(file_path, "rb") as f:
+            part = MIMEApplication(f.read(), Name=os.path.basename(file_path))
+        part['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_path)}"'
+        return part
+
+    def _serialize_attachment(self, file_path: str) -> bytes:
+        return serialize_part(self._encode_attachment(file_path))
+
+    def _clear_attachment_caches(self) -> None:
+        self.serialized_attachment_cache.clear()
+
     def prepare_message(
         self,
         to_email: str,
@@ -57,8 +256,11 @@ class MailSender:
         cc: Optional[List[str]] = None,
         bcc: Optional[List[str]] = None,
     ) -> MIMEMultipart:
-        
-        
+        """
+        The email as a MIMEMultipart. Sending uses MessageBuilder instead,
+        which writes the same message straight to bytes, so attachments
+        are read here every time rather than cached.
+        """
         msg = MIMEMultipart("mixed")
         msg["From"] = self.sender_email
         msg["To"] = to_email
@@ -83,10 +285,7 @@ class MailSender:
         if attachment_paths:
             for file_path in attachment_paths:
                 try:
-                    with open(file_path, "rb") as f:
-                        part = MIMEApplication(f.read(), Name=os.path.basename(file_path))
-                        part['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_path)}"'
-                        msg.attach(part)
+                    msg.attach(self._encode_attachment(file_path))
                 except Exception as e:
                     self.logger.warning(f"Couldn't attach file '{file_path}': {e}")
         return msg
@@ -103,31 +302,129 @@ class MailSender:
         cc: Optional[List[str]] = None,
         bcc: Optional[List[str]] = None,
     ) -> bool:
-        
+        return self._deliver(server, to_email, subject, text_content, html_content, attachment_paths, cc, bcc) is None
+
+    def _deliver(
+        self,
+        server: smtplib.SMTP,
+        to_email: str,
+        subject: Optional[str] = None,
+        text_content: Optional[str] = None,
+        html_content: Optional[str] = None,
+        attachment_paths: Optional[List[str]] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+    ) -> Optional[str]:
+        """
+        Does the work of send_individual_mail. Returns None once the email is sent,
+        or the server's reply (or the error) if it couldn't be.
+        """
         self._validate_email(to_email)
 
         if not text_content and not html_content:
             self.logger.warning("Attempted to send an email with no content.")
             raise ValueError("At least one content type must be provided.")
 
-        msg = self.prepare_message(
-            to_email=to_email,
-            subject=subject,
-            text_content=text_content,
-            html_content=html_content,
-            attachment_paths=attachment_paths,
-            cc=cc,
-            bcc=bcc)
+        with self.stats.timer("mime"):
+            message = self.message_builder.build(
+                to_email=to_email,
+                subject=subject,
+                text_content=text_content,
+                html_content=html_content,
+                attachment_paths=attachment_paths,
+                cc=cc,
+                bcc=bcc)
 
+        return self._transmit(server, self.sender_email, [to_email] + (cc or []) + (bcc or []), message)
+
+    def _transmit(self, server: smtplib.SMTP, sender: str, recipients: List[str], message: Union[str, bytes]) -> Optional[str]:
+        # raises QuotaExceededError once the daily quota is used up
+        self.rate_limiter.acquire()
         try:
-            server.sendmail(self.sender_email,
-                            [to_email] + (cc or []) + (bcc or []), 
-                            msg.as_string())
-            self.logger.info(f"Email sent to {to_email} successfully.")
-            return True
+            with self.stats.timer("sendmail"):
+                server.sendmail(sender, recipients, message)
+            self.rate_limiter.on_success()
+            self.logger.info(f"Email sent to {recipients[0]} successfully.")
+            return None
         except Exception as e:
-            self.logger.error(f"Couldn't send email to {to_email}: {e}")
-            return False
+            self.rate_limiter.refund()
+            self._on_send_error(e)
+            self.logger.error(f"Couldn't send email to {recipients[0]}: {e}")
+            return failure_reply(e)
+
+    @staticmethod
+    def _sendmail_pipelined(
+        server: smtplib.SMTP, sender: str, recipients: List[str], message: Union[str, bytes]
+    ) -> Dict[str, Tuple[int, bytes]]:
+        """
+        Like server.sendmail, but when the server supports PIPELINING (RFC 2920)
+        MAIL FROM and every RCPT TO go out in one write, and their replies are
+        read afterwards, instead of waiting for each in turn.
+        Returns the refused recipients, like sendmail.
+        """
+        server.ehlo_or_helo_if_needed()
+        if not server.has_extn("pipelining"):
+            return server.sendmail(sender, recipients, message)
+
+        commands = [f"MAIL FROM:{smtplib.quoteaddr(sender)}"]
+        commands += [f"RCPT TO:{smtplib.quoteaddr(recipient)}" for recipient in recipients]
+        server.send("".join(command + "\r\n" for command in commands))
+        # every command gets a reply, even after a refused MAIL FROM
+        code, response = server.getreply()
+        replies = [server.getreply() for _ in recipients]
+
+        if code != 250:
+            server.rset()
+            raise smtplib.SMTPSenderRefused(code, response, sender)
+        refused = {
+            recipient: reply for recipient, reply in zip(recipients, replies) if reply[0] not in (250, 251)
+        }
+        if len(refused) == len(recipients):
+            server.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        code, response = server.data(message)
+        if code != 250:
+            server.rset()
+            raise smtplib.SMTPDataError(code, response)
+        return refused
+
+    def _transmit_shared(
+        self, server: smtplib.SMTP, sender: str, recipients: List[str], message: Union[str, bytes]
+    ) -> Dict[str, str]:
+        """
+        Send one message to all of `recipients` in a single envelope.
+        Returns the failure reply for each recipient that didn't get it.
+        """
+        # the provider counts every recipient against the rate and the quota
+        reserved = 0
+        try:
+            for _ in recipients:
+                self.rate_limiter.acquire()
+                reserved += 1
+        except QuotaExceededError:
+            # nothing was sent, so none of them count
+            self.rate_limiter.refund(reserved)
+            raise
+        try:
+            with self.stats.timer("sendmail"):
+                refused = self._sendmail_pipelined(server, sender, recipients, message)
+            self.rate_limiter.on_success()
+            self.rate_limiter.refund(len(refused))
+        except smtplib.SMTPRecipientsRefused as e:
+            self.rate_limiter.refund(len(recipients))
+            self._on_send_error(e)
+            self.logger.error(f"All {len(recipients)} recipients were refused: {failure_reply(e)}")
+            return {recipient: format_reply(*reply) for recipient, reply in e.recipients.items()}
+        except Exception as e:
+            self.rate_limiter.refund(len(recipients))
+            self._on_send_error(e)
+            self.logger.error(f"Couldn't send email to {len(recipients)} recipients: {e}")
+            reply = failure_reply(e)
+            return {recipient: reply for recipient in recipients}
+
+        self.logger.info(f"Email sent to {len(recipients) - len(refused)} of {len(recipients)} recipients in one envelope.")
+        return {recipient: format_reply(*reply) for recipient, reply in refused.items()}
         
     def preview_email(self, example: Dict[str, Any], timer:int=5) -> None:
         print("\nPREVIEW:")
@@ -141,93 +438,458 @@ class MailSender:
         print(f"Sending will start in {timer} seconds...Press Ctrl+C to cancel.")
 
 
+    def _send_row(
+        self,
+        server: smtplib.SMTP,
+        row: Dict[str, Any],
+        attachment_paths: Optional[List[str]] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Returns whether the row was sent, and the failure reply if it wasn't.
+        """
+        to_email = row.get("to_email")
+        if not to_email:
+            self.logger.error("Recipient email address is missing.")
+            return False, invalid_row_reply("Recipient email address is missing.")
+
+        try:
+            reply = self._deliver(
+                    server=server,
+                    to_email=to_email,
+                    subject=row.get("subject"),
+                    text_content=row.get("text_content"),
+                    html_content=row.get("html_content"),
+                    attachment_paths=row.get("attachments", attachment_paths),
+                    cc=row.get("cc", cc),
+                    bcc=row.get("bcc", bcc)
+            )
+        except ValueError as e:
+            return False, invalid_row_reply(e)
+
+        if reply is not None:
+            self.logger.warning(f"Couldn't send email to {to_email}.")
+            return False, reply
+        return True, None
+
+    def _send_shared(
+        self,
+        server: smtplib.SMTP,
+        rows: List[Dict[str, Any]],
+        attachment_paths: Optional[List[str]] = None,
+    ) -> List[Tuple[bool, Optional[str]]]:
+        """
+        Send rows with identical content as one message, with one RCPT TO per row.
+        Returns (sent, reply) for each row, in order.
+        """
+        first = rows[0]
+        if not first.get("text_content") and not first.get("html_content"):
+            self.logger.warning("Attempted to send an email with no content.")
+            return [(False, invalid_row_reply("At least one content type must be provided."))] * len(rows)
+
+        replies: Dict[int, str] = {}
+        addresses: List[str] = []
+        for i, row in enumerate(rows):
+            if self._is_valid_email(row["to_email"]):
+                addresses.append(row["to_email"])
+            else:
+                self.logger.error(f"Invalid email address: {row['to_email']}")
+                replies[i] = invalid_row_reply("Invalid email address format.")
+
+        if addresses:
+            with self.stats.timer("mime"):
+                message = self.message_builder.build(
+                    to_email=SHARED_TO_HEADER,
+                    subject=first.get("subject"),
+                    text_content=first.get("text_content"),
+                    html_content=first.get("html_content"),
+                    attachment_paths=first.get("attachments", attachment_paths))
+            failures = self._transmit_shared(server, self.sender_email, addresses, message)
+            for i, row in enumerate(rows):
+                if i not in replies and row["to_email"] in failures:
+                    replies[i] = failures[row["to_email"]]
+
+        return [(i not in replies, replies.get(i)) for i in range(len(rows))]
+
+    def _send_batch(
+        self,
+        server: smtplib.SMTP,
+        batch: List[Dict[str, Any]],
+        attachment_paths: Optional[List[str]] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+    ) -> List[Tuple[bool, Optional[str]]]:
+        if len(batch) == 1:
+            return [self._send_row(server, batch[0], attachment_paths, cc, bcc)]
+        return self._send_shared(server, batch, attachment_paths)
+
+    def _send_batch_pooled(
+        self,
+        batch: List[Dict[str, Any]],
+        attachment_paths: Optional[List[str]] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+    ) -> List[Tuple[bool, Optional[str]]]:
+        server = self.pool.acquire()
+        try:
+            results = self._send_batch(server, batch, attachment_paths, cc, bcc)
+        except smtplib.SMTPServerDisconnected:
+            self.pool.release(server, discard=True)
+            raise
+        except BaseException:
+            self.pool.release(server)
+            raise
+
+        # a dropped connection would fail every later send on it, so probe it
+        # and let the pool replace it if it's gone. The results stand either way
+        broken = not all(sent for sent, _ in results) and not self._is_alive(server)
+        self.pool.release(server, discard=broken)
+        return results
+
+    def _is_alive(self, server: smtplib.SMTP) -> bool:
+        try:
+            server.noop()
+        except Exception as e:
+            self.logger.warning(f"Connection lost after a failed send, replacing it: {e}")
+            return False
+        return True
+
+    def _batches(
+        self,
+        recipients: Iterable[Dict[str, Any]],
+        attachment_paths: Optional[List[str]] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+        fan_out: Optional[int] = None,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        The rows to send together. With `fan_out`, rows whose rendered content
+        is identical are gathered, up to `fan_out` per envelope; otherwise
+        every row is sent on its own.
+        """
+        if not fan_out or fan_out < 2:
+            return ([row] for row in recipients)
+
+        def content(row: Dict[str, Any]) -> Optional[Tuple[Any, ...]]:
+            # cc and bcc copies would go out once per envelope, so those rows aren't shared
+            if not row.get("to_email") or row.get("cc", cc) or row.get("bcc", bcc):
+                return None
+            attachments = row.get("attachments", attachment_paths) or []
+            return (row.get("subject"), row.get("text_content"), row.get("html_content"), tuple(attachments))
+
+        return batch_by_key(recipients, content, fan_out, FAN_OUT_WINDOW)
+
+    def _record_result(
+        self,
+        session_manager: "SessionManager",
+        row: Dict[str, Any],
+        sent: bool,
+        reply: Optional[str],
+        attachment_paths: Optional[List[str]] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+    ) -> None:
+        self.stats.count("sent" if sent else "failed")
+        if not session_manager or 'object' not in row:
+            return
+        if sent:
+            with self.stats.timer("db_insert"):
+                session_manager.add_recipient(row['object'])
+            return
+
+        defaults = {"attachments": attachment_paths, "cc": cc, "bcc": bcc}
+        payload = {field: row.get(field, defaults.get(field)) for field in RETRY_FIELDS}
+        try:
+            session_manager.record_failure(
+                row['object'], payload, reply or "", retryable=not is_permanent_failure(reply or "")
+            )
+        except Exception as e:
+            self.logger.error(f"Couldn't save the failure for {row.get('to_email')}: {e}")
+
+    def _end_campaign(self, session_manager: "SessionManager") -> None:
+        self._clear_attachment_caches()
+        if session_manager:
+            try:
+                # buffered inserts land here, so they count towards db_insert too
+                with self.stats.timer("db_insert"):
+                    session_manager.flush()
+            except Exception as e:
+                self.logger.error(f"Couldn't save sent recipients to the session: {e}")
+        self.stats.finish()
+
     def send_bulk_mail(
         self,
-        recipients: List[Dict[str, Any]],
-        session_manager: SessionManager,
+        recipients: Iterable[Dict[str, Any]],
+        session_manager: "SessionManager",
         attachment_paths: Optional[List[str]] = None,
         cc: Optional[List[str]] = None,
         bcc: Optional[List[str]] = None,
         show_preview: bool = True,
-        preview_timer: int = 5
-    ) -> None:
+        preview_timer: int = 5,
+        stats: Optional[SendStats] = None,
+        fan_out: Optional[int] = None
+    ) -> SendStats:
+        """
+        Send every row in `recipients`, recording each in the session.
+        With `fan_out`, rows with identical content share one message and
+        envelope, up to `fan_out` recipients each.
+        Returns the campaign's SendStats, recorded into `stats` if it's given.
+        """
+        self.stats = stats if stats is not None else SendStats()
+        if self.pool_size > 1:
+            return self._send_bulk_pooled(
+                recipients, session_manager, attachment_paths, cc, bcc, show_preview, preview_timer, fan_out
+            )
+
         server = None
-        server_closed = False
         try:
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.sender_email, self.password)
-            self.logger.info(f"Connected to SMTP server {self.smtp_server} as {self.sender_email}")
+            server = self._connect()
+            first, recipients = peek(recipients)
         
-            if show_preview and recipients:
-                first = recipients[0]
+            if show_preview and first:
                 self.preview_email(first, timer= preview_timer)
                 if preview_timer and preview_timer > 0:
-                    try:
-                        time.sleep(preview_timer)
-                    except KeyboardInterrupt:
-                        self.logger.info("Email sending canceled by user.")
-                        if server and not server_closed:
-                            server.quit()
-                            self.logger.info("SMTP server connection closed.")
-                            server_closed = True
-                        sys.exit(0)
+                    time.sleep(preview_timer)
 
-            for row in recipients:
+            for batch in self._batches(recipients, attachment_paths, cc, bcc, fan_out):
                     try:
-                        object: TemplateModelType = row['object'] # type: ignore
-                        to_email = row.get("to_email")
-                        subject = row.get("subject")
-                        text = row.get("text_content")
-                        html = row.get("html_content")
-                        r_attachment_paths = row.get("attachments", attachment_paths)
-                        r_cc = row.get("cc", cc)
-                        r_bcc = row.get("bcc", bcc)
-
-                        if not to_email:
-                            self.logger.error("Recipient email address is missing.")
-                            continue
-
-                    
-                        sent = self.send_individual_mail(
-                                server=server,
-                                to_email=to_email,
-                                subject=subject,
-                                text_content=text,
-                                html_content=html,
-                                attachment_paths=r_attachment_paths,
-                                cc=r_cc,
-                                bcc=r_bcc
-                        )
-
-                        if sent and session_manager:
-                            session_manager.add_recipient(object)
-
-                        if not sent:
-                            self.logger.warning(f"Couldn't send email to {to_email}.")
-
-                    except KeyboardInterrupt:
-                        self.logger.info("Email sending canceled by user.")
-                        if server and not server_closed:
-                            server.quit()
-                            self.logger.info("SMTP server connection closed.")
-                            server_closed = True
-                        sys.exit(0)
+                        results = self._send_batch(server, batch, attachment_paths, cc, bcc)
+                        for row, (sent, reply) in zip(batch, results):
+                            self._record_result(session_manager, row, sent, reply, attachment_paths, cc, bcc)
+
+                    except QuotaExceededError as e:
+                        self.logger.error(f"{e} Stopping here, the rest can be sent later.")
+                        break
 
                     except Exception as e:
                         self.logger.error(f"Error during email sending: {e}")
+                        self.stats.count("failed", len(batch))
                         continue
 
         except KeyboardInterrupt:
+            # like the pooled path: stop, and return what was sent so far
             self.logger.info("Email sending canceled by user.")
         except Exception as e:
             self.logger.error(f"Error connecting to server: {e}")
         finally:
-            if server and not server_closed:
+            self._end_campaign(session_manager)
+            if server:
                 try:
                     server.quit()
                     self.logger.info("SMTP server connection closed.")
                 except Exception as e:
                     self.logger.error(f"Error closing SMTP server connection: {e}")
-                finally:
-                    sys.exit(0)
+        return self.stats
+
+    def _send_bulk_pooled(
+        self,
+        recipients: Iterable[Dict[str, Any]],
+        session_manager: "SessionManager",
+        attachment_paths: Optional[List[str]] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+        show_preview: bool = True,
+        preview_timer: int = 5,
+        fan_out: Optional[int] = None
+    ) -> SendStats:
+        """
+        Spread the recipients across `pool_size` worker threads, each sending
+        over a pooled connection. Session bookkeeping stays on the calling thread.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="smartmailer-send")
+        pending: Dict["Future[List[Tuple[bool, Optional[str]]]]", List[Dict[str, Any]]] = {}
+        quota_error: Optional[QuotaExceededError] = None
+
+        def collect(done: Iterable["Future[List[Tuple[bool, Optional[str]]]]"]) -> None:
+            nonlocal quota_error
+            for future in done:
+                batch = pending.pop(future)
+                if future.cancelled():
+                    continue
+                try:
+                    results = future.result()
+                except QuotaExceededError as e:
+                    # nothing in this batch went out, but other batches may have
+                    quota_error = quota_error or e
+                    continue
+                except Exception as e:
+                    self.logger.error(f"Error during email sending: {e}")
+                    self.stats.count("failed", len(batch))
+                    continue
+
+                for row, (sent, reply) in zip(batch, results):
+                    self._record_result(session_manager, row, sent, reply, attachment_paths, cc, bcc)
+
+        try:
+            # log in once up front so bad credentials fail before the preview
+            self.pool.release(self.pool.acquire())
+
+            first, recipients = peek(recipients)
+            if show_preview and first:
+                self.preview_email(first, timer=preview_timer)
+                if preview_timer and preview_timer > 0:
+                    time.sleep(preview_timer)
+
+            # only a few batches per worker are in flight, so a streamed
+            # recipient list is never pulled into memory all at once
+            max_pending = self.pool_size * 4
+            for batch in self._batches(recipients, attachment_paths, cc, bcc, fan_out):
+                if quota_error is not None:
+                    break
+                future = executor.submit(self._send_batch_pooled, batch, attachment_paths, cc, bcc)
+                pending[future] = batch
+                if len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+
+            if quota_error is not None:
+                # batches that haven't started stay unsent, the running ones are waited for below
+                for future in list(pending):
+                    future.cancel()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            if quota_error is not None:
+                self.logger.error(f"{quota_error} Stopping here, the rest can be sent later.")
+
+        except KeyboardInterrupt:
+            self.logger.info("Email sending canceled by user.")
+        except Exception as e:
+            self.logger.error(f"Error connecting to server: {e}")
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            # whatever finished before stopping was delivered, or not, and is recorded either way
+            try:
+                collect(list(pending))
+            except Exception as e:
+                self.logger.error(f"Couldn't record the last results: {e}")
+            self._end_campaign(session_manager)
+            self.pool.close()
+            self.logger.info("SMTP connection pool closed.")
+        return self.stats
+
+    def spool_bulk_mail(
+        self,
+        recipients: Iterable[Dict[str, Any]],
+        outbox: Outbox,
+        attachment_paths: Optional[List[str]] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+    ) -> int:
+        """
+        Build every message and write it to `outbox` instead of sending it.
+        Returns how many were spooled.
+        """
+        spooled = 0
+        try:
+            for row in recipients:
+                to_email = row.get("to_email")
+                if not to_email:
+                    self.logger.error("Recipient email address is missing.")
+                    continue
+                try:
+                    self._validate_email(to_email)
+                    if not row.get("text_content") and not row.get("html_content"):
+                        raise ValueError("At least one content type must be provided.")
+                    row_cc = row.get("cc", cc) or []
+                    row_bcc = row.get("bcc", bcc) or []
+                    message = self.message_builder.build(
+                        to_email=to_email,
+                        subject=row.get("subject"),
+                        text_content=row.get("text_content"),
+                        html_content=row.get("html_content"),
+                        attachment_paths=row.get("attachments", attachment_paths),
+                        cc=row_cc,
+                        bcc=row_bcc)
+                    if outbox.put(row['object'].hash_string, self.sender_email, [to_email] + row_cc + row_bcc, message):
+                        spooled += 1
+                except Exception as e:
+                    self.logger.error(f"Couldn't spool email to {to_email}: {e}")
+        finally:
+            self._clear_attachment_caches()
+        return spooled
+
+    def send_spooled(
+        self,
+        outbox: Outbox,
+        session_manager: "SessionManager",
+        follow: bool = False,
+        poll_interval: float = 1.0,
+    ) -> int:
+        """
+        Deliver the messages waiting in `outbox`, marking each as sent in the
+        session and removing it once the server accepts it. With `follow`,
+        keep watching the outbox for new messages until interrupted; messages
+        that fail for now are retried on the same schedule as retry_failed.
+        Returns how many were delivered.
+        """
+        delivered = 0
+        server: Optional[smtplib.SMTP] = None
+        # name -> (failed attempts, when the next one is due)
+        backoff: Dict[str, Tuple[int, float]] = {}
+        self.stats = SendStats()
+        outbox.recover()
+        try:
+            while True:
+                for name in outbox.pending():
+                    if name in backoff and backoff[name][1] > time.monotonic():
+                        continue
+                    entry = outbox.claim(name)
+                    if entry is None:
+                        continue
+                    if session_manager and entry.recipient_hash in session_manager.get_sent_hashes([entry.recipient_hash]):
+                        # sent by an earlier run that stopped before removing it
+                        self.logger.info(f"{entry.recipients[0]} was already sent, removing it from the outbox.")
+                        outbox.ack(entry)
+                        self.stats.count("skipped")
+                        continue
+
+                    try:
+                        if server is None:
+                            server = self._connect()
+                        reply = self._transmit(server, entry.sender, entry.recipients, entry.message)
+                    except BaseException:
+                        outbox.release(entry)
+                        raise
+
+                    if reply is None:
+                        if session_manager:
+                            with self.stats.timer("db_insert"):
+                                session_manager.add_recipient_hash(entry.recipient_hash)
+                        outbox.ack(entry)
+                        backoff.pop(name, None)
+                        self.stats.count("sent")
+                        delivered += 1
+                    elif is_permanent_failure(reply):
+                        self.stats.count("failed")
+                        self.logger.error(f"{entry.recipients[0]} was rejected, moved to {outbox.failed_dir}: {reply}")
+                        outbox.reject(entry)
+                        backoff.pop(name, None)
+                    else:
+                        # leave it for a later pass, on a fresh connection
+                        # in case this one is what failed
+                        outbox.release(entry)
+                        SMTPConnectionPool._quit(server)
+                        server = None
+                        attempts = backoff.get(name, (0, 0.0))[0] + 1
+                        delay = SessionStore.retry_delay(attempts).total_seconds()
+                        backoff[name] = (attempts, time.monotonic() + delay)
+
+                if not follow:
+                    break
+                time.sleep(poll_interval)
+
+        except KeyboardInterrupt:
+            self.logger.info("Email sending canceled by user.")
+        except QuotaExceededError as e:
+            self.logger.error(f"{e} Stopping here, the rest stay in the outbox.")
+        except Exception as e:
+            self.logger.error(f"Error connecting to server: {e}")
+        finally:
+            self._end_campaign(session_manager)
+            if server is not None:
+                SMTPConnectionPool._quit(server)
+                self.logger.info("SMTP server connection closed.")
+        return delivered
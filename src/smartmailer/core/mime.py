@@ -0,0 +1,143 @@
+import base64
+import random
+import re
+import sys
+from email.charset import Charset
+from email.generator import BytesGenerator
+from email.message import Message
+from email.policy import compat32
+from io import BytesIO
+from typing import Callable, List, Optional
+
+from smartmailer.utils.new_logger import Logger
+
+CRLF = "\r\n"
+# how Message.as_string() writes headers: encoded words where needed, never folded
+HEADER_POLICY = compat32.clone(linesep=CRLF, max_line_length=0)
+_EOL_PATTERN = re.compile(r"\r\n|\r|\n")
+_UTF8 = Charset("utf-8")
+
+# the headers of every text part, by subtype and whether the text is plain ASCII
+_TEXT_HEADERS = {
+    (subtype, ascii_only): (
+        f'Content-Type: text/{subtype}; charset="{"us-ascii" if ascii_only else "utf-8"}"{CRLF}'
+        f"MIME-Version: 1.0{CRLF}"
+        f"Content-Transfer-Encoding: {'7bit' if ascii_only else 'base64'}{CRLF}{CRLF}"
+    ).encode("ascii")
+    for subtype in ("plain", "html")
+    for ascii_only in (True, False)
+}
+
+
+def serialize_part(part: Message) -> bytes:
+    """
+    A MIME part as it appears inside a message, with CRLF line endings.
+    """
+    fp = BytesIO()
+    BytesGenerator(fp, mangle_from_=False, policy=HEADER_POLICY).flatten(part)
+    return fp.getvalue()
+
+
+def fold_header(name: str, value: str) -> str:
+    """
+    The header line HEADER_POLICY.fold would write, without its overhead in the common cases.
+    """
+    if "\n" in value or "\r" in value:
+        return HEADER_POLICY.fold(name, value)
+    if value.isascii():
+        return f"{name}: {value}{CRLF}"
+    try:
+        # one encoded word, whichever of base64 and quoted-printable is shorter
+        return f"{name}: {_UTF8.header_encode(value)}{CRLF}"
+    except UnicodeEncodeError:
+        # lone surrogates, the policy knows what to do with them
+        return HEADER_POLICY.fold(name, value)
+
+
+class MessageBuilder:
+    """
+    Writes RFC 5322 messages straight to bytes.
+
+    The output is the same as MailSender.prepare_message(...).as_string()
+    with CRLF line endings, which is what smtplib sends, but it skips the
+    email.mime object tree and the generator. Part headers are fixed strings,
+    the From header is folded once, and attachments come from `attachment`
+    already serialized, so a file shared by the whole campaign is encoded once.
+    """
+
+    def __init__(self, sender_email: str, attachment: Callable[[str], bytes]) -> None:
+        self.logger = Logger()
+        self.attachment = attachment
+        self._from_header = fold_header("From", sender_email).encode("ascii")
+
+    @staticmethod
+    def _new_boundary() -> str:
+        # same shape as the boundaries email.generator makes
+        return f"{'=' * 15}{random.randrange(sys.maxsize):019d}=="
+
+    @staticmethod
+    def _text_part(subtype: str, text: str) -> bytes:
+        if text.isascii():
+            if "\r" in text:
+                text = _EOL_PATTERN.sub(CRLF, text)
+            else:
+                text = text.replace("\n", CRLF)
+            return _TEXT_HEADERS[(subtype, True)] + text.encode("ascii")
+        body = base64.encodebytes(text.encode("utf-8")).replace(b"\n", b"\r\n")
+        return _TEXT_HEADERS[(subtype, False)] + body
+
+    def _multipart(self, subtype: str, parts: List[bytes], headers: bytes = b"") -> bytes:
+        boundary = self._new_boundary()
+        delimiter = f"--{boundary}".encode("ascii")
+        # a plain-text part could contain the boundary, so pick another, like email does
+        while any(delimiter in part for part in parts):
+            boundary = self._new_boundary()
+            delimiter = f"--{boundary}".encode("ascii")
+
+        out = [
+            f'Content-Type: multipart/{subtype}; boundary="{boundary}"{CRLF}MIME-Version: 1.0{CRLF}'.encode("ascii"),
+            headers,
+            b"\r\n",
+        ]
+        for i, part in enumerate(parts):
+            out.append(delimiter + b"\r\n" if i == 0 else b"\r\n" + delimiter + b"\r\n")
+            out.append(part)
+        out.append(b"\r\n" + delimiter + b"--\r\n")
+        return b"".join(out)
+
+    def build(
+        self,
+        to_email: str,
+        subject: Optional[str] = None,
+        text_content: Optional[str] = None,
+        html_content: Optional[str] = None,
+        attachment_paths: Optional[List[str]] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+    ) -> bytes:
+        parts: List[bytes] = []
+        if text_content and html_content:
+            parts.append(self._multipart("alternative", [
+                self._text_part("plain", text_content),
+                self._text_part("html", html_content),
+            ]))
+        elif text_content:
+            parts.append(self._text_part("plain", text_content))
+        elif html_content:
+            parts.append(self._text_part("html", html_content))
+
+        for file_path in attachment_paths or []:
+            try:
+                parts.append(self.attachment(file_path))
+            except Exception as e:
+                self.logger.warning(f"Couldn't attach file '{file_path}': {e}")
+
+        headers = [fold_header("To", to_email)]
+        if subject:
+            headers.append(fold_header("Subject", subject))
+        if cc:
+            headers.append(fold_header("Cc", ", ".join(cc)))
+        if bcc:
+            headers.append(fold_header("Bcc", ", ".join(bcc)))
+
+        return self._multipart("mixed", parts, self._from_header + "".join(headers).encode("ascii"))
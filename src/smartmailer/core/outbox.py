@@ -0,0 +1,142 @@
+import json
+import os
+import time
+import uuid
+from typing import Iterator, List, NamedTuple, Optional
+
+from smartmailer.utils.new_logger import Logger
+
+
+class OutboxEntry(NamedTuple):
+    name: str
+    recipient_hash: str
+    sender: str
+    recipients: List[str]
+    message: bytes
+
+
+class Outbox:
+    """
+    Maildir-style spool of fully built messages waiting to be delivered.
+
+    Messages are written to tmp/ and renamed into new/ once complete, so a
+    crash never leaves half a message behind. A sender claims a message by
+    renaming it into cur/, and deletes it once delivered. Renames are atomic,
+    so several processes (or hosts sharing the folder) can deliver from the
+    same outbox without sending anything twice.
+
+    Each file is one line of JSON with the envelope, followed by the raw
+    RFC 5322 message. Files are named after the recipient's hash, so spooling
+    the same recipient twice is a no-op, as is spooling one that was rejected.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.logger = Logger()
+        self.path = path
+        self.tmp_dir = os.path.join(path, "tmp")
+        self.new_dir = os.path.join(path, "new")
+        self.cur_dir = os.path.join(path, "cur")
+        self.failed_dir = os.path.join(path, "failed")
+        for folder in (self.tmp_dir, self.new_dir, self.cur_dir, self.failed_dir):
+            os.makedirs(folder, exist_ok=True)
+
+    def __contains__(self, recipient_hash: str) -> bool:
+        # rejected messages count too, or the next spool would queue them again
+        return any(
+            os.path.exists(os.path.join(folder, recipient_hash))
+            for folder in (self.new_dir, self.cur_dir, self.failed_dir)
+        )
+
+    def __len__(self) -> int:
+        return len(os.listdir(self.new_dir)) + len(os.listdir(self.cur_dir))
+
+    def put(self, recipient_hash: str, sender: str, recipients: List[str], message: bytes) -> bool:
+        """
+        Spool a message. Returns False if one for this recipient is already
+        waiting, or was rejected.
+        """
+        if recipient_hash in self:
+            return False
+
+        envelope = json.dumps({"hash": recipient_hash, "from": sender, "to": recipients})
+        tmp_path = os.path.join(self.tmp_dir, f"{recipient_hash}.{uuid.uuid4().hex}")
+        with open(tmp_path, "wb") as f:
+            f.write(envelope.encode("utf-8") + b"\n")
+            f.write(message)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.new_dir, recipient_hash))
+        return True
+
+    def pending(self) -> List[str]:
+        """
+        Names of the messages waiting in new/, oldest first.
+        """
+        names = os.listdir(self.new_dir)
+        def written_at(name: str) -> float:
+            try:
+                return os.stat(os.path.join(self.new_dir, name)).st_mtime
+            except OSError:
+                return 0.0
+        return sorted(names, key=written_at)
+
+    def claim(self, name: str) -> Optional[OutboxEntry]:
+        """
+        Take a message for delivery, or None if another sender got to it first.
+        """
+        claimed = os.path.join(self.cur_dir, name)
+        try:
+            os.rename(os.path.join(self.new_dir, name), claimed)
+        except FileNotFoundError:
+            return None
+        # the claim's age is measured from now, see recover()
+        os.utime(claimed)
+
+        with open(claimed, "rb") as f:
+            header = f.readline()
+            message = f.read()
+        envelope = json.loads(header)
+        return OutboxEntry(name, envelope["hash"], envelope["from"], envelope["to"], message)
+
+    def __iter__(self) -> Iterator[OutboxEntry]:
+        for name in self.pending():
+            entry = self.claim(name)
+            if entry is not None:
+                yield entry
+
+    def ack(self, entry: OutboxEntry) -> None:
+        try:
+            os.remove(os.path.join(self.cur_dir, entry.name))
+        except FileNotFoundError:
+            pass
+
+    def release(self, entry: OutboxEntry) -> None:
+        """
+        Put a claimed message back, to be tried again later.
+        """
+        os.replace(os.path.join(self.cur_dir, entry.name), os.path.join(self.new_dir, entry.name))
+
+    def reject(self, entry: OutboxEntry) -> None:
+        """
+        Set a message that can never be delivered aside in failed/.
+        """
+        os.replace(os.path.join(self.cur_dir, entry.name), os.path.join(self.failed_dir, entry.name))
+
+    def recover(self, older_than: float = 15 * 60) -> int:
+        """
+        Put back messages claimed more than `older_than` seconds ago by a
+        sender that never finished with them, most likely because it crashed.
+        """
+        recovered = 0
+        cutoff = time.time() - older_than
+        for name in os.listdir(self.cur_dir):
+            path = os.path.join(self.cur_dir, name)
+            try:
+                if os.stat(path).st_mtime <= cutoff:
+                    os.replace(path, os.path.join(self.new_dir, name))
+                    recovered += 1
+            except FileNotFoundError:
+                continue
+        if recovered:
+            self.logger.info(f"Recovered {recovered} abandoned messages in {self.path}.")
+        return recovered
@@ -0,0 +1,185 @@
+import smtplib
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+# replies providers use to say "slow down": service not available (421),
+# local error in processing (451) and temporary authentication failure (454)
+THROTTLE_CODES = {421, 451, 454}
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class QuotaExceededError(RuntimeError):
+    """Raised when sending another email would go over the provider's daily quota."""
+
+
+def smtp_reply_code(error: BaseException) -> Optional[int]:
+    """
+    Returns the SMTP reply code carried by an smtplib exception, if any.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return codes[0] if codes else None
+    code = getattr(error, "smtp_code", None)
+    return code if isinstance(code, int) else None
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at `rate` tokens per second, holding at most `capacity`.
+    reserve() never blocks: it takes a token and tells the caller how long to wait for it.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic) -> None:
+        if rate <= 0 or capacity < 1:
+            raise ValueError("Rate must be positive and capacity at least 1.")
+        self._rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill()
+            self._rate = rate
+
+    def reserve(self, tokens: float = 1) -> float:
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self._rate
+
+
+class AdaptiveRateLimiter:
+    """
+    Paces sending to a provider's limits.
+
+    Sends are spaced by a token bucket that starts at `max_per_minute`. When the
+    provider answers with a throttling reply, the rate is cut by `backoff_factor`
+    (down to `min_per_minute`) and sending pauses for `cooldown` seconds. Every
+    `recovery_after` successful sends, the rate creeps back up by 10% of the
+    maximum, so the campaign settles at the highest rate the provider accepts.
+
+    `daily_quota` caps the number of emails the server accepts in any 24 hour
+    window of this process. Either limit can be None to turn it off.
+    """
+
+    def __init__(
+        self,
+        max_per_minute: Optional[float] = None,
+        daily_quota: Optional[int] = None,
+        min_per_minute: float = 1.0,
+        backoff_factor: float = 0.5,
+        cooldown: float = 30.0,
+        recovery_after: int = 50,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.max_per_minute = max_per_minute
+        self.min_per_minute = min(min_per_minute, max_per_minute) if max_per_minute else min_per_minute
+        self.daily_quota = daily_quota
+        self.backoff_factor = backoff_factor
+        self.cooldown = cooldown
+        self.recovery_after = recovery_after
+        self.clock = clock
+        self.sleep = sleep
+
+        self.bucket: Optional[TokenBucket] = None
+        if max_per_minute:
+            # allow a burst of ten seconds' worth of sends
+            self.bucket = TokenBucket(max_per_minute / 60, max(1.0, max_per_minute / 6), clock=clock)
+
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._successes = 0
+        self._window_start = clock()
+        self._window_sent = 0
+        self.throttled = 0
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any], **kwargs: Any) -> "AdaptiveRateLimiter":
+        return cls(
+            max_per_minute=settings.get("max_per_minute"),
+            daily_quota=settings.get("daily_quota"),
+            **kwargs,
+        )
+
+    @property
+    def per_minute(self) -> Optional[float]:
+        return self.bucket.rate * 60 if self.bucket else None
+
+    def reserve(self) -> float:
+        """
+        Claim a send and return how many seconds to wait before making it.
+        Raises QuotaExceededError if the daily quota is used up. The send
+        counts against the quota until it's given back with refund().
+        """
+        with self._lock:
+            now = self.clock()
+            if now - self._window_start >= SECONDS_PER_DAY:
+                self._window_start = now
+                self._window_sent = 0
+            if self.daily_quota is not None and self._window_sent >= self.daily_quota:
+                raise QuotaExceededError(f"Daily quota of {self.daily_quota} emails reached.")
+            self._window_sent += 1
+            delay = max(0.0, self._paused_until - now)
+
+        if self.bucket is not None:
+            delay = max(delay, self.bucket.reserve())
+        return delay
+
+    def refund(self, sends: int = 1) -> None:
+        """
+        Give back sends reserved for emails the server didn't accept,
+        so only accepted ones count against the daily quota.
+        """
+        with self._lock:
+            self._window_sent = max(0, self._window_sent - sends)
+
+    def acquire(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            self.sleep(delay)
+
+    def on_success(self) -> None:
+        if self.bucket is None or self.max_per_minute is None:
+            return
+        with self._lock:
+            self._successes += 1
+            if self._successes < self.recovery_after:
+                return
+            self._successes = 0
+        max_rate = self.max_per_minute / 60
+        self.bucket.rate = min(max_rate, self.bucket.rate + max_rate * 0.1)
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            self.throttled += 1
+            self._successes = 0
+            self._paused_until = max(self._paused_until, self.clock() + self.cooldown)
+        if self.bucket is not None:
+            self.bucket.rate = max(self.min_per_minute / 60, self.bucket.rate * self.backoff_factor)
+
+    def on_reply(self, code: Optional[int]) -> bool:
+        """
+        Feed a failed send's reply code to the limiter. Returns True if it was throttling.
+        """
+        if code in THROTTLE_CODES:
+            self.on_throttle()
+            return True
+        return False
@@ -1,7 +1,8 @@
 from .model import TemplateModel, AbstractTemplateModel
-from .engine import TemplateEngine, AbstractTemplateEngine
+from .engine import TemplateEngine, AbstractTemplateEngine, RenderResult
 from .parser import AbstractTemplateParser, JinjaTemplateParser
 from .renderer import AbstractTemplateRenderer, JinjaTemplateRenderer
+from .environment import create_environment
 from .validator import AbstractTemplateValidator, TemplateValidator
 
 __all__ = [
@@ -9,10 +10,12 @@ __all__ = [
     "AbstractTemplateModel",
     "TemplateEngine",
     "AbstractTemplateEngine",
+    "RenderResult",
     "AbstractTemplateParser",
     "JinjaTemplateParser",
     "AbstractTemplateRenderer",
     "JinjaTemplateRenderer",
+    "create_environment",
     "AbstractTemplateValidator",
     "TemplateValidator",
 ]
@@ -1,5 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Dict
+from typing import Any, Dict, Hashable, Iterable, Iterator, NamedTuple, Optional, Set, Tuple
+from pydantic import BaseModel
+
+from smartmailer.utils.metrics import SendStats, timed
 
 from .parser import AbstractTemplateParser
 from .renderer import AbstractTemplateRenderer
@@ -15,10 +18,28 @@ class AbstractTemplateEngine(ABC):
     def render(self, model: AbstractTemplateModel) -> str:
         pass
 
+class RenderResult(NamedTuple):
+    """
+    One recipient's output from TemplateEngine.render_many.
+    The parts are None if the template wasn't set, or if rendering failed with `error`.
+    """
+    model: AbstractTemplateModel
+    subject: Optional[str]
+    text: Optional[str]
+    html: Optional[str]
+    error: Optional[Exception] = None
+
 class TemplateEngine:
     """
     Coordinates parsing, validation, and rendering.
     Validation is mandatory and fail-fast.
+
+    Template variables are extracted once, when the engine is built, and a
+    successful validation is remembered per model class, so a list of
+    recipients sharing one schema is only validated once.
+
+    Given `stats`, render_many() records in it the time spent extracting,
+    validating and rendering each model.
     """
 
     # Public API intentionally matches the old TemplateEngine
@@ -40,63 +61,121 @@ class TemplateEngine:
         self.subject = subject
         self.text = text
         self.html = html
-    
-    def _validate_single(self, template: str, model: AbstractTemplateModel) -> None:
-        if hasattr(model, "to_dict"):
-            data = model.to_dict()
-        elif hasattr(model, "model_dump"):   # pydantic support
-            data = model.model_dump()
-        else:
-            data = model.__dict__
 
-        template_vars = self.parser.extract_variables(template)
-
-        self.validator.validate_template(template_vars, set(data.keys()))
-
-    def _render_single(self, template: str, model: AbstractTemplateModel) -> str:
+        self._template_vars: Dict[str, Set[str]] = {}
+        self._validated: Set[Tuple[Hashable, ...]] = set()
+        for template in (subject, text, html):
+            if template is not None:
+                self._get_variables(template)
+
+    def _get_variables(self, template: str) -> Set[str]:
+        # keyed by source, so reassigning subject/text/html later still works
+        template_vars = self._template_vars.get(template)
+        if template_vars is None:
+            template_vars = self.parser.extract_variables(template)
+            self._template_vars[template] = template_vars
+        return template_vars
+
+    def _extract_data(self, model: AbstractTemplateModel) -> Dict[str, Any]:
         if hasattr(model, "to_dict"):
-            data = model.to_dict()
+            return model.to_dict()
         elif hasattr(model, "model_dump"):   # pydantic support
-            data = model.model_dump()
-        else:
-            data = model.__dict__
+            return model.model_dump()
+        return model.__dict__
 
-        return self.renderer.render(template, data)
+    def _schema_key(self, model: AbstractTemplateModel) -> Optional[Tuple[Hashable, ...]]:
+        """
+        Key under which a validation result can be shared, or None if the
+        model's fields aren't fixed by its class.
+        """
+        if not isinstance(model, BaseModel) or model.model_config.get("extra") == "allow":
+            return None
+        return (type(model), self.subject, self.text, self.html)
+
+    def _validate_single(self, template: str, data_keys: Set[str]) -> None:
+        self.validator.validate_template(self._get_variables(template), data_keys)
 
     def validate(self, model: AbstractTemplateModel) -> None:
         """
         Validate subject, text, and html templates against the model.
         Fail-fast if any template is invalid.
         """
+        self._validate_data(model)
+
+    def _validate_data(self, model: AbstractTemplateModel, data: Optional[Dict[str, Any]] = None) -> None:
+        # `data` is the model's already extracted data, so callers that
+        # need it for rendering too don't extract it twice
+        schema_key = self._schema_key(model)
+        if schema_key is not None and schema_key in self._validated:
+            return
+
+        if data is None:
+            data = self._extract_data(model)
+        data_keys = set(data.keys())
 
         if self.subject is not None:
-            self._validate_single(self.subject, model)
+            self._validate_single(self.subject, data_keys)
 
         if self.text is not None:
-            self._validate_single(self.text, model)
+            self._validate_single(self.text, data_keys)
 
         if self.html is not None:
-            self._validate_single(self.html, model)
+            self._validate_single(self.html, data_keys)
 
-    def render(self, model: AbstractTemplateModel, validate: bool = True) -> Dict[str, Optional[str]]:
+        if schema_key is not None:
+            self._validated.add(schema_key)
+
+    def context(
+        self, model: AbstractTemplateModel, validate: bool = True, stats: Optional[SendStats] = None
+    ) -> Dict[str, Any]:
         """
-        Validate all templates and render subject, text, and html.
+        The data the templates are rendered with, extracted from the model once.
         """
+        with timed(stats, "dump"):
+            data = self._extract_data(model)
         if validate:
-            self.validate(model)
+            with timed(stats, "validate"):
+                self._validate_data(model, data)
+        return data
+
+    def _render_parts(
+        self, data: Dict[str, Any], stats: Optional[SendStats] = None
+    ) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        render = self.renderer.render
+        with timed(stats, "render"):
+            return (
+                render(self.subject, data) if self.subject is not None else None,
+                render(self.text, data) if self.text is not None else None,
+                render(self.html, data) if self.html is not None else None,
+            )
 
-        result: Dict[str, Optional[str]] = {
-            "subject": None,
-            "text": None,
-            "html": None,
+    def render(self, model: AbstractTemplateModel, validate: bool = True) -> Dict[str, Optional[str]]:
+        """
+        Validate all templates and render subject, text, and html.
+        """
+        subject, text, html = self._render_parts(self.context(model, validate))
+        return {
+            "subject": subject,
+            "text": text,
+            "html": html,
         }
 
-        if self.subject is not None:
-            result["subject"] = self._render_single(self.subject, model)
-
-        if self.text is not None:
-            result["text"] = self._render_single(self.text, model)
-        if self.html is not None:
-            result["html"] = self._render_single(self.html, model)
-
-        return result
\ No newline at end of file
+    def render_many(
+        self,
+        models: Iterable[AbstractTemplateModel],
+        validate: bool = True,
+        stats: Optional[SendStats] = None,
+    ) -> Iterator[RenderResult]:
+        """
+        Render many models lazily, in order. Each model's data is extracted once
+        and shared by all three templates, and models of one schema are
+        validated once. A model that fails gets a result with `error` set
+        instead of stopping the rest. Each stage is timed into `stats`, if given.
+        """
+        for model in models:
+            try:
+                subject, text, html = self._render_parts(self.context(model, validate, stats), stats)
+            except Exception as e:
+                yield RenderResult(model, None, None, None, e)
+                continue
+            yield RenderResult(model, subject, text, html)
\ No newline at end of file
@@ -0,0 +1,23 @@
+import os
+from typing import Any, Optional
+
+from jinja2 import Environment, FileSystemBytecodeCache
+
+from smartmailer.config import DB_FOLDER
+
+BYTECODE_CACHE_FOLDER = "jinja_cache"
+
+
+def create_environment(cache_dir: Optional[str] = None, **options: Any) -> Environment:
+    """
+    A Jinja Environment that keeps compiled templates on disk, so running the
+    same templates again (retries, resumed sessions, daily runs) skips compiling them.
+
+    Templates are cached by a hash of their source, in `cache_dir`, which
+    defaults to a folder next to the session databases. Any other keyword
+    arguments are passed on to Environment.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.getcwd(), DB_FOLDER, BYTECODE_CACHE_FOLDER)
+    os.makedirs(cache_dir, exist_ok=True)
+    return Environment(bytecode_cache=FileSystemBytecodeCache(cache_dir), **options)
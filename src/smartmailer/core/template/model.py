@@ -1,10 +1,15 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Type, Optional
-from pydantic import BaseModel, model_validator, computed_field
+from typing import Any, Dict, Type, Optional, Tuple
+from pydantic import BaseModel, PrivateAttr, model_validator, computed_field
 import re
 import json
 import keyword
 
+from smartmailer.utils.strings import get_hash
+
+# field names that make up a model's identity, per model class
+_IDENTITY_FIELDS: Dict[type, Tuple[str, ...]] = {}
+
 class AbstractTemplateModel(BaseModel, ABC):
     @abstractmethod
     def to_dict(self) -> Dict[str, object]:
@@ -21,6 +26,8 @@ class TemplateModel(AbstractTemplateModel):
     Defines the schema for allowed template variables.
     """
 
+    _hash_cache: Optional[str] = PrivateAttr(default=None)
+
     @model_validator(mode='after')
     def check_lowercase_identifier(self):
         for name in self.__dict__:
@@ -37,16 +44,32 @@ class TemplateModel(AbstractTemplateModel):
     def to_dict(self) -> Dict[str, object]:
         return self.model_dump(exclude={"hash_string"})
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if not name.startswith("_"):
+            # the identity depends on the field values, so recompute it next time
+            self._hash_cache = None
+
+    @classmethod
+    def _identity_fields(cls) -> Tuple[str, ...]:
+        fields = _IDENTITY_FIELDS.get(cls)
+        if fields is None:
+            # same keys the identity has always been built from, so digests
+            # of existing session databases stay valid after migration
+            fields = tuple(cls.model_json_schema()["properties"].keys())
+            _IDENTITY_FIELDS[cls] = fields
+        return fields
+
     @computed_field
     @property
     def hash_string(self) -> str:
         """
         Returns a hash of the model's fields.
         This is used to uniquely identify the template model.
+        It is a SHA-256 hex digest of the fields as JSON, computed once per instance.
         """
-        # we cant do model_dump because it keeps recursively calling this computed field
-        dump = self.model_json_schema()
-        res = {}
-        for key in dump["properties"].keys():
-            res[key] = self.__dict__.get(key, None)
-        return json.dumps(res)
\ No newline at end of file
+        if self._hash_cache is None:
+            # we cant do model_dump because it keeps recursively calling this computed field
+            res = {key: self.__dict__.get(key, None) for key in self._identity_fields()}
+            self._hash_cache = get_hash(json.dumps(res))
+        return self._hash_cache
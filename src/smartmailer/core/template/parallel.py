@@ -0,0 +1,195 @@
+import os
+import pickle
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from jinja2 import Environment
+
+from smartmailer.utils.metrics import SendStats
+
+from .engine import TemplateEngine
+from .model import AbstractTemplateModel
+from .renderer import JinjaTemplateRenderer
+
+# Environment() arguments that are plain settings and can be copied as they are
+ENV_OPTIONS = (
+    "block_start_string", "block_end_string",
+    "variable_start_string", "variable_end_string",
+    "comment_start_string", "comment_end_string",
+    "line_statement_prefix", "line_comment_prefix",
+    "trim_blocks", "lstrip_blocks", "newline_sequence", "keep_trailing_newline",
+    "undefined", "finalize", "autoescape", "optimized", "bytecode_cache",
+)
+
+Rendered = Dict[str, Optional[str]]
+# what a worker sends back for one recipient: the rendered parts, or why it
+# failed, and how long rendering took
+WorkerResult = Tuple[Optional[Tuple[Optional[str], Optional[str], Optional[str]]], Optional[str], float]
+
+
+def environment_config(env: Environment) -> Dict[str, Any]:
+    """
+    Everything needed to rebuild `env` in another process. Filters, tests and
+    globals that aren't Jinja's own are shipped by reference, so they have to
+    be defined at module level.
+    """
+    defaults = Environment()
+    config = {
+        "options": {name: getattr(env, name) for name in ENV_OPTIONS},
+        "extensions": list(env.extensions.keys()),
+        "filters": {k: v for k, v in env.filters.items() if defaults.filters.get(k) is not v},
+        "tests": {k: v for k, v in env.tests.items() if defaults.tests.get(k) is not v},
+        "globals": {k: v for k, v in env.globals.items() if defaults.globals.get(k) is not v},
+    }
+    try:
+        pickle.dumps(config)
+    except Exception as e:
+        raise ValueError(
+            f"The Jinja environment can't be sent to worker processes ({e}). "
+            "Define custom filters, tests and globals at module level, not as lambdas."
+        )
+    return config
+
+
+def build_environment(config: Dict[str, Any]) -> Environment:
+    env = Environment(extensions=config["extensions"], **config["options"])
+    env.filters.update(config["filters"])
+    env.tests.update(config["tests"])
+    env.globals.update(config["globals"])
+    return env
+
+
+# set up once per worker process by _init_worker
+_worker_renderer: Optional[JinjaTemplateRenderer] = None
+_worker_templates: Tuple[Optional[str], Optional[str], Optional[str]] = (None, None, None)
+
+
+def _init_worker(config: Dict[str, Any], templates: Tuple[Optional[str], Optional[str], Optional[str]]) -> None:
+    global _worker_renderer, _worker_templates
+    _worker_renderer = JinjaTemplateRenderer(build_environment(config))
+    _worker_templates = templates
+    # compile up front, so the first chunk doesn't pay for it
+    for template in templates:
+        if template is not None:
+            _worker_renderer._get_template(template)
+
+
+def _render_chunk(chunk: List[Dict[str, Any]]) -> List[WorkerResult]:
+    assert _worker_renderer is not None, "Worker was not initialized."
+    results: List[WorkerResult] = []
+    for data in chunk:
+        start = time.perf_counter()
+        try:
+            parts = tuple(
+                _worker_renderer.render(template, data) if template is not None else None
+                for template in _worker_templates
+            )
+            results.append((parts, None, time.perf_counter() - start))  # type: ignore[arg-type]
+        except Exception as e:
+            results.append((None, str(e), time.perf_counter() - start))
+    return results
+
+
+class ParallelRenderer:
+    """
+    Renders recipients for a TemplateEngine on a pool of worker processes.
+
+    The templates and the Jinja environment's settings are sent to each worker
+    once, when it starts. Recipients are validated and turned into plain dicts
+    here, rendered in chunks by the workers, and handed back in the order they
+    came in. Only a few chunks per worker are in flight at a time, so a
+    generator of recipients is never read far ahead.
+    """
+
+    def __init__(self, engine: TemplateEngine, processes: Optional[int] = None, chunk_size: int = 64) -> None:
+        if not isinstance(getattr(engine, "renderer", None), JinjaTemplateRenderer):
+            raise ValueError("Parallel rendering needs a JinjaTemplateRenderer.")
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be at least 1.")
+
+        self.engine = engine
+        self.processes = processes or os.cpu_count() or 1
+        if self.processes < 1:
+            raise ValueError("Processes must be at least 1.")
+        self.chunk_size = chunk_size
+        self.max_pending = self.processes * 2
+        self._config = environment_config(engine.renderer.env)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            templates = (self.engine.subject, self.engine.text, self.engine.html)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                initializer=_init_worker,
+                initargs=(self._config, templates),
+            )
+        return self._executor
+
+    def _prepare(
+        self, model: AbstractTemplateModel, stats: Optional[SendStats] = None
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[Exception]]:
+        try:
+            return self.engine.context(model, stats=stats), None
+        except Exception as e:
+            return None, e
+
+    def render(
+        self, models: Iterable[AbstractTemplateModel], stats: Optional[SendStats] = None
+    ) -> Iterator[Tuple[AbstractTemplateModel, Optional[Rendered], Optional[Exception]]]:
+        """
+        Yields (model, rendered, error) for every model, in order.
+        `rendered` has the same keys as TemplateEngine.render(); it's None if `error` is set.
+        Each stage is timed into `stats`, if given, like TemplateEngine.render_many().
+        """
+        executor = self._get_executor()
+        pending: Deque[Tuple[List[Tuple[AbstractTemplateModel, Optional[Exception]]], "Future[List[WorkerResult]]"]] = deque()
+
+        def submit(batch: List[Tuple[AbstractTemplateModel, Optional[Dict[str, Any]], Optional[Exception]]]) -> None:
+            data = [item for _, item, error in batch if error is None]
+            future = executor.submit(_render_chunk, data)
+            pending.append(([(model, error) for model, _, error in batch], future))
+
+        def drain_one() -> Iterator[Tuple[AbstractTemplateModel, Optional[Rendered], Optional[Exception]]]:
+            batch, future = pending.popleft()
+            results = iter(future.result())
+            for model, error in batch:
+                if error is not None:
+                    yield model, None, error
+                    continue
+                parts, message, seconds = next(results)
+                if stats is not None:
+                    stats.observe("render", seconds)
+                if parts is None:
+                    yield model, None, ValueError(message)
+                else:
+                    subject, text, html = parts
+                    yield model, {"subject": subject, "text": text, "html": html}, None
+
+        batch: List[Tuple[AbstractTemplateModel, Optional[Dict[str, Any]], Optional[Exception]]] = []
+        for model in models:
+            data, error = self._prepare(model, stats)
+            batch.append((model, data, error))
+            if len(batch) >= self.chunk_size:
+                submit(batch)
+                batch = []
+                if len(pending) >= self.max_pending:
+                    yield from drain_one()
+
+        if batch:
+            submit(batch)
+        while pending:
+            yield from drain_one()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self) -> "ParallelRenderer":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
@@ -1,5 +1,9 @@
 from abc import ABC, abstractmethod
-from typing import Set
+from hashlib import sha256
+import json
+import os
+import tempfile
+from typing import Optional, Set
 from jinja2 import Environment, meta
 
 class AbstractTemplateParser(ABC):
@@ -10,14 +14,44 @@ class AbstractTemplateParser(ABC):
 class JinjaTemplateParser(AbstractTemplateParser):
     """
     Extracts undeclared variables from a Jinja2 template.
+    With an on-disk bytecode cache (see create_environment), the variables
+    are saved next to the compiled templates, so a template is parsed once.
     """
 
     def __init__(self, env: Environment):
         self.env = env
+
+    def _cache_path(self, template: str) -> Optional[str]:
+        directory = getattr(self.env.bytecode_cache, "directory", None)
+        if directory is None:
+            return None
+        # named with the cache's own pattern, so bytecode_cache.clear() removes it too
+        pattern = getattr(self.env.bytecode_cache, "pattern", "%s")
+        key = sha256(template.encode("utf-8")).hexdigest() + ".vars"
+        return os.path.join(directory, pattern % (key,))
     
     def extract_variables(self, template: str) -> Set[str]:
         if not template:
             return set()
 
+        cache_path = self._cache_path(template)
+        if cache_path is not None:
+            try:
+                with open(cache_path) as f:
+                    return set(json.load(f))
+            except (OSError, ValueError):
+                pass
+
         ast = self.env.parse(template)
-        return meta.find_undeclared_variables(ast)
\ No newline at end of file
+        variables = meta.find_undeclared_variables(ast)
+
+        if cache_path is not None:
+            try:
+                # write then rename, so a concurrent reader never sees half a file
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path))
+                with os.fdopen(fd, "w") as f:
+                    json.dump(sorted(variables), f)
+                os.replace(tmp_path, cache_path)
+            except OSError:
+                pass
+        return variables
\ No newline at end of file
@@ -1,6 +1,9 @@
 from abc import ABC, abstractmethod
-from typing import Dict
-from jinja2 import Environment, TemplateError
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+from typing import Dict, NamedTuple
+from jinja2 import Environment, Template, TemplateError
 
 
 class AbstractTemplateRenderer(ABC):
@@ -8,17 +11,79 @@ class AbstractTemplateRenderer(ABC):
     def render(self, template: str, data: Dict[str, object]) -> str:
         pass
 
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
 class JinjaTemplateRenderer(AbstractTemplateRenderer):
     """
     Renders a Jinja2 template using provided data.
+    Compiled templates are kept in a bounded LRU cache keyed by their source.
+    If the environment has a bytecode cache (see create_environment), compiled
+    code is also loaded from and saved to it.
     """
 
-    def __init__(self, env: Environment):
+    def __init__(self, env: Environment, cache_size: int = 128):
+        if cache_size < 1:
+            raise ValueError("Cache size must be at least 1.")
         self.env = env
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Template]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_template(self, template: str) -> Template:
+        with self._lock:
+            tmpl = self._cache.get(template)
+            if tmpl is not None:
+                self._cache.move_to_end(template)
+                self.hits += 1
+                return tmpl
+            self.misses += 1
+
+        # compile outside the lock; two threads racing on the same source
+        # just compile it twice
+        tmpl = self._compile(template)
+
+        with self._lock:
+            self._cache[template] = tmpl
+            self._cache.move_to_end(template)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tmpl
+
+    def _compile(self, template: str) -> Template:
+        bcc = self.env.bytecode_cache
+        if bcc is None:
+            return self.env.from_string(template)
+
+        # Jinja only consults the bytecode cache for templates from a loader,
+        # so do it by hand, naming each template after its source
+        name = sha256(template.encode("utf-8")).hexdigest()
+        bucket = bcc.get_bucket(self.env, name, None, template)
+        code = bucket.code
+        if code is None:
+            code = self.env.compile(template)
+            bucket.code = code
+            bcc.set_bucket(bucket)
+        return self.env.template_class.from_code(self.env, code, self.env.make_globals(None))
+
+    def cache_info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.cache_size, len(self._cache))
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
 
     def render(self, template: str, data: Dict[str, object]) -> str:
         try:
-            tmpl = self.env.from_string(template)
+            tmpl = self._get_template(template)
             return tmpl.render(data)
         except TemplateError as e:
-            raise ValueError(f"Jinja rendering failed: {e}")
\ No newline at end of file
+            raise ValueError(f"Jinja rendering failed: {e}")
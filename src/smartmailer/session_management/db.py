@@ -1,99 +1,327 @@
 import sqlalchemy as db
-from sqlalchemy import Table, create_engine, Column
+from sqlalchemy import Table, create_engine, Column, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 import datetime
-from typing import List, Dict, Any, Optional
-from smartmailer.utils.new_logger import Logger
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Set, Tuple
+from sqlalchemy.engine import Engine
+from smartmailer.session_management.store import (
+    BUSY_TIMEOUT, IN_QUERY_CHUNK_SIZE, MEMORY_PATH, SCHEMA_VERSION, SessionStore, SharedResources,
+)
+from smartmailer.utils.strings import get_hash
 
-class Database:
-    _instance = None
-    
-    # This will be a singleton class
-    def __new__(cls, *args, **kwargs):
-        if Database._instance is None:
-            Database._instance = object.__new__(cls)
-            Database._instance.__init__(*args, **kwargs)
 
-        return Database._instance
-    
-    def __init__(self, dbfile_path: str):
-        self.logger = Logger()
+def _open_engine(dbfile_path: str, synchronous: str) -> Engine:
+    # several workers may share one session file, so wait for each other's writes
+    engine = create_engine(f"sqlite:///{dbfile_path}", connect_args={"timeout": BUSY_TIMEOUT})
+
+    @event.listens_for(engine, "connect")
+    def configure(dbapi_connection, connection_record) -> None:
+        Database._configure_connection(dbapi_connection, synchronous)
+
+    return engine
+
+
+# one engine per session file and synchronous mode, shared by every Database open on it
+ENGINES: SharedResources[Engine] = SharedResources(_open_engine, lambda engine: engine.dispose())
+
+
+class Database(SessionStore):
+    """
+    The SQLAlchemy session store.
 
+    Each instance is its own session, so a process can run several campaigns
+    at once. Instances on the same file share its engine through ENGINES.
+    """
+
+    def __init__(self, dbfile_path: str, batch_size: int = 1, flush_interval: float = 1.0):
+        super().__init__(batch_size=batch_size, flush_interval=flush_interval)
         self.logger.info(f"Initializing database at {dbfile_path}")
-        self.engine = create_engine(f"sqlite:///{dbfile_path}")
+
+        self.dbfile_path = dbfile_path
+        self.engine = ENGINES.acquire(dbfile_path, self.synchronous)
         self.meta = db.MetaData()
 
         self._sent = Table(
             "sent", self.meta,
             Column("recipient_hash", db.String, primary_key=True),
             Column("sent_time", db.DateTime))
+
+        # one row per recipient whose last send failed, with what's needed to resend it.
+        # next_attempt_at is NULL for permanent failures, which are kept but never retried
+        self._failed = Table(
+            "failed", self.meta,
+            Column("recipient_hash", db.String, primary_key=True),
+            Column("payload", db.Text, nullable=False),
+            Column("attempts", db.Integer, nullable=False, default=0),
+            Column("last_reply", db.Text),
+            Column("last_attempt_at", db.DateTime),
+            Column("next_attempt_at", db.DateTime, index=True))
+
+        # recipients a worker has claimed for sending, until expires_at
+        self._leases = Table(
+            "leases", self.meta,
+            Column("recipient_hash", db.String, primary_key=True),
+            Column("worker_id", db.String, nullable=False),
+            Column("expires_at", db.DateTime, nullable=False, index=True))
         
-        self._create_tables()
+        self._create_schema()
     
-    def _create_tables(self):
+    @property
+    def _timed_flush(self) -> bool:
+        # SQLAlchemy gives each thread its own ":memory:" database, so a flush
+        # from the timer thread would write the rows somewhere nobody reads
+        return self.dbfile_path != MEMORY_PATH
+
+    @staticmethod
+    def _configure_connection(dbapi_connection, synchronous: str) -> None:
+        # WAL lets readers and the writer work side by side. `synchronous` is
+        # the store's, see SessionStore.synchronous.
+        # WAL relies on shared memory, so every worker on a session file has
+        # to be on the same machine; it doesn't work over NFS or SMB.
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.close()
+
+    def _create_schema(self) -> None:
         assert self.meta is not None, "Metadata is not initialized."
         assert self.engine is not None, "Engine is not initialized."
-        self.meta.create_all(self.engine)
-    
-    def insert_recipient(self, recipient_hash: str) -> Optional[int]:
+        with self.engine.begin() as conn:
+            # workers starting on a new file at the same time would all see the
+            # tables missing and race to create them, so the check, the creation
+            # and the migration happen under the write lock, one worker at a time
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            self.meta.create_all(conn)
+            self._migrate(conn)
+
+    def _migrate(self, conn: db.Connection) -> None:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+        if version >= SCHEMA_VERSION:
+            return
+
+        if version < 1:
+            # sessions created before v1 keyed recipients by the raw JSON of their
+            # fields; the key is now the SHA-256 digest of that same JSON
+            rows = conn.execute(self._sent.select()).fetchall()
+            legacy = [row for row in rows if not self._is_digest(row.recipient_hash)]
+            if legacy:
+                self.logger.info(f"Migrating {len(legacy)} recipient keys to digests.")
+                conn.execute(
+                    self._sent.delete().where(self._sent.c.recipient_hash == db.bindparam("legacy_hash")),
+                    [{"legacy_hash": row.recipient_hash} for row in legacy],
+                )
+                conn.execute(
+                    self._sent.insert().prefix_with("OR IGNORE"),
+                    [{"recipient_hash": get_hash(row.recipient_hash), "sent_time": row.sent_time} for row in legacy],
+                )
+
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _insert_sent(self, recipient_hash: str, sent_time: datetime.datetime) -> Optional[int]:
         with Session(self.engine) as session:
             command = self._sent.insert().prefix_with("OR IGNORE").values(
                 recipient_hash=recipient_hash,
-                sent_time=datetime.datetime.now()
+                sent_time=sent_time
             )
 
             result = session.execute(command)
             session.commit()
+            return result.lastrowid if result.rowcount else None
+
+    def _insert_sent_many(self, rows: List[Tuple[str, datetime.datetime]]) -> int:
+        with Session(self.engine) as session:
+            result = session.execute(
+                self._sent.insert().prefix_with("OR IGNORE"),
+                [{"recipient_hash": h, "sent_time": t} for h, t in rows],
+            )
+            session.commit()
+        return result.rowcount
+
+    def record_failure(self, recipient_hash: str, payload: str, reply: str, retryable: bool = True) -> int:
+        failed = self._failed
+        now = datetime.datetime.now()
+        with Session(self.engine) as session:
+            query = db.select(failed.c.attempts).where(failed.c.recipient_hash == recipient_hash)
+            attempts = (session.execute(query).scalar() or 0) + 1
+            values = {
+                "payload": payload,
+                "attempts": attempts,
+                "last_reply": reply,
+                "last_attempt_at": now,
+                "next_attempt_at": now + self.retry_delay(attempts) if retryable else None,
+            }
+            if attempts == 1:
+                session.execute(failed.insert().values(recipient_hash=recipient_hash, **values))
+            else:
+                session.execute(failed.update().where(failed.c.recipient_hash == recipient_hash).values(**values))
+            session.commit()
+
+        self.logger.info(f"Recorded failure #{attempts} for {recipient_hash}: {reply}")
+        return attempts
+
+    def get_due_failures(
+        self,
+        now: Optional[datetime.datetime] = None,
+        limit: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Served from the next_attempt_at index, so the cost depends on how
+        many are due, not on the size of the campaign.
+        """
+        self.flush()
+        failed = self._failed
+        sent = self._sent
+        query = (
+            db.select(failed)
+            .where(failed.c.next_attempt_at <= (now or datetime.datetime.now()))
+            .where(~db.exists().where(sent.c.recipient_hash == failed.c.recipient_hash))
+            .order_by(failed.c.next_attempt_at)
+        )
+        if max_attempts is not None:
+            query = query.where(failed.c.attempts < max_attempts)
+        if limit is not None:
+            query = query.limit(limit)
+
+        with Session(self.engine) as session:
+            return [dict(row._mapping) for row in session.execute(query)]
+
+    def get_failed_recipients(self) -> List[Dict[str, Any]]:
+        with Session(self.engine) as session:
+            return [dict(row._mapping) for row in session.execute(self._failed.select())]
+
+    def clear_sent_failures(self) -> int:
+        self.flush()
+        failed = self._failed
+        sent = self._sent
+        with Session(self.engine) as session:
+            command = failed.delete().where(
+                db.exists().where(sent.c.recipient_hash == failed.c.recipient_hash)
+            )
+            result = session.execute(command)
+            session.commit()
+        return result.rowcount
+
+    def claim_recipients(self, recipient_hashes: Iterable[str], worker_id: str, ttl: float) -> Set[str]:
+        hashes = list(dict.fromkeys(recipient_hashes))
+        if not hashes:
+            return set()
+
+        self.flush()
+        leases = self._leases
+        now = datetime.datetime.now()
+        expires_at = now + datetime.timedelta(seconds=ttl)
+        insert = sqlite_insert(leases)
+        upsert = insert.on_conflict_do_update(
+            index_elements=[leases.c.recipient_hash],
+            set_={"worker_id": insert.excluded.worker_id, "expires_at": insert.excluded.expires_at},
+            where=(leases.c.expires_at <= now) | (leases.c.worker_id == insert.excluded.worker_id),
+        )
+
+        claimed: Set[str] = set()
+        sent_column = self._sent.c.recipient_hash
+        with Session(self.engine) as session:
+            # the insert comes first, so the transaction holds the write lock before it reads
+            session.execute(
+                upsert,
+                [{"recipient_hash": h, "worker_id": worker_id, "expires_at": expires_at} for h in hashes],
+            )
+            for start in range(0, len(hashes), IN_QUERY_CHUNK_SIZE):
+                chunk = hashes[start:start + IN_QUERY_CHUNK_SIZE]
+                query = (
+                    db.select(leases.c.recipient_hash)
+                    .where(leases.c.recipient_hash.in_(chunk))
+                    .where(leases.c.worker_id == worker_id)
+                    .where(~db.exists().where(sent_column == leases.c.recipient_hash))
+                )
+                claimed.update(row[0] for row in session.execute(query))
+            session.commit()
 
-            if result.rowcount == 0:
-                self.logger.info(f"Recipient {recipient_hash} already exists. Skipping insert.")
-                return None
+        self.logger.info(f"Worker {worker_id} claimed {len(claimed)} of {len(hashes)} recipients.")
+        return claimed
 
-            self.logger.info(f"Recipient {recipient_hash} inserted successfully.")
-            return result.lastrowid
+    def renew_leases(self, worker_id: str, ttl: float) -> int:
+        leases = self._leases
+        expires_at = datetime.datetime.now() + datetime.timedelta(seconds=ttl)
+        with Session(self.engine) as session:
+            result = session.execute(
+                leases.update().where(leases.c.worker_id == worker_id).values(expires_at=expires_at)
+            )
+            session.commit()
+        return result.rowcount
+
+    def release_leases(self, worker_id: str) -> int:
+        leases = self._leases
+        with Session(self.engine) as session:
+            result = session.execute(leases.delete().where(leases.c.worker_id == worker_id))
+            session.commit()
+        return result.rowcount
 
-    def check_recipient_sent(self, recipient_hash: str) -> bool:
+    def _is_sent(self, recipient_hash: str) -> bool:
         with Session(self.engine) as session:
             query = self._sent.select().where(self._sent.c.recipient_hash == recipient_hash)
             result = session.execute(query).fetchone()
             return result is not None
-    
+
+    def _select_sent(self, recipient_hashes: List[str]) -> Iterable[str]:
+        column = self._sent.c.recipient_hash
+        with Session(self.engine) as session:
+            return [row[0] for row in session.execute(db.select(column).where(column.in_(recipient_hashes)))]
+
     def get_sent_recipients(self) -> List[Dict[str, Any]]:
         self.logger.info("Fetching all sent recipients from database.")
+        self.flush()
         with Session(self.engine) as session:
             query = self._sent.select()
             columns = [col.name for col in self._sent.columns]  # Get column names from the table
             query_result = session.execute(query).fetchall()
             return [dict(zip(columns, row)) for row in query_result]
         
-    def delete_recipient(self, recipient_hash: str) -> None:
-        self.logger.info(f"Trying to delete recipient with hash {recipient_hash}.")
-        if not self.check_recipient_sent(recipient_hash):
-            self.logger.error(f"{recipient_hash} not found. Cannot delete.")
-            raise ValueError(f"Recipient with hash {recipient_hash} not found in the database.")
-    
+    def count_sent(self) -> int:
+        self.flush()
+        with Session(self.engine) as session:
+            return session.execute(db.select(db.func.count()).select_from(self._sent)).scalar()
+
+    def iter_sent_hashes(self) -> Iterator[str]:
+        self.flush()
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(db.select(self._sent.c.recipient_hash))
+            for row in result:
+                yield row[0]
+
+    def _delete_sent(self, recipient_hash: str) -> None:
         with Session(self.engine) as session:
             command = self._sent.delete().where(self._sent.c.recipient_hash == recipient_hash)
             session.execute(command)
             session.commit()
-            self.logger.info(f"{recipient_hash} deleted successfully.")
     
     def clear_database(self) -> None:
+        self._clear_pending()
         with Session(self.engine) as session:
-            command = self._sent.delete()
-            session.execute(command)
+            session.execute(self._sent.delete())
+            session.execute(self._failed.delete())
+            session.execute(self._leases.delete())
             session.commit()
-        self._create_tables()  # Recreate the table structure after clearing
+        self._create_schema()  # Recreate the table structure after clearing
         self.logger.info("Database cleared and table structure recreated.")
     
     def close(self) -> None:
-        if self.engine:
-            self.logger.info("Closing database connection and disposing engine.")
-            self.engine.dispose()
-            self.engine = None
-            self.meta = None
-            Database._instance = None
+        if getattr(self, "engine", None):
+            try:
+                self.flush()
+            finally:
+                self.logger.info("Closing database connection.")
+                ENGINES.release(self.dbfile_path, self.engine, self.synchronous)
+                self.engine = None
+                self.meta = None
     
     def __del__(self):
-        self.close()
-        self.logger.info("Database connection closed.")
\ No newline at end of file
+        # there's nothing left to close after an explicit close(), and at interpreter
+        # shutdown the logger or the modules close() uses may already be gone
+        try:
+            if getattr(self, "engine", None):
+                self.close()
+                self.logger.info("Database connection closed.")
+        except Exception:
+            pass
\ No newline at end of file
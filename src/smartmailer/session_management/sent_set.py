@@ -0,0 +1,96 @@
+from typing import TYPE_CHECKING, Iterable, List, Optional, Set, Union
+from smartmailer.session_management.store import DIGEST_LENGTH
+from smartmailer.utils.bloom import BloomFilter
+
+if TYPE_CHECKING:
+    from smartmailer.session_management.store import SessionStore
+
+# sessions up to this many sent recipients are copied into memory exactly, about
+# 90 bytes each; bigger ones get a Bloom filter of about 1.2 bytes each instead
+SENT_SET_MAX_ROWS = 1_000_000
+BLOOM_ERROR_RATE = 0.01
+
+SENT_CACHE_MODES = ("auto", "set", "bloom")
+
+
+def _compact(recipient_hash: str) -> Union[bytes, str]:
+    # a hex SHA-256 digest fits in half the memory as bytes. Only lowercase
+    # digests are converted, so no two different strings share a key
+    if len(recipient_hash) == DIGEST_LENGTH and recipient_hash == recipient_hash.lower():
+        try:
+            digest = bytes.fromhex(recipient_hash)
+        except ValueError:
+            return recipient_hash
+        if len(digest) == DIGEST_LENGTH // 2:
+            return digest
+    return recipient_hash
+
+
+class SentSet:
+    """
+    An in-memory snapshot of the hashes a session has sent, so asking
+    "already sent?" doesn't go to the database for every recipient.
+
+    In "set" mode it holds every hash and answers exactly. In "bloom" mode it
+    holds a Bloom filter, which fits multi-million-recipient sessions in a few
+    megabytes: a miss means the recipient was never sent, and the few hits are
+    confirmed by the store. Either way, keep it in step by calling add() for
+    every recipient sent during the run.
+    """
+
+    def __init__(self, mode: str, capacity: int = SENT_SET_MAX_ROWS, error_rate: float = BLOOM_ERROR_RATE) -> None:
+        if mode not in ("set", "bloom"):
+            raise ValueError(f"Unknown sent cache mode '{mode}', expected 'set' or 'bloom'.")
+        self.mode = mode
+        self._hashes: Set[Union[bytes, str]] = set()
+        self._bloom: Optional[BloomFilter] = BloomFilter(capacity, error_rate) if mode == "bloom" else None
+
+    @classmethod
+    def load(cls, store: "SessionStore", mode: str = "auto", max_exact: int = SENT_SET_MAX_ROWS) -> "SentSet":
+        """
+        Read every sent hash from `store` once. With mode "auto", sessions of
+        more than `max_exact` sent recipients get a Bloom filter.
+        """
+        if mode not in SENT_CACHE_MODES:
+            raise ValueError(f"Unknown sent cache mode '{mode}', expected one of: {', '.join(SENT_CACHE_MODES)}.")
+
+        rows = store.count_sent()
+        if mode == "auto":
+            mode = "bloom" if rows > max_exact else "set"
+        # room for the recipients this run will add, so the error rate holds
+        sent = cls(mode, capacity=max(2 * rows, max_exact))
+        for recipient_hash in store.iter_sent_hashes():
+            sent.add(recipient_hash)
+        return sent
+
+    @property
+    def exact(self) -> bool:
+        return self._bloom is None
+
+    def add(self, recipient_hash: str) -> None:
+        if self._bloom is not None:
+            self._bloom.add(recipient_hash)
+        else:
+            self._hashes.add(_compact(recipient_hash))
+
+    def __contains__(self, recipient_hash: str) -> bool:
+        """
+        True if the recipient was sent, or for a Bloom filter, may have been.
+        """
+        if self._bloom is not None:
+            return recipient_hash in self._bloom
+        return _compact(recipient_hash) in self._hashes
+
+    def __len__(self) -> int:
+        if self._bloom is not None:
+            return len(self._bloom)
+        return len(self._hashes)
+
+    def get_sent_hashes(self, recipient_hashes: Iterable[str], store: "SessionStore") -> Set[str]:
+        """
+        The subset of `recipient_hashes` that was sent. Only Bloom filter hits go to `store`.
+        """
+        if self.exact:
+            return {h for h in recipient_hashes if h in self}
+        maybe_sent: List[str] = [h for h in recipient_hashes if h in self]
+        return store.get_sent_hashes(maybe_sent) if maybe_sent else set()
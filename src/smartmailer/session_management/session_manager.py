@@ -1,16 +1,82 @@
-from tabulate import tabulate
-from typing import List, Dict, Any
-from smartmailer.session_management.db import Database
+import json
+import socket
+import threading
+from importlib import import_module
+from typing import TYPE_CHECKING, List, Dict, Any, Iterable, NamedTuple, Optional, Set, Tuple, Type
 from smartmailer.utils.strings import get_os_safe_name
 import os
 from smartmailer.config import DB_FOLDER
 from smartmailer.utils.new_logger import Logger
 from smartmailer.utils.types import TemplateModelType
-from smartmailer.core.template import TemplateModel
+from smartmailer.session_management.sent_set import SENT_CACHE_MODES, SentSet
+
+if TYPE_CHECKING:
+    from smartmailer.core.template import TemplateModel
+    from smartmailer.session_management.store import SessionStore
+
+# each session store backend and where it lives. Only the one in use is imported,
+# so the sqlite3 backend doesn't load SQLAlchemy
+SESSION_BACKENDS = {
+    "sqlalchemy": ("smartmailer.session_management.db", "Database"),
+    "sqlite3": ("smartmailer.session_management.sqlite_store", "SQLiteStore"),
+}
+DEFAULT_SESSION_BACKEND = "sqlalchemy"
+
+# how long a worker's claim on recipients lasts without being renewed
+DEFAULT_LEASE_TTL = 300.0
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def get_store_class(backend: str) -> "Type[SessionStore]":
+    if backend not in SESSION_BACKENDS:
+        raise ValueError(f"Unknown session backend '{backend}', expected one of: {', '.join(SESSION_BACKENDS)}.")
+    module, name = SESSION_BACKENDS[backend]
+    return getattr(import_module(module), name)
+
+
+def in_shard(recipient_hash: str, shard: Tuple[int, int]) -> bool:
+    """
+    Whether a recipient belongs to shard `index` of `count`. The hash is
+    random-looking and stable, so every worker agrees and the shards come out even.
+    """
+    index, count = shard
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {index} of {count}.")
+    return int(recipient_hash[:16], 16) % count == index
+
+
+class StoredRecipient(NamedTuple):
+    """
+    Stands in for a recipient that is only known by its hash, like a failed send being retried.
+    """
+    hash_string: str
+
 
 class SessionManager:
-    def __init__(self, session_name: str) -> None:
+    def __init__(
+        self,
+        session_name: str,
+        batch_size: int = 1,
+        flush_interval: float = 1.0,
+        backend: str = DEFAULT_SESSION_BACKEND,
+        sent_cache: Optional[str] = "auto",
+    ) -> None:
+        """
+        Unless `sent_cache` is None, the sent hashes are read into a SentSet
+        on the first lookup, and answered from memory from then on: exactly
+        with "set", through a Bloom filter with "bloom", and with "auto", a
+        set unless the session is too big for one.
+        """
         #Initialize connection
+        store_class = get_store_class(backend)
+        if sent_cache is not None and sent_cache not in SENT_CACHE_MODES:
+            raise ValueError(f"Unknown sent cache mode '{sent_cache}', expected one of: {', '.join(SENT_CACHE_MODES)}.")
+        self.sent_cache = sent_cache
+        self._sent: Optional[SentSet] = None
+        self._sent_lock = threading.Lock()
         self.session_name = session_name
         self.session_name_os_safe = get_os_safe_name(session_name)
         self.logger = Logger()
@@ -30,10 +96,23 @@ class SessionManager:
             self.logger.info(f"Creating new database file: {self.dbfile_path}")
 
         #Initialize database
-        self.db = Database(self.dbfile_path)
+        self.db = store_class(self.dbfile_path, batch_size=batch_size, flush_interval=flush_interval)
     
+    def _get_sent_set(self) -> Optional[SentSet]:
+        if self.sent_cache is None:
+            return None
+        with self._sent_lock:
+            if self._sent is None:
+                self._sent = SentSet.load(self.db, self.sent_cache)
+                self.logger.info(f"Loaded {len(self._sent)} sent recipients into a {self._sent.mode}.")
+            return self._sent
+
     #Filter the recipients whose email wasn't sent in the previous run
     def _filter_unsent_recipients(self, recipients: List[TemplateModelType]) -> List[TemplateModelType]:
+        if self.sent_cache is not None:
+            sent = self.get_sent_hashes(recipient.hash_string for recipient in recipients)
+            return [recipient for recipient in recipients if recipient.hash_string not in sent]
+
         unsent_recipients: List[TemplateModelType] = []
         for recipient in recipients:
             recipient_hash = recipient.hash_string
@@ -41,17 +120,76 @@ class SessionManager:
                 unsent_recipients.append(recipient)
         return unsent_recipients
     
+    def get_sent_hashes(self, recipient_hashes: Iterable[str]) -> Set[str]:
+        sent_set = self._get_sent_set()
+        if sent_set is None:
+            return self.db.get_sent_hashes(recipient_hashes)
+        return sent_set.get_sent_hashes(recipient_hashes, self.db)
+
     def filter_sent_recipients(self, recipients: List[TemplateModelType]) -> List[TemplateModelType]:
-        sent: List[str] = [r['recipient_hash'] for r in self.db.get_sent_recipients()]
-        return [recipient for recipient in recipients if recipient.hash_string in sent]
+        hashes = [recipient.hash_string for recipient in recipients]
+        sent = self.get_sent_hashes(hashes)
+        return [recipient for recipient, recipient_hash in zip(recipients, hashes) if recipient_hash in sent]
     
     def get_sent_recipients(self) -> List[Dict[str, Any]]:
         return self.db.get_sent_recipients()
     
-    def add_recipient(self, recipient: TemplateModel) -> None:
-        recipient_hash = recipient.hash_string
-        if not self.db.check_recipient_sent(recipient_hash):
-            self.db.insert_recipient(recipient_hash)
+    def add_recipient(self, recipient: "TemplateModel") -> None:
+        self.add_recipient_hash(recipient.hash_string)
+
+    def add_recipient_hash(self, recipient_hash: str) -> None:
+        # the insert ignores recipients that are already recorded,
+        # so there's no need to look them up first
+        self.db.insert_recipient(recipient_hash)
+        with self._sent_lock:
+            if self._sent is not None:
+                self._sent.add(recipient_hash)
+
+    def claim_recipients(
+        self, recipients: List[TemplateModelType], worker_id: str, ttl: float = DEFAULT_LEASE_TTL
+    ) -> List[TemplateModelType]:
+        """
+        Claim unsent recipients for this worker, see SessionStore.claim_recipients.
+        Returns the recipients this worker got, in their original order.
+        """
+        hashes = [recipient.hash_string for recipient in recipients]
+        claimed = self.db.claim_recipients(hashes, worker_id, ttl)
+        return [recipient for recipient, recipient_hash in zip(recipients, hashes) if recipient_hash in claimed]
+
+    def renew_leases(self, worker_id: str, ttl: float = DEFAULT_LEASE_TTL) -> int:
+        return self.db.renew_leases(worker_id, ttl)
+
+    def release_leases(self, worker_id: str) -> int:
+        return self.db.release_leases(worker_id)
+
+    def record_failure(self, recipient: "TemplateModel", payload: Dict[str, Any], reply: str, retryable: bool = True) -> int:
+        return self.db.record_failure(recipient.hash_string, json.dumps(payload), reply, retryable=retryable)
+
+    def get_due_failures(self, limit: Optional[int] = None, max_attempts: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Failed sends that are due for a retry, as rows ready for MailSender.send_bulk_mail.
+        """
+        rows = []
+        for failure in self.db.get_due_failures(limit=limit, max_attempts=max_attempts):
+            row = json.loads(failure["payload"])
+            row["object"] = StoredRecipient(failure["recipient_hash"])
+            rows.append(row)
+        return rows
+
+    def get_failed_recipients(self) -> List[Dict[str, Any]]:
+        return self.db.get_failed_recipients()
+
+    def clear_sent_failures(self) -> int:
+        return self.db.clear_sent_failures()
+
+    def flush(self) -> None:
+        self.db.flush()
+
+    def close(self) -> None:
+        """
+        Write what's pending and close the session's store. Other sessions stay open.
+        """
+        self.db.close()
 
     def get_current_session_id(self) -> str:
         return self.session_name_os_safe
\ No newline at end of file
@@ -0,0 +1,311 @@
+import datetime
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from smartmailer.session_management.store import (
+    BUSY_TIMEOUT, IN_QUERY_CHUNK_SIZE, SCHEMA_VERSION, SessionStore, SharedResources,
+)
+from smartmailer.utils.strings import get_hash
+
+# how SQLAlchemy writes DateTime columns to SQLite, so both stores can read each other's files
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+DATETIME_COLUMNS = {"sent_time", "last_attempt_at", "next_attempt_at", "expires_at"}
+
+# the same tables Database creates
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS sent (
+        recipient_hash VARCHAR NOT NULL,
+        sent_time DATETIME,
+        PRIMARY KEY (recipient_hash)
+    )""",
+    """CREATE TABLE IF NOT EXISTS failed (
+        recipient_hash VARCHAR NOT NULL,
+        payload TEXT NOT NULL,
+        attempts INTEGER NOT NULL,
+        last_reply TEXT,
+        last_attempt_at DATETIME,
+        next_attempt_at DATETIME,
+        PRIMARY KEY (recipient_hash)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_failed_next_attempt_at ON failed (next_attempt_at)",
+    """CREATE TABLE IF NOT EXISTS leases (
+        recipient_hash VARCHAR NOT NULL,
+        worker_id VARCHAR NOT NULL,
+        expires_at DATETIME NOT NULL,
+        PRIMARY KEY (recipient_hash)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_leases_expires_at ON leases (expires_at)",
+)
+
+INSERT_SENT = "INSERT OR IGNORE INTO sent (recipient_hash, sent_time) VALUES (?, ?)"
+IS_SENT = "SELECT 1 FROM sent WHERE recipient_hash = ?"
+CLAIM_LEASE = """
+    INSERT INTO leases (recipient_hash, worker_id, expires_at) VALUES (?, ?, ?)
+    ON CONFLICT (recipient_hash) DO UPDATE
+    SET worker_id = excluded.worker_id, expires_at = excluded.expires_at
+    WHERE leases.expires_at <= ? OR leases.worker_id = excluded.worker_id
+"""
+
+
+def _to_sql(value: Optional[datetime.datetime]) -> Optional[str]:
+    return value.strftime(DATETIME_FORMAT) if value is not None else None
+
+
+def _from_sql(value: Optional[str]) -> Optional[datetime.datetime]:
+    return datetime.datetime.fromisoformat(value) if value is not None else None
+
+
+def _placeholders(count: int) -> str:
+    return ", ".join("?" * count)
+
+
+class _SharedConnection(NamedTuple):
+    connection: sqlite3.Connection
+    # stores on the same file take turns on the connection through this
+    lock: threading.RLock
+
+
+def _open_connection(dbfile_path: str, synchronous: str) -> _SharedConnection:
+    # autocommit, transactions are begun explicitly where several statements need one.
+    # several workers may share one session file, so wait for each other's writes
+    connection = sqlite3.connect(dbfile_path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+    # WAL lets readers and the writer work side by side, see Database._configure_connection
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(f"PRAGMA synchronous={synchronous}")
+    return _SharedConnection(connection, threading.RLock())
+
+
+# one connection per session file and synchronous mode, shared by every SQLiteStore open on it
+CONNECTIONS: SharedResources[_SharedConnection] = SharedResources(
+    _open_connection, lambda shared: shared.connection.close()
+)
+
+
+class SQLiteStore(SessionStore):
+    """
+    A session store on the sqlite3 module, without SQLAlchemy.
+
+    It keeps one connection open for its whole life, and every statement is
+    a fixed string, so sqlite3's statement cache prepares each one once.
+    A lookup or insert is then a single call into SQLite, with no engine,
+    ORM session or SQL compilation in between. The connection is shared by
+    the sending threads, and by other stores on the same file, which take
+    turns through a lock.
+    """
+
+    def __init__(self, dbfile_path: str, batch_size: int = 1, flush_interval: float = 1.0):
+        super().__init__(batch_size=batch_size, flush_interval=flush_interval)
+        self.logger.info(f"Initializing sqlite3 session store at {dbfile_path}")
+
+        self.dbfile_path = dbfile_path
+        self._shared: Optional[_SharedConnection] = CONNECTIONS.acquire(dbfile_path, self.synchronous)
+        self.connection: Optional[sqlite3.Connection] = self._shared.connection
+        self._lock = self._shared.lock
+
+        with self._transaction() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        self._migrate()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        BEGIN IMMEDIATE ... COMMIT, or ROLLBACK if the block raises. Takes the
+        write lock up front, so reads in the block see what it's about to change.
+        """
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def _migrate(self) -> None:
+        with self._transaction() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0] or 0
+            if version >= SCHEMA_VERSION:
+                return
+
+            if version < 1:
+                # sessions created before v1 keyed recipients by the raw JSON of their
+                # fields; the key is now the SHA-256 digest of that same JSON
+                rows = conn.execute("SELECT recipient_hash, sent_time FROM sent").fetchall()
+                legacy = [row for row in rows if not self._is_digest(row[0])]
+                if legacy:
+                    self.logger.info(f"Migrating {len(legacy)} recipient keys to digests.")
+                    conn.executemany("DELETE FROM sent WHERE recipient_hash = ?", [(h,) for h, _ in legacy])
+                    conn.executemany(INSERT_SENT, [(get_hash(h), t) for h, t in legacy])
+
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _query(self, sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            cursor = self.connection.execute(sql, tuple(params))
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        return [
+            {
+                column: _from_sql(value) if column in DATETIME_COLUMNS else value
+                for column, value in zip(columns, row)
+            }
+            for row in rows
+        ]
+
+    def _insert_sent(self, recipient_hash: str, sent_time: datetime.datetime) -> Optional[int]:
+        with self._lock:
+            cursor = self.connection.execute(INSERT_SENT, (recipient_hash, _to_sql(sent_time)))
+            return cursor.lastrowid if cursor.rowcount else None
+
+    def _insert_sent_many(self, rows: List[Tuple[str, datetime.datetime]]) -> int:
+        with self._transaction() as conn:
+            cursor = conn.executemany(INSERT_SENT, [(h, _to_sql(t)) for h, t in rows])
+            return cursor.rowcount
+
+    def _is_sent(self, recipient_hash: str) -> bool:
+        with self._lock:
+            return self.connection.execute(IS_SENT, (recipient_hash,)).fetchone() is not None
+
+    def _select_sent(self, recipient_hashes: List[str]) -> Iterable[str]:
+        sql = f"SELECT recipient_hash FROM sent WHERE recipient_hash IN ({_placeholders(len(recipient_hashes))})"
+        with self._lock:
+            return [row[0] for row in self.connection.execute(sql, recipient_hashes)]
+
+    def _delete_sent(self, recipient_hash: str) -> None:
+        with self._lock:
+            self.connection.execute("DELETE FROM sent WHERE recipient_hash = ?", (recipient_hash,))
+
+    def get_sent_recipients(self) -> List[Dict[str, Any]]:
+        self.logger.info("Fetching all sent recipients from database.")
+        self.flush()
+        return self._query("SELECT recipient_hash, sent_time FROM sent")
+
+    def count_sent(self) -> int:
+        self.flush()
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM sent").fetchone()[0]
+
+    def iter_sent_hashes(self) -> Iterator[str]:
+        self.flush()
+        # a cursor of its own, so other statements can run while this one is read
+        cursor = self.connection.cursor()
+        with self._lock:
+            cursor.execute("SELECT recipient_hash FROM sent")
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(IN_QUERY_CHUNK_SIZE)
+            if not rows:
+                return
+            for row in rows:
+                yield row[0]
+
+    def record_failure(self, recipient_hash: str, payload: str, reply: str, retryable: bool = True) -> int:
+        now = datetime.datetime.now()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT attempts FROM failed WHERE recipient_hash = ?", (recipient_hash,)).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            next_attempt_at = _to_sql(now + self.retry_delay(attempts)) if retryable else None
+            conn.execute(
+                "INSERT OR REPLACE INTO failed "
+                "(recipient_hash, payload, attempts, last_reply, last_attempt_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (recipient_hash, payload, attempts, reply, _to_sql(now), next_attempt_at),
+            )
+
+        self.logger.info(f"Recorded failure #{attempts} for {recipient_hash}: {reply}")
+        return attempts
+
+    def get_due_failures(
+        self,
+        now: Optional[datetime.datetime] = None,
+        limit: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        self.flush()
+        sql = (
+            "SELECT * FROM failed WHERE next_attempt_at <= ?"
+            " AND NOT EXISTS (SELECT 1 FROM sent WHERE sent.recipient_hash = failed.recipient_hash)"
+        )
+        params: List[Any] = [_to_sql(now or datetime.datetime.now())]
+        if max_attempts is not None:
+            sql += " AND attempts < ?"
+            params.append(max_attempts)
+        sql += " ORDER BY next_attempt_at"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._query(sql, params)
+
+    def get_failed_recipients(self) -> List[Dict[str, Any]]:
+        return self._query("SELECT * FROM failed")
+
+    def clear_sent_failures(self) -> int:
+        self.flush()
+        with self._lock:
+            cursor = self.connection.execute(
+                "DELETE FROM failed WHERE EXISTS (SELECT 1 FROM sent WHERE sent.recipient_hash = failed.recipient_hash)"
+            )
+            return cursor.rowcount
+
+    def claim_recipients(self, recipient_hashes: Iterable[str], worker_id: str, ttl: float) -> Set[str]:
+        hashes = list(dict.fromkeys(recipient_hashes))
+        if not hashes:
+            return set()
+
+        self.flush()
+        now = datetime.datetime.now()
+        expires_at = _to_sql(now + datetime.timedelta(seconds=ttl))
+        claimed: Set[str] = set()
+        with self._transaction() as conn:
+            conn.executemany(CLAIM_LEASE, [(h, worker_id, expires_at, _to_sql(now)) for h in hashes])
+            for start in range(0, len(hashes), IN_QUERY_CHUNK_SIZE):
+                chunk = hashes[start:start + IN_QUERY_CHUNK_SIZE]
+                rows = conn.execute(
+                    f"SELECT recipient_hash FROM leases WHERE recipient_hash IN ({_placeholders(len(chunk))})"
+                    " AND worker_id = ?"
+                    " AND NOT EXISTS (SELECT 1 FROM sent WHERE sent.recipient_hash = leases.recipient_hash)",
+                    [*chunk, worker_id],
+                )
+                claimed.update(row[0] for row in rows)
+
+        self.logger.info(f"Worker {worker_id} claimed {len(claimed)} of {len(hashes)} recipients.")
+        return claimed
+
+    def renew_leases(self, worker_id: str, ttl: float) -> int:
+        expires_at = datetime.datetime.now() + datetime.timedelta(seconds=ttl)
+        with self._lock:
+            cursor = self.connection.execute(
+                "UPDATE leases SET expires_at = ? WHERE worker_id = ?", (_to_sql(expires_at), worker_id)
+            )
+            return cursor.rowcount
+
+    def release_leases(self, worker_id: str) -> int:
+        with self._lock:
+            return self.connection.execute("DELETE FROM leases WHERE worker_id = ?", (worker_id,)).rowcount
+
+    def clear_database(self) -> None:
+        self._clear_pending()
+        with self._transaction() as conn:
+            for table in ("sent", "failed", "leases"):
+                conn.execute(f"DELETE FROM {table}")
+        self.logger.info("Database cleared.")
+
+    def close(self) -> None:
+        if getattr(self, "_shared", None):
+            try:
+                self.flush()
+            finally:
+                self.logger.info("Closing sqlite3 session store.")
+                shared, self._shared, self.connection = self._shared, None, None
+                CONNECTIONS.release(self.dbfile_path, shared, self.synchronous)
+
+    def __del__(self):
+        # see Database.__del__
+        try:
+            if getattr(self, "_shared", None):
+                self.close()
+        except Exception:
+            pass
+
@@ -0,0 +1,345 @@
+import datetime
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Generic, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
+from smartmailer.utils.new_logger import Logger
+
+# bumped whenever stored data needs migrating, tracked in PRAGMA user_version
+SCHEMA_VERSION = 1
+DIGEST_LENGTH = 64
+
+# stay well below SQLite's default limit of 999 bound parameters per statement
+IN_QUERY_CHUNK_SIZE = 500
+
+# failed sends are retried after 5 minutes, then 10, 20... capped at a day
+RETRY_BASE_DELAY = 5 * 60
+RETRY_MAX_DELAY = 24 * 60 * 60
+
+# how long a worker waits on another worker's write before giving up
+BUSY_TIMEOUT = 30.0
+
+MEMORY_PATH = ":memory:"
+
+Resource = TypeVar("Resource")
+
+
+class SharedResources(Generic[Resource]):
+    """
+    The open engines or connections of a backend, one per database file and
+    synchronous mode.
+
+    Every store on the same file with the same mode shares one, and it's closed
+    when the last of them lets go, so a process can keep any number of sessions
+    open side by side. ":memory:" databases are private to the store that
+    opened them.
+    """
+
+    def __init__(self, open: Callable[[str, str], Resource], close: Callable[[Resource], None]) -> None:
+        self._open = open
+        self._close = close
+        self._resources: Dict[Tuple[str, str], Tuple[Resource, int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(path: str) -> str:
+        return path if path == MEMORY_PATH else os.path.realpath(path)
+
+    def acquire(self, path: str, synchronous: str = "FULL") -> Resource:
+        if path == MEMORY_PATH:
+            return self._open(path, synchronous)
+
+        key = (self.key(path), synchronous)
+        with self._lock:
+            resource, users = self._resources.get(key, (None, 0))
+            if resource is None:
+                resource = self._open(path, synchronous)
+            self._resources[key] = (resource, users + 1)
+            return resource
+
+    def release(self, path: str, resource: Resource, synchronous: str = "FULL") -> None:
+        if path == MEMORY_PATH:
+            self._close(resource)
+            return
+
+        key = (self.key(path), synchronous)
+        with self._lock:
+            _, users = self._resources.get(key, (resource, 1))
+            if users > 1:
+                self._resources[key] = (resource, users - 1)
+                return
+            self._resources.pop(key, None)
+        self._close(resource)
+
+    def users(self, path: str) -> int:
+        """
+        How many stores have `path` open.
+        """
+        key = self.key(path)
+        with self._lock:
+            return sum(users for (path_key, _), (_, users) in self._resources.items() if path_key == key)
+
+
+class SessionStore(ABC):
+    """
+    Where a session records sent recipients, failed sends and worker leases.
+
+    Database (SQLAlchemy) and SQLiteStore (plain sqlite3) both implement it
+    on the same file layout, so a session written by one can be resumed with
+    the other. Buffering of sent recipients lives here: with `batch_size` > 1,
+    they're kept in memory and written in one transaction per batch, once
+    `batch_size` rows are pending or `flush_interval` seconds after the first
+    of them was buffered, and on flush()/close(). A crash loses at most the one
+    batch that wasn't flushed yet, so those recipients may be sent again on resume.
+    """
+
+    def __init__(self, batch_size: int = 1, flush_interval: float = 1.0) -> None:
+        self.logger = Logger()
+        if batch_size < 1:
+            raise ValueError("Batch size must be at least 1.")
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, datetime.datetime] = {}
+        self._pending_lock = threading.Lock()
+        # one flush at a time, so close() waits for a timed flush that's underway
+        self._flush_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        self._last_flush = time.monotonic()
+
+    @property
+    def buffered(self) -> bool:
+        return self.batch_size > 1
+
+    @property
+    def synchronous(self) -> str:
+        # unbatched rows are fsynced as they're committed. With batching a crash
+        # can already lose the pending batch, so WAL may skip fsyncs until a
+        # checkpoint too: a committed batch survives a process crash, though
+        # not necessarily a power loss
+        return "NORMAL" if self.buffered else "FULL"
+
+    @property
+    def _timed_flush(self) -> bool:
+        # whether the flush timer may write from its own thread
+        return True
+
+    @staticmethod
+    def _is_digest(recipient_hash: str) -> bool:
+        if len(recipient_hash) != DIGEST_LENGTH:
+            return False
+        try:
+            int(recipient_hash, 16)
+        except ValueError:
+            return False
+        return True
+
+    @staticmethod
+    def retry_delay(attempts: int) -> datetime.timedelta:
+        seconds = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** max(0, attempts - 1))
+        return datetime.timedelta(seconds=seconds)
+
+    def insert_recipient(self, recipient_hash: str) -> Optional[int]:
+        if self.buffered:
+            return self._buffer_recipient(recipient_hash)
+
+        rowid = self._insert_sent(recipient_hash, datetime.datetime.now())
+        if rowid is None:
+            self.logger.info(f"Recipient {recipient_hash} already exists. Skipping insert.")
+        else:
+            self.logger.info(f"Recipient {recipient_hash} inserted successfully.")
+        return rowid
+
+    def _buffer_recipient(self, recipient_hash: str) -> None:
+        with self._pending_lock:
+            if recipient_hash in self._pending:
+                self.logger.info(f"Recipient {recipient_hash} already pending. Skipping insert.")
+                return None
+            self._pending[recipient_hash] = datetime.datetime.now()
+            due = (
+                len(self._pending) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+            if not due and self._flush_timer is None and self._timed_flush:
+                # without it the last rows of a run would wait for an insert
+                # that never comes, or for close()
+                self._flush_timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+        if due:
+            self.flush()
+        return None
+
+    def _flush_on_timer(self) -> None:
+        try:
+            self.flush()
+        except Exception as e:
+            # the rows stay pending for the next insert, flush() or close()
+            self.logger.error(f"Timed flush failed: {e}")
+
+    def _cancel_flush_timer(self) -> None:
+        with self._pending_lock:
+            timer, self._flush_timer = self._flush_timer, None
+        if timer is not None:
+            timer.cancel()
+
+    def flush(self) -> int:
+        """
+        Write all buffered recipients in a single transaction.
+        Returns the number of rows that were actually inserted.
+        """
+        self._cancel_flush_timer()
+        with self._flush_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+                self._last_flush = time.monotonic()
+
+            if not pending:
+                return 0
+
+            try:
+                inserted = self._insert_sent_many(list(pending.items()))
+            except Exception:
+                with self._pending_lock:
+                    # put them back so a later flush can retry
+                    pending.update(self._pending)
+                    self._pending = pending
+                raise
+
+        self.logger.info(f"Flushed {len(pending)} recipients to the database.")
+        return inserted
+
+    def _clear_pending(self) -> None:
+        with self._pending_lock:
+            self._pending = {}
+
+    def check_recipient_sent(self, recipient_hash: str) -> bool:
+        with self._pending_lock:
+            if recipient_hash in self._pending:
+                return True
+        return self._is_sent(recipient_hash)
+
+    def get_sent_hashes(self, recipient_hashes: Iterable[str]) -> Set[str]:
+        """
+        Returns the subset of `recipient_hashes` that is already marked as sent.
+        Looks hashes up in chunks through the primary key index instead of loading the whole table.
+        """
+        hashes = list(dict.fromkeys(recipient_hashes))
+        with self._pending_lock:
+            sent: Set[str] = {h for h in hashes if h in self._pending}
+        for start in range(0, len(hashes), IN_QUERY_CHUNK_SIZE):
+            sent.update(self._select_sent(hashes[start:start + IN_QUERY_CHUNK_SIZE]))
+        return sent
+
+    def delete_recipient(self, recipient_hash: str) -> None:
+        self.logger.info(f"Trying to delete recipient with hash {recipient_hash}.")
+        self.flush()
+        if not self.check_recipient_sent(recipient_hash):
+            self.logger.error(f"{recipient_hash} not found. Cannot delete.")
+            raise ValueError(f"Recipient with hash {recipient_hash} not found in the database.")
+
+        self._delete_sent(recipient_hash)
+        self.logger.info(f"{recipient_hash} deleted successfully.")
+
+    # storage, implemented by each backend
+
+    @abstractmethod
+    def _insert_sent(self, recipient_hash: str, sent_time: datetime.datetime) -> Optional[int]:
+        """
+        Insert one sent recipient. Returns its rowid, or None if it was already there.
+        """
+
+    @abstractmethod
+    def _insert_sent_many(self, rows: List[Tuple[str, datetime.datetime]]) -> int:
+        """
+        Insert (hash, sent_time) rows in one transaction, skipping ones already
+        there. Returns how many were inserted.
+        """
+
+    @abstractmethod
+    def _is_sent(self, recipient_hash: str) -> bool:
+        pass
+
+    @abstractmethod
+    def _select_sent(self, recipient_hashes: List[str]) -> Iterable[str]:
+        """
+        The given hashes that are stored as sent. Called with at most IN_QUERY_CHUNK_SIZE at a time.
+        """
+
+    @abstractmethod
+    def _delete_sent(self, recipient_hash: str) -> None:
+        pass
+
+    @abstractmethod
+    def get_sent_recipients(self) -> List[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def count_sent(self) -> int:
+        pass
+
+    @abstractmethod
+    def iter_sent_hashes(self) -> Iterator[str]:
+        """
+        Every hash stored as sent, streamed rather than loaded in one list.
+        """
+
+    @abstractmethod
+    def record_failure(self, recipient_hash: str, payload: str, reply: str, retryable: bool = True) -> int:
+        """
+        Record a failed send, backing the next attempt off exponentially.
+        Returns how many times sending to this recipient has failed.
+        """
+
+    @abstractmethod
+    def get_due_failures(
+        self,
+        now: Optional[datetime.datetime] = None,
+        limit: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Failures whose next attempt is due, oldest first. Recipients sent since they failed are left out.
+        """
+
+    @abstractmethod
+    def get_failed_recipients(self) -> List[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def clear_sent_failures(self) -> int:
+        """
+        Drop failures for recipients that have been sent since.
+        """
+
+    @abstractmethod
+    def claim_recipients(self, recipient_hashes: Iterable[str], worker_id: str, ttl: float) -> Set[str]:
+        """
+        Claim the given recipients for `worker_id` for `ttl` seconds, and
+        return the ones it got: those not sent yet, and not claimed by another
+        worker whose lease is still running. Leases of workers that died are
+        taken over once they expire. The claim is one transaction, so two
+        workers never get the same recipient.
+        """
+
+    @abstractmethod
+    def renew_leases(self, worker_id: str, ttl: float) -> int:
+        """
+        Extend every lease `worker_id` holds by `ttl` seconds from now.
+        """
+
+    @abstractmethod
+    def release_leases(self, worker_id: str) -> int:
+        pass
+
+    @abstractmethod
+    def clear_database(self) -> None:
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        """
+        Flush pending recipients and let go of the connection.
+        """
@@ -1,12 +1,25 @@
-import smartmailer
+import asyncio
+import os
+import time
 from smartmailer.core.template.engine import TemplateEngine
 from smartmailer.core.mailer import MailSender
+from smartmailer.core.async_mailer import AsyncMailSender
+from smartmailer.core.outbox import Outbox
+from smartmailer.config import DB_FOLDER
 from smartmailer.core.template.engine import AbstractTemplateEngine
-from smartmailer.session_management.session_manager import SessionManager
-from typing import List
+from smartmailer.session_management.session_manager import (
+    DEFAULT_LEASE_TTL, DEFAULT_SESSION_BACKEND, SessionManager, default_worker_id, in_shard,
+)
+from itertools import islice
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, Optional, Sized, Tuple
 from smartmailer.utils.new_logger import Logger
+from smartmailer.utils.iterables import chunked
+from smartmailer.utils.metrics import SendStats
 from smartmailer.utils.types import TemplateModelType
 
+# recipients are filtered against the session and rendered this many at a time
+RENDER_CHUNK_SIZE = 500
+
 
 class SmartMailer:
     def __init__(self,
@@ -15,20 +28,30 @@ class SmartMailer:
                  provider: str,
                  session_name: str,
                  log_to_file: bool = False,
-                 log_level: str = 'WARNING'):
+                 log_level: str = 'WARNING',
+                 pool_size: int = 1,
+                 db_batch_size: int = 1,
+                 session_backend: str = DEFAULT_SESSION_BACKEND,
+                 sent_cache: Optional[str] = "auto"):
 
         # todo: use the new logger everywhere
         self.logger = Logger(log_to_file=log_to_file, log_level=log_level)
 
         self.logger.info(f"Initializing SmartMailer for {sender_email} with provider {provider} and session '{session_name}'")
-        self.mailer = MailSender(sender_email, password, provider)
-        self.session_manager = SessionManager(session_name)
+        self.mailer = MailSender(sender_email, password, provider, pool_size=pool_size)
+        self.sender_email = sender_email
+        self.provider = provider
+        self._password = password
+        self._async_mailer: Optional[AsyncMailSender] = None
+        self.session_manager = SessionManager(
+            session_name, batch_size=db_batch_size, backend=session_backend, sent_cache=sent_cache
+        )
         # print(f"SmartMailer initialized for {sender_email} with provider {provider} and session '{session_name}'")
         # print(f"{len(self.session_manager.get_sent_recipients())} recipients already sent in this session.")
 
-    def send_emails(
+    def _iter_rendered_emails(
         self,
-        recipients: List[TemplateModelType],
+        recipients: Iterable[TemplateModelType],
         email_field: str,
         template: AbstractTemplateEngine,
         attachment_paths = None,
@@ -36,66 +59,379 @@ class SmartMailer:
         bcc= None,
         cc_field: str = "cc",
         bcc_field: str = "bcc",
-        attachment_field: str = "attachments"
-        ):
+        attachment_field: str = "attachments",
+        render_processes: Optional[int] = None,
+        worker_id: Optional[str] = None,
+        shard: Optional[Tuple[int, int]] = None,
+        lease_ttl: float = DEFAULT_LEASE_TTL,
+        stats: Optional[SendStats] = None
+        ) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily filter and render recipients, one chunk at a time,
+        so only a chunk of recipients is ever held in memory.
+        With a `worker_id`, each chunk's recipients are claimed before they're
+        rendered, and ones claimed by other workers are left to them.
+        Skipped recipients, render failures and render timings go into `stats`.
+        """
         all_attachment_paths = attachment_paths or []
         all_cc = cc or []
         all_bcc = bcc or []
     
-        self.logger.info(f"Preparing to send emails to {len(recipients)} recipients.")
+        if isinstance(recipients, Sized):
+            self.logger.info(f"Preparing to send emails to {len(recipients)} recipients.")
 
-        
-        sent = self.session_manager.filter_sent_recipients(recipients)
-        print(f"{len(sent)} recipients already sent.")
-        rendered_emails = []
-        
-        for recipient in recipients:
-            if recipient in sent: 
-                print(f"{recipient.__dict__[email_field]} already sent, skipping.")
-                continue
+        skipped = 0
+        elsewhere = 0
+        def unsent_recipients() -> Iterator[TemplateModelType]:
+            nonlocal skipped, elsewhere
+            last_renewal = time.monotonic()
+            for chunk in chunked(recipients, RENDER_CHUNK_SIZE):
+                if shard is not None:
+                    chunk = [recipient for recipient in chunk if in_shard(recipient.hash_string, shard)]
+
+                sent = self.session_manager.filter_sent_recipients(chunk)
+                skipped += len(sent)
+                if stats is not None:
+                    stats.count("skipped", len(sent))
+                # filter_sent_recipients hands back the objects it was given,
+                # so identity is enough and avoids comparing models field by field
+                sent_ids = {id(recipient) for recipient in sent}
+
+                claimed_ids = None
+                if worker_id is not None:
+                    unsent = [recipient for recipient in chunk if id(recipient) not in sent_ids]
+                    claimed = self.session_manager.claim_recipients(unsent, worker_id, lease_ttl)
+                    claimed_ids = {id(recipient) for recipient in claimed}
+                    elsewhere += len(unsent) - len(claimed)
+                    last_renewal = time.monotonic()
+
+                for recipient in chunk:
+                    if id(recipient) in sent_ids: 
+                        self.logger.info(f"{recipient.__dict__[email_field]} already sent, skipping.")
+                        continue
+                    if claimed_ids is not None and id(recipient) not in claimed_ids:
+                        continue
+                    if worker_id is not None and time.monotonic() - last_renewal > lease_ttl / 3:
+                        # sending a chunk can outlast a lease, so keep ours alive
+                        self.session_manager.renew_leases(worker_id, lease_ttl)
+                        last_renewal = time.monotonic()
+                    yield recipient
+
+        parallel = None
+        if render_processes:
+            # only loaded when asked for, it pulls in multiprocessing
+            from smartmailer.core.template.parallel import ParallelRenderer
+            parallel = ParallelRenderer(template, processes=render_processes)  # type: ignore[arg-type]
+            renders = parallel.render(unsent_recipients(), stats=stats)
+        else:
+            renders = self._render_serially(unsent_recipients(), template, stats)
+
+        try:
+            for recipient, rendered, error in renders:
+                try:
+                    if error is not None:
+                        raise error
+                    assert rendered is not None
+                    self.logger.debug(f"Rendered email: {rendered}")
 
+                    rec_attachments = recipient.__dict__.get(attachment_field) or []
+                    rec_cc = recipient.__dict__.get(cc_field) or []
+                    rec_bcc = recipient.__dict__.get(bcc_field) or []
+
+                    combined_attachments = list(set(all_attachment_paths + rec_attachments))
+                    combined_cc = list(set(all_cc + rec_cc))
+                    combined_bcc = list(set(all_bcc + rec_bcc))
+
+                    rendered_email = {
+                        "object": recipient,
+                        "to_email": recipient.__dict__[email_field],
+                        "subject": rendered.get("subject", ""),
+                        "text_content": rendered.get("text", ""),
+                        "html_content": rendered.get("html", None),
+                        "attachments": combined_attachments,
+                        "cc": combined_cc,
+                        "bcc": combined_bcc
+                    }
+                except Exception as e:
+                    self.logger.error(f"Error rendering email for {recipient.__dict__[email_field]}: {e}")
+                    print(f"Error rendering email for {recipient.__dict__[email_field]}: {e}")
+                    if stats is not None:
+                        stats.count("failed")
+                    continue
+
+                yield rendered_email
+        finally:
+            if parallel is not None:
+                parallel.close()
+
+        print(f"{skipped} recipients were already sent and skipped.")
+        if elsewhere:
+            print(f"{elsewhere} recipients are being sent by other workers.")
+
+    @staticmethod
+    def _render_serially(
+        recipients: Iterable[TemplateModelType], template: AbstractTemplateEngine, stats: Optional[SendStats] = None
+    ) -> Iterator[Tuple[TemplateModelType, Optional[Dict[str, Optional[str]]], Optional[Exception]]]:
+        if isinstance(template, TemplateEngine):
+            # render_many times each stage into the campaign's stats
+            for result in template.render_many(recipients, stats=stats):
+                if result.error is not None:
+                    yield result.model, None, result.error  # type: ignore[misc]
+                else:
+                    rendered = {"subject": result.subject, "text": result.text, "html": result.html}
+                    yield result.model, rendered, None  # type: ignore[misc]
+            return
+
+        for recipient in recipients:
             try:
-                rendered = template.render(recipient)
-                print("Rendered email:", rendered)
-
-                rec_attachments = recipient.__dict__.get(attachment_field) or []
-                rec_cc = recipient.__dict__.get(cc_field) or []
-                rec_bcc = recipient.__dict__.get(bcc_field) or []
-
-                combined_attachments = list(set(all_attachment_paths + rec_attachments))
-                combined_cc = list(set(all_cc + rec_cc))
-                combined_bcc = list(set(all_bcc + rec_bcc))
-
-                rendered_email = {
-                    "object": recipient,
-                    "to_email": recipient.__dict__[email_field],
-                    "subject": rendered.get("subject", ""),
-                    "text_content": rendered.get("text", ""),
-                    "html_content": rendered.get("html", None),
-                    "attachments": combined_attachments,
-                    "cc": combined_cc,
-                    "bcc": combined_bcc
-                }
-
-                rendered_emails.append(rendered_email)
+                yield recipient, template.render(recipient), None  # type: ignore[misc]
             except Exception as e:
-                self.logger.error(f"Error rendering email for {recipient.__dict__[email_field]}: {e}")
-                print(f"Error rendering email for {recipient.__dict__[email_field]}: {e}")
+                yield recipient, None, e
 
-        self.mailer.send_bulk_mail(
-            recipients=rendered_emails,
+    def send_emails(
+        self,
+        recipients: Iterable[TemplateModelType],
+        email_field: str,
+        template: AbstractTemplateEngine,
+        attachment_paths = None,
+        cc = None,
+        bcc= None,
+        cc_field: str = "cc",
+        bcc_field: str = "bcc",
+        attachment_field: str = "attachments",
+        show_preview: bool = True,
+        preview_timer: int = 5,
+        render_processes: Optional[int] = None,
+        worker_id: Optional[str] = None,
+        shard: Optional[Tuple[int, int]] = None,
+        lease_ttl: float = DEFAULT_LEASE_TTL,
+        metrics_path: Optional[str] = None,
+        fan_out: Optional[int] = None
+        ) -> SendStats:
+        """
+        Render and send emails to `recipients`, which can be any iterable, including a generator.
+        Recipients are rendered as they are sent, so memory use doesn't grow with the campaign.
+        With `render_processes`, rendering is spread over that many worker processes.
+
+        To split one campaign across several processes on this machine sharing
+        the session, give each a `shard=(index, count)`, or a `worker_id`.
+        Workers claim recipients for `lease_ttl` seconds before sending them,
+        so none is sent twice, and recipients claimed by a worker that died
+        are taken over once its claim runs out.
+
+        With `fan_out`, recipients whose rendered email is identical (and who
+        have no cc or bcc) are sent one message in a shared envelope, up to
+        `fan_out` at a time. The To header then reads "undisclosed-recipients".
+
+        Returns a SendStats with the counts and per-stage timings, which is
+        also written to `metrics_path` in Prometheus text format if it's given.
+        """
+        if shard is not None and worker_id is None:
+            worker_id = default_worker_id()
+
+        stats = SendStats()
+        rendered_emails = self._iter_rendered_emails(
+            recipients, email_field, template, attachment_paths, cc, bcc,
+            cc_field, bcc_field, attachment_field, render_processes,
+            worker_id, shard, lease_ttl, stats
+        )
+
+        try:
+            self.mailer.send_bulk_mail(
+                recipients=rendered_emails,
+                attachment_paths=attachment_paths,
+                cc=cc,
+                bcc=bcc,
+                session_manager=self.session_manager,
+                show_preview=show_preview,
+                preview_timer=preview_timer,
+                stats=stats,
+                fan_out=fan_out
+            )
+        finally:
+            rendered_emails.close()
+            if worker_id is not None:
+                # recipients claimed but not sent, after a stop or a crash of the
+                # mailer, go back to the other workers now instead of at expiry
+                self.session_manager.release_leases(worker_id)
+
+        return self._finish_stats(stats, metrics_path)
+
+    def _finish_stats(self, stats: SendStats, metrics_path: Optional[str]) -> SendStats:
+        stats.finish()
+        if metrics_path:
+            try:
+                stats.write_prometheus(metrics_path)
+            except OSError as e:
+                self.logger.error(f"Couldn't write metrics to {metrics_path}: {e}")
+
+        self.logger.info(f'Completed sending emails: {stats}.')
+        print(f"Completed sending emails: {stats}.")
+        return stats
+
+    def _get_async_mailer(self, concurrency: int) -> AsyncMailSender:
+        if self._async_mailer is None:
+            self._async_mailer = AsyncMailSender(
+                self.sender_email, self._password, self.provider, concurrency=concurrency,
+                # share the limiter so both senders count against the same quota
+                rate_limiter=self.mailer.rate_limiter,
+            )
+        self._async_mailer.concurrency = concurrency
+        return self._async_mailer
+
+    async def _aiter_rendered_emails(self, rendered_emails: Iterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        # render a chunk at a time on a worker thread, so the event loop stays free
+        while True:
+            batch = await asyncio.to_thread(list, islice(rendered_emails, RENDER_CHUNK_SIZE))
+            if not batch:
+                return
+            for rendered_email in batch:
+                yield rendered_email
+
+    async def send_emails_async(
+        self,
+        recipients: Iterable[TemplateModelType],
+        email_field: str,
+        template: AbstractTemplateEngine,
+        attachment_paths = None,
+        cc = None,
+        bcc= None,
+        cc_field: str = "cc",
+        bcc_field: str = "bcc",
+        attachment_field: str = "attachments",
+        concurrency: int = 10,
+        show_preview: bool = True,
+        preview_timer: int = 5,
+        metrics_path: Optional[str] = None
+        ) -> SendStats:
+        """
+        Awaitable counterpart of send_emails.
+        Sends over up to `concurrency` SMTP sessions without blocking the event loop.
+        """
+        stats = SendStats()
+        rendered_emails = self._iter_rendered_emails(
+            recipients, email_field, template, attachment_paths, cc, bcc,
+            cc_field, bcc_field, attachment_field, stats=stats
+        )
+
+        await self._get_async_mailer(concurrency).send_bulk_mail(
+            recipients=self._aiter_rendered_emails(rendered_emails),
             attachment_paths=attachment_paths,
             cc=cc,
             bcc=bcc,
-            session_manager=self.session_manager
+            session_manager=self.session_manager,
+            show_preview=show_preview,
+            preview_timer=preview_timer,
+            stats=stats
+        )
+
+        return self._finish_stats(stats, metrics_path)
+
+    def get_outbox(self, outbox_path: Optional[str] = None) -> Outbox:
+        """
+        The session's outbox, in the sessions folder unless `outbox_path` is given.
+        """
+        if outbox_path is None:
+            session_id = self.session_manager.get_current_session_id()
+            outbox_path = os.path.join(os.getcwd(), DB_FOLDER, f"{session_id}_outbox")
+        return Outbox(outbox_path)
+
+    def spool_emails(
+        self,
+        recipients: Iterable[TemplateModelType],
+        email_field: str,
+        template: AbstractTemplateEngine,
+        attachment_paths = None,
+        cc = None,
+        bcc= None,
+        cc_field: str = "cc",
+        bcc_field: str = "bcc",
+        attachment_field: str = "attachments",
+        render_processes: Optional[int] = None,
+        outbox_path: Optional[str] = None
+        ) -> int:
+        """
+        Render and build the emails like send_emails, but write them to the
+        outbox instead of sending them. Deliver them with drain_outbox(), from
+        this process or another one. Returns how many emails were spooled.
+        """
+        outbox = self.get_outbox(outbox_path)
+        # recipients already waiting in the outbox don't need rendering again
+        waiting = (recipient for recipient in recipients if recipient.hash_string not in outbox)
+        rendered_emails = self._iter_rendered_emails(
+            waiting, email_field, template, attachment_paths, cc, bcc,
+            cc_field, bcc_field, attachment_field, render_processes
+        )
+        spooled = self.mailer.spool_bulk_mail(rendered_emails, outbox, attachment_paths, cc, bcc)
+
+        self.logger.info(f'Spooled {spooled} emails to {outbox.path}.')
+        print(f"Spooled {spooled} emails to {outbox.path}.")
+        return spooled
+
+    def drain_outbox(self, follow: bool = False, poll_interval: float = 1.0, outbox_path: Optional[str] = None) -> int:
+        """
+        Send the emails waiting in the outbox, and record them in the session.
+        With `follow`, keep sending new emails as they're spooled, until interrupted.
+        Returns how many emails were sent.
+        """
+        outbox = self.get_outbox(outbox_path)
+        delivered = self.mailer.send_spooled(outbox, self.session_manager, follow=follow, poll_interval=poll_interval)
+
+        self.logger.info(f'Sent {delivered} emails from the outbox.')
+        print(f"Sent {delivered} emails from the outbox, {len(outbox)} still waiting.")
+        return delivered
+
+    def retry_failed(
+        self,
+        limit: Optional[int] = None,
+        max_attempts: Optional[int] = 5,
+        show_preview: bool = False,
+        preview_timer: int = 5
+        ) -> SendStats:
+        """
+        Resend only the failed emails whose retry is due, as they were rendered the first time.
+        Each failure waits twice as long as the one before it, so this is cheap to run often.
+        Recipients that failed `max_attempts` times, or with a permanent (5xx) reply, are left alone.
+        Returns a SendStats for the retried emails, like send_emails.
+        """
+        stats = SendStats()
+        # failures that were sent since, by a later send_emails or retry, are done with
+        self.session_manager.clear_sent_failures()
+        due = self.session_manager.get_due_failures(limit=limit, max_attempts=max_attempts)
+        if not due:
+            self.logger.info("No failed emails are due for a retry.")
+            print("No failed emails are due for a retry.")
+            stats.finish()
+            return stats
+
+        print(f"Retrying {len(due)} failed emails.")
+        self.mailer.send_bulk_mail(
+            recipients=due,
+            session_manager=self.session_manager,
+            show_preview=show_preview,
+            preview_timer=preview_timer,
+            stats=stats
         )
 
-        self.logger.info('Completed sending emails.')
-        print("Completed sending emails.")
+        self.logger.info(f'Completed retrying failed emails: {stats}.')
+        print(f"Completed retrying failed emails: {stats}.")
+        return stats
 
     def show_sent(self):
         sent = self.session_manager.get_sent_recipients()
         self.logger.info(f"Fetched {len(sent)} sent recipients.")
         print("Sent Recipients:")
         for entry in sent:
-            print(entry)
\ No newline at end of file
+            print(entry)
+
+    def close(self) -> None:
+        """
+        Close this campaign's session. The process can keep running other campaigns.
+        """
+        self.session_manager.close()
+
+    def __enter__(self) -> "SmartMailer":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
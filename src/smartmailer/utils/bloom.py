@@ -0,0 +1,69 @@
+import math
+import threading
+from typing import Tuple
+
+
+class BloomFilter:
+    """
+    A set of strings that only answers "maybe" or "definitely not".
+
+    It takes about 10 bits per item at a 1% error rate, whatever the items
+    are, and never forgets one: a key that was added is always found, while
+    a key that wasn't has an `error_rate` chance of being found anyway.
+    Adding more than `capacity` keys still works, the error rate just rises.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        if capacity < 1:
+            raise ValueError("Capacity must be at least 1.")
+        if not 0 < error_rate < 1:
+            raise ValueError("Error rate must be between 0 and 1.")
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # the standard sizing: m = -n ln p / (ln 2)^2 bits and k = m/n ln 2 hashes
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        # setting a bit is a read-modify-write, so concurrent adds could lose one
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hashes(key: str) -> Tuple[int, int]:
+        # k positions come from the two halves of one 64-bit hash (Kirsch and
+        # Mitzenmacher). str hashes are SipHash, seeded per process and cached
+        # on the string, which is fine as the filter is never saved
+        value = hash(key) & 0xFFFFFFFFFFFFFFFF
+        return value & 0xFFFFFFFF, (value >> 32) | 1
+
+    def add(self, key: str) -> None:
+        first, second = self._hashes(key)
+        size = self.size
+        with self._lock:
+            bits = self.bits
+            for i in range(self.hash_count):
+                position = (first + i * second) % size
+                bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        first, second = self._hashes(key)
+        size = self.size
+        bits = self.bits
+        for i in range(self.hash_count):
+            position = (first + i * second) % size
+            # most keys that were never added stop at the first or second bit
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __len__(self) -> int:
+        """
+        How many keys were added, counting repeats.
+        """
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
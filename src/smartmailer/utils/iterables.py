@@ -0,0 +1,75 @@
+from collections import OrderedDict
+from itertools import chain, islice
+from typing import Callable, Hashable, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """
+    Split an iterable into lists of at most `size` items, lazily.
+
+    Args:
+        iterable (Iterable): The items to split.
+        size (int): The maximum number of items per chunk.
+    Returns:
+        Iterator[List]: The chunks, in order.
+    """
+    if size < 1:
+        raise ValueError("Chunk size must be at least 1")
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def peek(iterable: Iterable[T]) -> Tuple[Optional[T], Iterator[T]]:
+    """
+    Look at the first item of an iterable without losing it.
+
+    Args:
+        iterable (Iterable): The items to look at.
+    Returns:
+        Tuple: The first item (or None if there is none), and an iterator over all the items.
+    """
+    iterator = iter(iterable)
+    for first in iterator:
+        return first, chain([first], iterator)
+    return None, iter(())
+
+def batch_by_key(
+    iterable: Iterable[T], key: Callable[[T], Optional[Hashable]], size: int, window: int
+) -> Iterator[List[T]]:
+    """
+    Gather items with the same key into lists of at most `size` items, lazily.
+
+    Args:
+        iterable (Iterable): The items to gather.
+        key (Callable): Gives each item's key. Items whose key is None are yielded on their own, straight away.
+        size (int): The maximum number of items per list.
+        window (int): How many unfinished lists can be held at once. When another one is needed, the oldest is yielded as it is.
+    Returns:
+        Iterator[List]: The lists, each holding items with one key, in the order they were first seen.
+    """
+    if size < 1 or window < 1:
+        raise ValueError("Size and window must be at least 1")
+
+    batches: "OrderedDict[Hashable, List[T]]" = OrderedDict()
+    for item in iterable:
+        item_key = key(item)
+        if item_key is None:
+            yield [item]
+            continue
+
+        batch = batches.get(item_key)
+        if batch is None:
+            if len(batches) >= window:
+                yield batches.popitem(last=False)[1]
+            batch = batches[item_key] = []
+        batch.append(item)
+        if len(batch) >= size:
+            del batches[item_key]
+            yield batch
+
+    yield from batches.values()
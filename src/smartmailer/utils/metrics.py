@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Dict, Iterator, List, Optional, Tuple
+
+# the stages an email goes through, in order
+STAGES = ("dump", "validate", "render", "mime", "sendmail", "db_insert")
+
+# upper bounds of the latency buckets, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets, like a Prometheus histogram.
+    Not thread-safe on its own, SendStats locks around it.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        # one count per bucket, plus one for everything above the last bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """
+        (upper bound, observations at or below it) pairs, ending with "+Inf".
+        """
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            pairs.append((f"{bound:g}", total))
+        pairs.append(("+Inf", self.count))
+        return pairs
+
+
+class SendStats:
+    """
+    Counts and per-stage latencies for one campaign.
+
+    Returned by send_emails, so you can see where the time went: turning
+    recipients into dicts (dump), validating them, rendering, building the
+    MIME message, the SMTP sendmail call, and recording the recipient in the
+    session (db_insert). Safe to update from several sending threads.
+    """
+
+    def __init__(self) -> None:
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+        self.histograms: Dict[str, Histogram] = {stage: Histogram() for stage in STAGES}
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._started = time.perf_counter()
+        self._finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def count(self, result: str, n: int = 1) -> None:
+        """
+        Add `n` to the "sent", "skipped" or "failed" count.
+        """
+        if result not in ("sent", "skipped", "failed"):
+            raise ValueError(f"Unknown result '{result}'.")
+        with self._lock:
+            setattr(self, result, getattr(self, result) + n)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """
+        Time the block as one observation of `stage`, whether or not it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def finish(self) -> None:
+        if self._finished is None:
+            self._finished = time.perf_counter()
+            self.finished_at = time.time()
+
+    @property
+    def elapsed(self) -> float:
+        end = self._finished if self._finished is not None else time.perf_counter()
+        return end - self._started
+
+    @property
+    def throughput(self) -> float:
+        """
+        Emails sent per second.
+        """
+        elapsed = self.elapsed
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    def report(self) -> str:
+        """
+        A table of how long each stage took.
+        """
+        from tabulate import tabulate
+
+        rows = [
+            [stage, h.count, f"{h.sum:.3f}", f"{h.mean * 1000:.2f}", f"{h.max * 1000:.2f}"]
+            for stage, h in self.histograms.items() if h.count
+        ]
+        return tabulate(rows, headers=["Stage", "Count", "Total (s)", "Mean (ms)", "Max (ms)"])
+
+    def to_prometheus(self, prefix: str = "smartmailer") -> str:
+        """
+        The stats in the Prometheus text exposition format.
+        """
+        lines = [
+            f"# HELP {prefix}_emails_total Emails by result.",
+            f"# TYPE {prefix}_emails_total counter",
+        ]
+        for result in ("sent", "skipped", "failed"):
+            lines.append(f'{prefix}_emails_total{{result="{result}"}} {getattr(self, result)}')
+
+        name = f"{prefix}_stage_duration_seconds"
+        lines += [
+            f"# HELP {name} Time spent per email in each stage.",
+            f"# TYPE {name} histogram",
+        ]
+        with self._lock:
+            for stage, histogram in self.histograms.items():
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum!r}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+        lines += [
+            f"# HELP {prefix}_campaign_duration_seconds How long the campaign ran.",
+            f"# TYPE {prefix}_campaign_duration_seconds gauge",
+            f"{prefix}_campaign_duration_seconds {self.elapsed!r}",
+            f"# HELP {prefix}_emails_per_second Emails sent per second over the campaign.",
+            f"# TYPE {prefix}_emails_per_second gauge",
+            f"{prefix}_emails_per_second {self.throughput!r}",
+            f"# HELP {prefix}_campaign_start_time_seconds When the campaign started, as a Unix timestamp.",
+            f"# TYPE {prefix}_campaign_start_time_seconds gauge",
+            f"{prefix}_campaign_start_time_seconds {self.started_at!r}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, prefix: str = "smartmailer") -> None:
+        """
+        Write the stats to `path`, e.g. for node_exporter's textfile collector.
+        The file is replaced in one go, so a scrape never sees half of it.
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus(prefix))
+        os.replace(tmp_path, path)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.sent} sent, {self.skipped} skipped, {self.failed} failed "
+            f"in {self.elapsed:.1f}s ({self.throughput:.1f} emails/s)"
+        )
+
+
+def timed(stats: Optional[SendStats], stage: str) -> ContextManager[None]:
+    """
+    stats.timer(stage), or a no-op if there are no stats to record into.
+    """
+    if stats is None:
+        return nullcontext()
+    return stats.timer(stage)
@@ -1,13 +1,81 @@
+import atexit
 import os
+import queue
+import sys
+import threading
 from datetime import datetime
-from typing import Optional, TextIO
+from typing import Dict, List, Optional, Union
 
 from smartmailer.utils.shell import get_style
 
-from inspect import getframeinfo, stack
-
 
 LOG_LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+LEVEL_INDEX = {level: index for index, level in enumerate(LOG_LEVELS)}
+# caller files whose relative path is remembered, before the memo starts over
+RELATIVE_PATH_CACHE_SIZE = 256
+
+
+class BackgroundFileWriter:
+    """
+    Appends log lines to a file from a background thread, so logging calls never wait on disk.
+    Lines queued before flush() or close() are guaranteed to be written.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.closed = False
+        self._file = open(path, "w")
+        self._queue: "queue.SimpleQueue[Union[str, threading.Event, None]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="smartmailer-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, line: str) -> None:
+        if not self.closed:
+            self._queue.put(line)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            lines: List[str] = []
+            waiters: List[threading.Event] = []
+            # drain whatever else is queued, so a burst of lines costs one write
+            while True:
+                if item is None:
+                    self._write(lines, waiters)
+                    return
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    lines.append(item)
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._write(lines, waiters)
+
+    def _write(self, lines: List[str], waiters: List[threading.Event]) -> None:
+        if lines:
+            self._file.write("".join(lines))
+            self._file.flush()
+        for waiter in waiters:
+            waiter.set()
+
+    def flush(self) -> None:
+        if self.closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        atexit.unregister(self.close)
 
 
 class Logger:
@@ -20,68 +88,101 @@ class Logger:
 
     def __init__(
             self,
-            log_to_file: bool = False,
-            log_level: str = "INFO"
+            log_to_file: Optional[bool] = None,
+            log_level: Optional[str] = None,
+            include_caller: Optional[bool] = None
         ) -> None:
-
-        self.log_to_file = log_to_file
-        self.log_level = log_level
+        # Logger() with no arguments hands back the shared instance as it was configured
+        if getattr(self, "_configured", False) and log_to_file is None and log_level is None and include_caller is None:
+            return
+        self._configured = True
+
+        previous_handle: Optional[BackgroundFileWriter] = getattr(self, "log_file_handle", None)
+        if previous_handle is not None:
+            previous_handle.close()
+
+        self.log_to_file = bool(log_to_file)
+        self.log_level = log_level or "INFO"
+        self.include_caller = True if include_caller is None else include_caller
         self.log_dir = "smartmailer_logs"
-        self.log_file_handle: Optional[TextIO] = None
+        self.log_file_handle: Optional[BackgroundFileWriter] = None
         self.log_line_format = '%Y-%m-%d %H:%M:%S'
         self.cwd = os.getcwd()
+        self._relative_paths: Dict[str, str] = {}
 
-        if log_level not in LOG_LEVELS:
-            old_level = log_level
+        if self.log_level not in LOG_LEVELS:
+            old_level = self.log_level
             self.log_level = "INFO"
+            self._threshold = LEVEL_INDEX[self.log_level]
             self._log_helper(f"Log Level {old_level} not found in {LOG_LEVELS}. Defaulting to INFO.", "WARNING", datetime.now())
-            
+        self._threshold = LEVEL_INDEX[self.log_level]
+
         if self.log_to_file:
             if not os.path.exists(self.log_dir):
                 os.makedirs(self.log_dir)
             log_filename = datetime.now().strftime("smartmailer-%Y-%m-%d_%H-%M-%S.log")
             log_path = os.path.join(self.log_dir, log_filename)
-            self.log_file_handle = open(log_path, "w")
+            self.log_file_handle = BackgroundFileWriter(log_path)
 
+    def is_enabled_for(self, log_level: str) -> bool:
+        return self._threshold <= LEVEL_INDEX[log_level]
+
+    # each method checks the level before doing any other work,
+    # so filtered-out messages cost a single comparison
 
     def debug(self, message: str) -> None:
-        log_level = "DEBUG"
-        self._log_helper(message, log_level, datetime.now())
+        if self._threshold <= 0:
+            self._log_helper(message, "DEBUG", datetime.now())
 
     def info(self, message: str) -> None:
-        log_level = "INFO"
-        self._log_helper(message, log_level, datetime.now())
+        if self._threshold <= 1:
+            self._log_helper(message, "INFO", datetime.now())
 
     def warning(self, message: str) -> None:
-        log_level = "WARNING"
-        self._log_helper(message, log_level, datetime.now())
+        if self._threshold <= 2:
+            self._log_helper(message, "WARNING", datetime.now())
 
     def error(self, message: str) -> None:
-        log_level = "ERROR"
-        self._log_helper(message, log_level, datetime.now())
+        if self._threshold <= 3:
+            self._log_helper(message, "ERROR", datetime.now())
 
     def critical(self, message: str) -> None:
-        log_level = "CRITICAL"
-        self._log_helper(message, log_level, datetime.now())
+        if self._threshold <= 4:
+            self._log_helper(message, "CRITICAL", datetime.now())
 
 
     def _log_helper(self, message: str, log_level: str, timestamp: datetime) -> None:
-        caller = getframeinfo(stack()[2][0])
-        # entry 0 is this function
-        # entry 1 is what called _log_helper - which is the debug(), info() and family
-        # entry 2 is what called the debug(), info() and such - this is the file which logged the entry
-        # hence the stack()[2]
-        filename = os.path.relpath(caller.filename, self.cwd)
-        # we get the relative path of the filename to the current working directory,
-        # from the absolute path given to us.
-
-        if LOG_LEVELS.index(self.log_level) <= LOG_LEVELS.index(log_level):
-            self._dispatch_message(message, f"{filename} L{caller.lineno}", log_level, timestamp)
+        if self._threshold > LEVEL_INDEX[log_level]:
+            return
+
+        context = "-"
+        if self.include_caller:
+            caller = sys._getframe(2)
+            # frame 0 is this function
+            # frame 1 is what called _log_helper - which is the debug(), info() and family
+            # frame 2 is what called the debug(), info() and such - this is the file which logged the entry
+            context = f"{self._relative_path(caller.f_code.co_filename)} L{caller.f_lineno}"
+
+        self._dispatch_message(message, context, log_level, timestamp)
+
+    def _relative_path(self, filename: str) -> str:
+        # we get the path of the filename relative to the current working directory,
+        # from the absolute path given to us. There are only a handful of files, so remember them.
+        # it's a plain prefix check rather than os.path.relpath, so a patched
+        # os.path (as in tests) can't put a wrong path in the cache
+        relative = self._relative_paths.get(filename)
+        if relative is None:
+            prefix = self.cwd.rstrip(os.sep) + os.sep
+            relative = filename[len(prefix):] if filename.startswith(prefix) else filename
+            if len(self._relative_paths) >= RELATIVE_PATH_CACHE_SIZE:
+                self._relative_paths.clear()
+            self._relative_paths[filename] = relative
+        return relative
 
     def _dispatch_message(self, message: str, file_or_context: str, log_level: str, datetime: datetime) -> None:
         string = f"{datetime.strftime(self.log_line_format)} | {log_level} | {file_or_context} | {message}"
-        if self.log_to_file:
-            self.log_file_handle.write(string)
+        if self.log_to_file and self.log_file_handle is not None:
+            self.log_file_handle.write(string + "\n")
 
         color_map = {
             "INFO": ["bold"],
@@ -91,4 +192,8 @@ class Logger:
         }
         if log_level in color_map:
             string = "".join([get_style(style) for style in color_map[log_level]]) + string + get_style("end")
-        print(string)
\ No newline at end of file
+        print(string)
+
+    def flush(self) -> None:
+        if self.log_file_handle is not None:
+            self.log_file_handle.flush()
@@ -1,5 +1,7 @@
-from typing import TypeVar
-from smartmailer.core.template import TemplateModel
+from typing import TYPE_CHECKING, TypeVar
+
+if TYPE_CHECKING:
+    from smartmailer.core.template import TemplateModel
 
 # make a type for all TemplateModel subclasses
 TemplateModelType = TypeVar('TemplateModelType', bound='TemplateModel')
\ No newline at end of file
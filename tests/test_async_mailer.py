@@ -0,0 +1,338 @@
+import asyncio
+import base64
+import smtplib
+import threading
+import pytest
+from unittest.mock import MagicMock, AsyncMock, patch
+from smartmailer.core.async_mailer import AsyncMailSender, AsyncSMTPConnection, quote_data
+from smartmailer.core.rate_limiter import AdaptiveRateLimiter
+
+
+class FakeSMTPServer:
+    """Tiny in-process SMTP server speaking just enough of the protocol for the tests."""
+
+    def __init__(self, reject=(), delay=0):
+        self.reject = set(reject)
+        self.delay = delay
+        self.messages = []
+        self.auth = []
+        self.sessions = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.sessions += 1
+        def reply(line):
+            writer.write(line.encode() + b"\r\n")
+
+        reply("220 fake ready")
+        rcpts, sender = [], None
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            cmd = line.decode().rstrip("\r\n")
+            upper = cmd.upper()
+            if upper.startswith("EHLO"):
+                reply("250-fake")
+                reply("250 AUTH PLAIN LOGIN")
+            elif upper.startswith("AUTH PLAIN"):
+                self.auth.append(base64.b64decode(cmd.split()[2]))
+                reply("235 ok")
+            elif upper.startswith("MAIL FROM"):
+                sender, rcpts = cmd[10:].strip("<>"), []
+                reply("250 ok")
+            elif upper.startswith("RCPT TO"):
+                addr = cmd[8:].strip("<>")
+                if addr in self.reject:
+                    reply("550 no such user")
+                else:
+                    rcpts.append(addr)
+                    reply("250 ok")
+            elif upper == "DATA":
+                reply("354 go ahead")
+                data = b""
+                while True:
+                    chunk = await reader.readline()
+                    if chunk == b".\r\n":
+                        break
+                    data += chunk
+                await asyncio.sleep(self.delay)
+                self.messages.append((sender, rcpts, data))
+                reply("250 queued")
+            elif upper == "RSET":
+                reply("250 ok")
+            elif upper == "QUIT":
+                reply("221 bye")
+                await writer.drain()
+                break
+            else:
+                reply("502 not implemented")
+            await writer.drain()
+        writer.close()
+
+
+def make_sender(port, concurrency=2, rate_limiter=None):
+    sender = AsyncMailSender(
+        "user@gmail.com", "secret", concurrency=concurrency, use_starttls=False, rate_limiter=rate_limiter)
+    sender.smtp_server, sender.smtp_port = "127.0.0.1", port
+    return sender
+
+
+def test_quote_data_dot_stuffs_and_normalizes():
+    assert quote_data(b"a\n.b\r\nc") == b"a\r\n..b\r\nc\r\n"
+
+
+def test_connection_sends_message():
+    async def scenario():
+        server = FakeSMTPServer()
+        port = await server.start()
+        conn = AsyncSMTPConnection("127.0.0.1", port)
+        await conn.connect()
+        await conn.ehlo()
+        assert conn.has_extn("auth")
+        await conn.login("user", "pw")
+        await conn.sendmail("user@gmail.com", ["a@example.com"], b"Subject: hi\n\n.dot")
+        await conn.quit()
+        await server.stop()
+        return server
+
+    server = asyncio.run(scenario())
+    assert server.auth == [b"\0user\0pw"]
+    sender, rcpts, data = server.messages[0]
+    assert rcpts == ["a@example.com"]
+    assert b"\r\n..dot\r\n" in data
+
+
+def test_connection_raises_when_all_recipients_refused():
+    async def scenario():
+        server = FakeSMTPServer(reject={"bad@example.com"})
+        port = await server.start()
+        conn = AsyncSMTPConnection("127.0.0.1", port)
+        await conn.connect()
+        await conn.ehlo()
+        try:
+            with pytest.raises(smtplib.SMTPRecipientsRefused):
+                await conn.sendmail("user@gmail.com", ["bad@example.com"], b"x")
+        finally:
+            await conn.quit()
+            await server.stop()
+
+    asyncio.run(scenario())
+
+
+def test_connection_closes_when_a_reply_times_out():
+    async def scenario():
+        server = FakeSMTPServer(delay=0.5)
+        port = await server.start()
+        conn = AsyncSMTPConnection("127.0.0.1", port, timeout=0.1)
+        await conn.connect()
+        await conn.ehlo()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await conn.sendmail("user@gmail.com", ["a@example.com"], b"x")
+            assert not conn.is_connected
+        finally:
+            await server.stop()
+
+    asyncio.run(scenario())
+
+
+def test_send_bulk_mail_does_not_reuse_timed_out_sessions():
+    session_manager = MagicMock()
+
+    async def scenario():
+        server = FakeSMTPServer(delay=0.3)
+        port = await server.start()
+        sender = make_sender(port, concurrency=1)
+        sender.timeout = 0.1
+        recipients = [
+            {"object": f"obj{i}", "to_email": f"r{i}@example.com", "subject": "Hi", "text_content": "Hello"}
+            for i in range(3)
+        ]
+        await sender.send_bulk_mail(recipients, session_manager, show_preview=False)
+        await server.stop()
+        return server
+
+    server = asyncio.run(scenario())
+    # every send timed out, so each one needed a new session
+    assert server.sessions == 3
+    session_manager.add_recipient.assert_not_called()
+    assert session_manager.record_failure.call_count == 3
+
+
+def test_send_bulk_mail_reuses_sessions_and_records_success():
+    session_manager = MagicMock()
+
+    async def scenario():
+        server = FakeSMTPServer(reject={"r3@example.com"})
+        port = await server.start()
+        sender = make_sender(port, concurrency=2)
+        recipients = [
+            {"object": f"obj{i}", "to_email": f"r{i}@example.com", "subject": "Hi", "text_content": "Hello"}
+            for i in range(10)
+        ]
+        await sender.send_bulk_mail(recipients, session_manager, show_preview=False)
+        await server.stop()
+        return server
+
+    server = asyncio.run(scenario())
+    assert len(server.messages) == 9
+    assert server.sessions <= 2
+    added = {call.args[0] for call in session_manager.add_recipient.call_args_list}
+    assert added == {f"obj{i}" for i in range(10)} - {"obj3"}
+
+
+def test_send_bulk_mail_records_everything_delivered_before_quota():
+    session_manager = MagicMock()
+
+    async def scenario():
+        server = FakeSMTPServer(delay=0.05)
+        port = await server.start()
+        sender = make_sender(port, concurrency=4, rate_limiter=AdaptiveRateLimiter(daily_quota=5))
+        recipients = [
+            {"object": f"obj{i}", "to_email": f"r{i}@example.com", "subject": "Hi", "text_content": "Hello"}
+            for i in range(20)
+        ]
+        await sender.send_bulk_mail(recipients, session_manager, show_preview=False)
+        await server.stop()
+        return server
+
+    server = asyncio.run(scenario())
+    assert len(server.messages) == 5
+    added = {call.args[0] for call in session_manager.add_recipient.call_args_list}
+    delivered = {rcpts[0] for _, rcpts, _ in server.messages}
+    assert added == {f"obj{i}" for i in range(20) if f"r{i}@example.com" in delivered}
+
+
+def test_cancel_records_rows_already_sent():
+    session_manager = MagicMock()
+
+    async def scenario():
+        server = FakeSMTPServer()
+        port = await server.start()
+        sender = make_sender(port, concurrency=4)
+
+        async def recipients():
+            for i in range(3):
+                yield {"object": f"obj{i}", "to_email": f"r{i}@example.com", "subject": "Hi", "text_content": "Hello"}
+            # the next row never comes, so the three sends are never collected
+            await asyncio.Event().wait()
+
+        task = asyncio.ensure_future(sender.send_bulk_mail(recipients(), session_manager, show_preview=False))
+        while len(server.messages) < 3:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await server.stop()
+
+    asyncio.run(scenario())
+    added = {call.args[0] for call in session_manager.add_recipient.call_args_list}
+    assert added == {"obj0", "obj1", "obj2"}
+    session_manager.flush.assert_called()
+
+
+def test_attachments_are_read_off_the_event_loop(tmp_path):
+    attachment = tmp_path / "report.txt"
+    attachment.write_text("numbers")
+
+    async def scenario():
+        server = FakeSMTPServer()
+        port = await server.start()
+        sender = make_sender(port)
+        connection = await sender._connect_async()
+        loop_thread = threading.get_ident()
+        build = sender.message_builder.build
+        threads = []
+        def spy(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return build(*args, **kwargs)
+        sender.message_builder.build = spy
+
+        assert await sender.send_individual_mail(
+            connection, "a@example.com", subject="Hi", text_content="Hello", attachment_paths=[str(attachment)])
+        await connection.quit()
+        await server.stop()
+        return server, loop_thread, threads
+
+    server, loop_thread, threads = asyncio.run(scenario())
+    assert threads and threads[0] != loop_thread
+    assert b"report.txt" in server.messages[0][2]
+
+
+def test_send_bulk_mail_accepts_async_iterable():
+    session_manager = MagicMock()
+
+    async def rows():
+        for i in range(3):
+            yield {"object": f"obj{i}", "to_email": f"r{i}@example.com", "text_content": "Hello"}
+
+    async def scenario():
+        server = FakeSMTPServer()
+        port = await server.start()
+        await make_sender(port).send_bulk_mail(rows(), session_manager, show_preview=False)
+        await server.stop()
+        return server
+
+    server = asyncio.run(scenario())
+    assert len(server.messages) == 3
+    assert session_manager.add_recipient.call_count == 3
+
+
+def test_send_bulk_mail_connection_error_is_logged():
+    sender = make_sender(1)
+    session_manager = MagicMock()
+    asyncio.run(sender.send_bulk_mail(
+        [{"object": "x", "to_email": "x@example.com", "text_content": "x"}],
+        session_manager,
+        show_preview=False,
+    ))
+    session_manager.add_recipient.assert_not_called()
+
+
+def test_invalid_concurrency():
+    with pytest.raises(ValueError):
+        AsyncMailSender("user@gmail.com", "secret", concurrency=0)
+
+
+@patch("smartmailer.smartmailer.SessionManager")
+@patch("smartmailer.smartmailer.MailSender")
+@patch("smartmailer.smartmailer.AsyncMailSender")
+def test_smartmailer_send_emails_async(mock_async_cls, mock_mailer_cls, mock_session_cls):
+    from smartmailer.smartmailer import SmartMailer
+
+    mock_async = mock_async_cls.return_value
+    consumed = []
+    async def consume(recipients, **kwargs):
+        consumed.extend([row async for row in recipients])
+    mock_async.send_bulk_mail = AsyncMock(side_effect=consume)
+    mock_session_cls.return_value.filter_sent_recipients.return_value = []
+
+    class Dummy:
+        def __init__(self, email):
+            self.__dict__["email"] = email
+
+    template = MagicMock()
+    template.render.return_value = {"subject": "S", "text": "T", "html": None}
+
+    mailer = SmartMailer("sender@example.com", "password", "gmail", "async-session")
+    asyncio.run(mailer.send_emails_async(
+        [Dummy("a@example.com"), Dummy("b@example.com")],
+        email_field="email",
+        template=template,
+        concurrency=5,
+    ))
+
+    mock_async_cls.assert_called_once_with(
+        "sender@example.com", "password", "gmail", concurrency=5, rate_limiter=mailer.mailer.rate_limiter
+    )
+    assert [r["to_email"] for r in consumed] == ["a@example.com", "b@example.com"]
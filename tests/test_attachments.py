@@ -0,0 +1,100 @@
+import os
+import pytest
+from unittest.mock import MagicMock
+from smartmailer.core.attachments import AttachmentCache
+from smartmailer.core.mailer import MailSender
+
+
+def encode(path):
+    from email.mime.application import MIMEApplication
+    with open(path, "rb") as f:
+        return MIMEApplication(f.read(), Name=os.path.basename(path))
+
+
+@pytest.fixture
+def brochure(tmp_path):
+    path = tmp_path / "brochure.pdf"
+    path.write_bytes(b"%PDF" + b"x" * 1000)
+    return str(path)
+
+
+def test_attachment_encoded_once(brochure):
+    encoder = MagicMock(side_effect=encode)
+    cache = AttachmentCache(encoder)
+
+    first = cache.get(brochure)
+    second = cache.get(brochure)
+
+    assert first is second
+    assert encoder.call_count == 1
+    info = cache.cache_info()
+    assert (info.hits, info.misses, info.entries) == (1, 1, 1)
+
+
+def test_modified_file_is_reencoded(brochure):
+    encoder = MagicMock(side_effect=encode)
+    cache = AttachmentCache(encoder)
+    cache.get(brochure)
+
+    with open(brochure, "ab") as f:
+        f.write(b"more")
+    cache.get(brochure)
+
+    assert encoder.call_count == 2
+
+
+def test_eviction_respects_memory_cap(tmp_path):
+    paths = []
+    for name in ["a", "b", "c"]:
+        path = tmp_path / name
+        path.write_bytes(os.urandom(300))
+        paths.append(str(path))
+
+    part_size = len(encode(paths[0]).get_payload())
+    cache = AttachmentCache(encode, max_bytes=part_size * 2)
+    for path in paths:
+        cache.get(path)
+
+    info = cache.cache_info()
+    assert info.entries == 2
+    assert info.current_bytes <= part_size * 2
+    cache.get(paths[0])  # evicted first
+    assert cache.cache_info().misses == 4
+
+
+def test_oversized_attachment_not_cached(brochure):
+    cache = AttachmentCache(encode, max_bytes=10)
+    cache.get(brochure)
+    assert cache.cache_info().entries == 0
+
+
+def test_missing_file_raises(tmp_path):
+    cache = AttachmentCache(encode)
+    with pytest.raises(FileNotFoundError):
+        cache.get(str(tmp_path / "missing.pdf"))
+
+
+def test_clear(brochure):
+    cache = AttachmentCache(encode)
+    cache.get(brochure)
+    cache.clear()
+    assert cache.cache_info().entries == 0
+
+
+def test_mailer_reuses_encoded_attachment(brochure):
+    sender = MailSender("user@gmail.com", "pass")
+    first = sender.message_builder.build("a@example.com", text_content="Hi", attachment_paths=[brochure])
+    second = sender.message_builder.build("b@example.com", text_content="Hi", attachment_paths=[brochure])
+
+    info = sender.serialized_attachment_cache.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+    assert b'filename="brochure.pdf"' in second
+    assert second.count(b"brochure.pdf") == first.count(b"brochure.pdf")
+
+
+def test_prepare_message_doesnt_cache_attachments(brochure):
+    sender = MailSender("user@gmail.com", "pass")
+    message = sender.prepare_message("a@example.com", text_content="Hi", attachment_paths=[brochure])
+
+    assert 'filename="brochure.pdf"' in message.as_string()
+    assert sender.serialized_attachment_cache.cache_info().entries == 0
@@ -0,0 +1,57 @@
+import json
+import os
+import smtplib
+import subprocess
+import sys
+
+BENCHMARKS = os.path.join(os.path.dirname(__file__), "..", "benchmarks")
+sys.path.insert(0, BENCHMARKS)
+
+from smtp_sink import SMTPSink
+
+
+def test_smtp_sink_accepts_messages():
+    with SMTPSink() as sink:
+        server = smtplib.SMTP(*sink.address)
+        server.login("user@example.com", "password")
+        server.sendmail("user@example.com", ["a@example.com", "b@example.com"], "Subject: hi\r\n\r\nbody")
+        server.quit()
+
+    assert sink.messages == 1
+    assert sink.recipients == 2
+    assert sink.bytes > 0
+
+
+def test_throughput_benchmark_smoke(tmp_path):
+    output = tmp_path / "results.json"
+    subprocess.run(
+        [sys.executable, os.path.join(BENCHMARKS, "bench_throughput.py"), "--sizes", "20", "--output", str(output)],
+        check=True, capture_output=True, text=True, timeout=120,
+    )
+    (result,) = json.loads(output.read_text())
+    assert result["delivered"] == 20
+    assert result["msgs_per_sec"] > 0
+    for stage in ["render_us", "prepare_message_us", "build_message_us", "sendmail_us", "db_insert_us"]:
+        assert result[stage] > 0
+
+
+def test_mime_benchmark_smoke(tmp_path):
+    output = tmp_path / "results.json"
+    subprocess.run(
+        [sys.executable, os.path.join(BENCHMARKS, "bench_mime.py"), "--messages", "20", "--output", str(output)],
+        check=True, capture_output=True, text=True, timeout=120,
+    )
+    results = json.loads(output.read_text())
+    assert len(results) == 4
+    assert all(result["speedup"] > 0 for result in results)
+
+
+def test_session_store_benchmark_smoke(tmp_path):
+    output = tmp_path / "results.json"
+    subprocess.run(
+        [sys.executable, os.path.join(BENCHMARKS, "bench_session_store.py"), "--rows", "50", "--output", str(output)],
+        check=True, capture_output=True, text=True, timeout=120,
+    )
+    results = json.loads(output.read_text())
+    assert [result["backend"] for result in results] == ["sqlalchemy", "sqlite3"]
+    assert all(result["lookups_per_s"] > 0 for result in results)
@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+from smartmailer.utils.bloom import BloomFilter
+
+
+def test_added_keys_are_always_found():
+    bloom = BloomFilter(1000)
+    keys = [f"key{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    assert len(bloom) == 1000
+
+
+def test_false_positive_rate_is_near_target():
+    bloom = BloomFilter(10_000, error_rate=0.01)
+    for i in range(10_000):
+        bloom.add(f"sent{i}")
+    false_positives = sum(f"unsent{i}" in bloom for i in range(10_000))
+    assert false_positives < 200
+
+
+def test_sizing():
+    bloom = BloomFilter(1_000_000, error_rate=0.01)
+    # about 9.6 bits and 7 hashes per key
+    assert 1_150_000 < bloom.nbytes < 1_250_000
+    assert bloom.hash_count == 7
+
+
+@pytest.mark.parametrize("capacity, error_rate", [(0, 0.01), (10, 0), (10, 1)])
+def test_invalid_parameters(capacity, error_rate):
+    with pytest.raises(ValueError):
+        BloomFilter(capacity, error_rate)
+
+
+def test_concurrent_adds_keep_every_key():
+    bloom = BloomFilter(40_000)
+
+    def add(worker):
+        for i in range(10_000):
+            bloom.add(f"{worker}-{i}")
+
+    threads = [threading.Thread(target=add, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(f"{worker}-{i}" in bloom for worker in range(4) for i in range(10_000))
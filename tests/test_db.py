@@ -1,10 +1,14 @@
+import multiprocessing
+import time
 import pytest
 from smartmailer.session_management.db import Database
+from smartmailer.session_management.sqlite_store import SQLiteStore
 
 
-@pytest.fixture
-def db_instance():
-    db = Database(":memory:")
+# every store test runs against both backends
+@pytest.fixture(params=[Database, SQLiteStore], ids=["sqlalchemy", "sqlite3"])
+def db_instance(request):
+    db = request.param(":memory:")
     yield db
     db.close()
 
@@ -54,12 +58,322 @@ def test_clear_database(db_instance):
     assert db_instance.get_sent_recipients() == []
 
 
-def test_singleton_behavior():
-    db1 = Database(":memory:")
-    db2 = Database("should_be_ignored.db")
-    assert db1 is db2
+def test_get_sent_hashes(db_instance):
+    for h in ["hash1", "hash2", "hash3"]:
+        db_instance.insert_recipient(h)
+
+    assert db_instance.get_sent_hashes(["hash1", "hash3", "missing"]) == {"hash1", "hash3"}
+    assert db_instance.get_sent_hashes([]) == set()
+
+
+def test_get_sent_hashes_spans_chunks(db_instance):
+    from smartmailer.session_management.db import IN_QUERY_CHUNK_SIZE
+
+    sent = [f"sent{i}" for i in range(IN_QUERY_CHUNK_SIZE + 10)]
+    for h in sent:
+        db_instance.insert_recipient(h)
+    unsent = [f"unsent{i}" for i in range(IN_QUERY_CHUNK_SIZE)]
+
+    assert db_instance.get_sent_hashes(unsent + sent) == set(sent)
+
+
+@pytest.fixture
+def buffered_db(tmp_path):
+    db = Database(str(tmp_path / "buffered.db"), batch_size=3, flush_interval=60)
+    yield db
+    db.close()
+
+
+def _count_rows(db):
+    with db.engine.connect() as conn:
+        return conn.exec_driver_sql("SELECT COUNT(*) FROM sent").scalar()
+
+
+def test_buffered_inserts_flush_by_count(buffered_db):
+    buffered_db.insert_recipient("b1")
+    buffered_db.insert_recipient("b2")
+    assert _count_rows(buffered_db) == 0
+    # pending rows still count as sent
+    assert buffered_db.check_recipient_sent("b1")
+    assert buffered_db.get_sent_hashes(["b1", "b2", "b3"]) == {"b1", "b2"}
+
+    buffered_db.insert_recipient("b3")
+    assert _count_rows(buffered_db) == 3
+
+
+def test_buffered_inserts_flush_by_time(buffered_db):
+    buffered_db.flush_interval = 0
+    buffered_db.insert_recipient("t1")
+    assert _count_rows(buffered_db) == 1
+
+
+@pytest.mark.parametrize("store_class", [Database, SQLiteStore], ids=["sqlalchemy", "sqlite3"])
+def test_buffered_inserts_flush_without_another_insert(tmp_path, store_class):
+    store = store_class(str(tmp_path / "timer.db"), batch_size=100, flush_interval=0.05)
+    store.insert_recipient("last")
+    deadline = time.monotonic() + 5
+    while store._pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not store._pending
+    assert store.count_sent() == 1
+    store.close()
+
+
+def test_buffered_flush_ignores_duplicates(buffered_db):
+    buffered_db.insert_recipient("dup")
+    assert buffered_db.flush() == 1
+    buffered_db.insert_recipient("dup")
+    assert buffered_db.flush() == 0
+    assert buffered_db.flush() == 0
+    assert _count_rows(buffered_db) == 1
+
+
+def test_close_flushes_pending(tmp_path):
+    path = str(tmp_path / "close.db")
+    db = Database(path, batch_size=100, flush_interval=60)
+    db.insert_recipient("pending")
+    db.close()
+
+    reopened = Database(path)
+    assert reopened.check_recipient_sent("pending")
+    reopened.close()
+
+
+def test_wal_mode_enabled(buffered_db):
+    with buffered_db.engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+
+
+@pytest.mark.parametrize("store_class", [Database, SQLiteStore], ids=["sqlalchemy", "sqlite3"])
+def test_only_batched_stores_skip_fsyncs(tmp_path, store_class):
+    path = str(tmp_path / "sync.db")
+    unbatched = store_class(path)
+    batched = store_class(path, batch_size=10)
+    for store, expected in ((unbatched, 2), (batched, 1)):
+        if store_class is Database:
+            with store.engine.connect() as conn:
+                assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == expected
+        else:
+            assert store.connection.execute("PRAGMA synchronous").fetchone()[0] == expected
+        store.close()
+
+
+def test_invalid_batch_size():
+    with pytest.raises(ValueError):
+        Database.__init__(object.__new__(Database), ":memory:", batch_size=0)
+
+
+def test_legacy_json_keys_migrated(tmp_path):
+    import json
+    import sqlite3
+    from smartmailer.utils.strings import get_hash
+
+    path = str(tmp_path / "legacy.db")
+    legacy_key = json.dumps({"name": "ABC", "email": "a@example.com"})
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE sent (recipient_hash VARCHAR NOT NULL PRIMARY KEY, sent_time DATETIME)")
+    conn.execute("INSERT INTO sent VALUES (?, '2025-01-01 10:00:00.000000')", (legacy_key,))
+    conn.commit()
+    conn.close()
+
+    db = Database(path)
+    try:
+        assert db.check_recipient_sent(get_hash(legacy_key))
+        assert not db.check_recipient_sent(legacy_key)
+        entries = db.get_sent_recipients()
+        assert len(entries) == 1
+        assert entries[0]["sent_time"].year == 2025
+    finally:
+        db.close()
+
+
+def test_migration_runs_once(tmp_path):
+    path = str(tmp_path / "fresh.db")
+    db = Database(path)
+    db.insert_recipient("not-a-digest")
+    db.close()
+
+    db = Database(path)
+    try:
+        assert db.check_recipient_sent("not-a-digest")
+    finally:
+        db.close()
+
+
+def _start_worker(store_class, path, barrier, worker):
+    barrier.wait()
+    store = store_class(path)
+    store.insert_recipient(f"worker-{worker}")
+    store.close()
 
-    db1.insert_recipient("singleton_test")
-    assert db2.check_recipient_sent("singleton_test")
 
-    db1.close()
\ No newline at end of file
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+@pytest.mark.parametrize("store_class", [Database, SQLiteStore], ids=["sqlalchemy", "sqlite3"])
+def test_workers_start_on_a_new_file_together(tmp_path, store_class):
+    path = str(tmp_path / "fresh.db")
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(6)
+    workers = [
+        context.Process(target=_start_worker, args=(store_class, path, barrier, i)) for i in range(6)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+    assert [worker.exitcode for worker in workers] == [0] * 6
+
+    store = store_class(path)
+    try:
+        assert store.count_sent() == 6
+    finally:
+        store.close()
+
+
+def test_instances_are_independent(tmp_path):
+    first = Database(str(tmp_path / "first.db"))
+    second = Database(str(tmp_path / "second.db"))
+    try:
+        first.insert_recipient("only-in-first")
+        assert not second.check_recipient_sent("only-in-first")
+    finally:
+        first.close()
+        second.close()
+
+
+def test_memory_databases_are_private():
+    first = Database(":memory:")
+    second = Database(":memory:")
+    first.insert_recipient("private")
+    assert not second.check_recipient_sent("private")
+    first.close()
+    second.close()
+
+
+def test_same_file_shares_one_engine(tmp_path):
+    from smartmailer.session_management.db import ENGINES
+
+    path = str(tmp_path / "shared.db")
+    first = Database(path)
+    second = Database(path)
+    assert first.engine is second.engine
+    assert ENGINES.users(path) == 2
+
+    first.insert_recipient("shared")
+    first.close()
+    # the engine stays open for the other instance
+    assert second.check_recipient_sent("shared")
+    second.close()
+    assert ENGINES.users(path) == 0
+
+    reopened = Database(path)
+    assert reopened.engine is not first.engine
+    reopened.close()
+
+
+def test_close_is_idempotent(tmp_path):
+    from smartmailer.session_management.db import ENGINES
+
+    path = str(tmp_path / "twice.db")
+    db = Database(path)
+    other = Database(path)
+    db.close()
+    db.close()
+    assert ENGINES.users(path) == 1
+    other.close()
+
+def test_del_after_close_logs_nothing(tmp_path):
+    from unittest.mock import MagicMock
+
+    db = Database(str(tmp_path / "del.db"))
+    db.close()
+    db.logger = MagicMock()
+    db.__del__()
+    db.logger.info.assert_not_called()
+
+@pytest.mark.parametrize("store_class", [Database, SQLiteStore], ids=["sqlalchemy", "sqlite3"])
+def test_del_survives_a_torn_down_logger(tmp_path, store_class):
+    store = store_class(str(tmp_path / "shutdown.db"))
+    logger, store.logger = store.logger, None
+    store.__del__()
+    store.logger = logger
+    store.close()
+
+def test_record_failure_backs_off(db_instance):
+    assert db_instance.record_failure("soft", '{"to_email": "a@example.com"}', "421 try later") == 1
+    first = db_instance.get_failed_recipients()[0]
+    assert db_instance.record_failure("soft", '{"to_email": "a@example.com"}', "451 busy") == 2
+    second = db_instance.get_failed_recipients()[0]
+
+    assert second["attempts"] == 2
+    assert second["last_reply"] == "451 busy"
+    first_wait = first["next_attempt_at"] - first["last_attempt_at"]
+    second_wait = second["next_attempt_at"] - second["last_attempt_at"]
+    assert second_wait == first_wait * 2
+
+
+def test_retry_delay_is_capped():
+    assert Database.retry_delay(1).total_seconds() == 5 * 60
+    assert Database.retry_delay(50).total_seconds() == 24 * 60 * 60
+
+
+def test_get_due_failures(db_instance):
+    import datetime
+    later = datetime.datetime.now() + datetime.timedelta(days=2)
+    db_instance.record_failure("due", "{}", "421 try later")
+    db_instance.record_failure("permanent", "{}", "550 no such user", retryable=False)
+    db_instance.record_failure("sent-since", "{}", "421 try later")
+    db_instance.insert_recipient("sent-since")
+
+    assert db_instance.get_due_failures() == []
+    due = db_instance.get_due_failures(now=later)
+    assert [row["recipient_hash"] for row in due] == ["due"]
+    assert db_instance.get_due_failures(now=later, max_attempts=1) == []
+    assert len(db_instance.get_due_failures(now=later, limit=0)) == 0
+
+
+def test_clear_sent_failures(db_instance):
+    db_instance.record_failure("a", "{}", "421 try later")
+    db_instance.record_failure("b", "{}", "421 try later")
+    db_instance.insert_recipient("a")
+
+    assert db_instance.clear_sent_failures() == 1
+    assert [row["recipient_hash"] for row in db_instance.get_failed_recipients()] == ["b"]
+
+
+def test_clear_database_drops_failures(db_instance):
+    db_instance.record_failure("a", "{}", "421 try later")
+    db_instance.clear_database()
+    assert db_instance.get_failed_recipients() == []
+
+
+def test_claim_recipients_is_exclusive(db_instance):
+    assert db_instance.claim_recipients(["a", "b"], "worker-1", ttl=60) == {"a", "b"}
+    assert db_instance.claim_recipients(["b", "c"], "worker-2", ttl=60) == {"c"}
+    # a worker can claim its own recipients again
+    assert db_instance.claim_recipients(["a", "b", "c"], "worker-1", ttl=60) == {"a", "b"}
+
+
+def test_claim_recipients_takes_over_expired_leases(db_instance):
+    db_instance.claim_recipients(["a"], "crashed", ttl=-1)
+    assert db_instance.claim_recipients(["a"], "worker-2", ttl=60) == {"a"}
+
+
+def test_claim_recipients_skips_sent(db_instance):
+    db_instance.insert_recipient("a")
+    assert db_instance.claim_recipients(["a", "b"], "worker-1", ttl=60) == {"b"}
+
+
+def test_renew_and_release_leases(db_instance):
+    db_instance.claim_recipients(["a", "b"], "worker-1", ttl=-1)
+    assert db_instance.renew_leases("worker-1", ttl=60) == 2
+    assert db_instance.claim_recipients(["a"], "worker-2", ttl=60) == set()
+
+    assert db_instance.release_leases("worker-1") == 2
+    assert db_instance.claim_recipients(["a"], "worker-2", ttl=60) == {"a"}
+
+
+def test_count_and_iter_sent_hashes(db_instance):
+    for h in ["hash1", "hash2", "hash3"]:
+        db_instance.insert_recipient(h)
+    assert db_instance.count_sent() == 3
+    assert sorted(db_instance.iter_sent_hashes()) == ["hash1", "hash2", "hash3"]
@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import smartmailer
+
+HEAVY_MODULES = ("sqlalchemy", "pydantic", "jinja2", "tabulate", "multiprocessing")
+
+# generous, a bare import takes a few tens of milliseconds
+IMPORT_BUDGET_SECONDS = 0.3
+
+
+def loaded_after(statement):
+    """
+    Run `statement` in a fresh interpreter and report which heavy modules it loaded,
+    and how long the smartmailer imports took according to -X importtime.
+    """
+    script = (
+        "import sys, json\n"
+        f"{statement}\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        capture_output=True, text=True, check=True, env={**os.environ, "PYTHONPATH": os.path.dirname(smartmailer.__path__[0])},
+    )
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    # each line is "import time: self | cumulative | module", top-level modules aren't indented
+    cumulative_us = sum(
+        int(line.split("|")[1])
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and line.split("|")[2].startswith(" smartmailer")
+    )
+    return loaded, cumulative_us / 1e6
+
+
+def test_import_is_lazy():
+    loaded, seconds = loaded_after("import smartmailer")
+    assert loaded == []
+    assert seconds < IMPORT_BUDGET_SECONDS
+
+
+@pytest.mark.parametrize("statement", [
+    "from smartmailer import MailSender",
+    "from smartmailer.core.async_mailer import AsyncMailSender",
+])
+def test_sending_without_sessions_stays_light(statement):
+    loaded, seconds = loaded_after(statement)
+    assert loaded == []
+    assert seconds < IMPORT_BUDGET_SECONDS
+
+
+def test_names_load_on_first_use():
+    from smartmailer.smartmailer import SmartMailer
+    assert smartmailer.SmartMailer is SmartMailer
+    assert "TemplateModel" in dir(smartmailer)
+    with pytest.raises(AttributeError):
+        smartmailer.NotAThing
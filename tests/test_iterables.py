@@ -0,0 +1,48 @@
+import pytest
+from smartmailer.utils.iterables import batch_by_key, chunked, peek
+
+
+def test_chunked_splits_lazily():
+    consumed = []
+    def numbers():
+        for i in range(5):
+            consumed.append(i)
+            yield i
+
+    chunks = chunked(numbers(), 2)
+    assert next(chunks) == [0, 1]
+    assert consumed == [0, 1]
+    assert list(chunks) == [[2, 3], [4]]
+
+
+def test_chunked_empty():
+    assert list(chunked([], 3)) == []
+
+
+def test_chunked_invalid_size():
+    with pytest.raises(ValueError):
+        list(chunked([1], 0))
+
+
+def test_peek_keeps_first_item():
+    first, items = peek(iter([1, 2, 3]))
+    assert first == 1
+    assert list(items) == [1, 2, 3]
+
+
+def test_peek_empty():
+    first, items = peek([])
+    assert first is None
+    assert list(items) == []
+
+
+def test_batch_by_key_groups_equal_keys():
+    items = ["a1", "b1", "a2", "a3", "x", "b2"]
+    key = lambda item: None if item == "x" else item[0]
+    assert list(batch_by_key(items, key, size=2, window=10)) == [["a1", "a2"], ["x"], ["b1", "b2"], ["a3"]]
+
+
+def test_batch_by_key_window_flushes_oldest():
+    items = ["a1", "b1", "c1", "b2"]
+    # "a" is pushed out when "c" arrives, "b" stays open long enough to fill up
+    assert list(batch_by_key(items, lambda item: item[0], size=2, window=2)) == [["a1"], ["b1", "b2"], ["c1"]]
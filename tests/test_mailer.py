@@ -1,14 +1,23 @@
 import pytest
 from unittest.mock import patch, MagicMock, mock_open
-from smartmailer.core.mailer import MailSender
+from smartmailer.core.mailer import MailSender, SMTPConnectionPool, load_settings
+from smartmailer.core.rate_limiter import AdaptiveRateLimiter, QuotaExceededError
 import smtplib
+import time
 
 SETTINGS_JSON = '{"gmail": ["smtp.gmail.com", 587]}'
 
+@pytest.fixture(autouse=True)
+def clear_settings_cache():
+    # settings are cached by path, and several tests swap the file out under the same path
+    load_settings.cache_clear()
+    yield
+    load_settings.cache_clear()
+
 # ---------- Constructor Tests ----------
 
 @patch("builtins.open", new_callable=mock_open, read_data=SETTINGS_JSON)
-@patch("os.path.join", return_value="settings.json")
+@patch("smartmailer.core.mailer._settings_path", return_value="settings.json")
 def test_init_valid_email(mock_path, mock_file):
     sender = MailSender("user@gmail.com", "pass123")
     assert sender.sender_email == "user@gmail.com"
@@ -16,21 +25,31 @@ def test_init_valid_email(mock_path, mock_file):
     assert sender.smtp_port == 587
 
 @patch("builtins.open", new_callable=mock_open, read_data=SETTINGS_JSON)
-@patch("os.path.join", return_value="settings.json")
+@patch("smartmailer.core.mailer._settings_path", return_value="settings.json")
 def test_init_invalid_email(mock_path, mock_file):
     with pytest.raises(ValueError):
         MailSender("invalid-email", "pass123")
 
 @patch("builtins.open", new_callable=mock_open, read_data=SETTINGS_JSON)
-@patch("os.path.join", return_value="settings.json")
+@patch("smartmailer.core.mailer._settings_path", return_value="settings.json")
 def test_invalid_provider(mock_path, mock_file):
     with pytest.raises(ValueError):
         MailSender("user@gmail.com", "pass123", provider="unknown")
 
+def test_settings_are_read_once(tmp_path):
+    settings_path = tmp_path / "settings.json"
+    settings_path.write_text(SETTINGS_JSON)
+
+    with patch("smartmailer.core.mailer._settings_path", return_value=str(settings_path)), \
+         patch("smartmailer.core.mailer.open", wraps=open) as spy_open:
+        MailSender("user@gmail.com", "pass123")
+        MailSender("other@gmail.com", "pass123")
+    assert spy_open.call_count == 1
+
 # ---------- Message Preparation Tests ----------
 
 @patch("builtins.open", new_callable=mock_open, read_data=SETTINGS_JSON)
-@patch("os.path.join", return_value="settings.json")
+@patch("smartmailer.core.mailer._settings_path", return_value="settings.json")
 def test_prepare_message_basic(mock_path, mock_file):
     sender = MailSender("user@gmail.com", "pass")
     msg = sender.prepare_message(
@@ -48,7 +67,7 @@ def test_prepare_message_basic(mock_path, mock_file):
     assert "<p>Hello</p>" in msg_str
 
 @patch("builtins.open", new_callable=mock_open, read_data=SETTINGS_JSON)
-@patch("os.path.join", return_value="settings.json")
+@patch("smartmailer.core.mailer._settings_path", return_value="settings.json")
 def test_prepare_message_html_only(mock_path, mock_file):
     sender = MailSender("user@gmail.com", "pass")
     msg = sender.prepare_message(
@@ -57,7 +76,7 @@ def test_prepare_message_html_only(mock_path, mock_file):
     )
     assert "<b>Only HTML</b>" in msg.as_string()
 
-@patch("os.path.join", return_value="settings.json")
+@patch("smartmailer.core.mailer._settings_path", return_value="settings.json")
 @patch("smartmailer.core.mailer.open")
 def test_prepare_message_with_attachment(mock_open_func, mock_path):
     def open_side_effect(file, *args, **kwargs):
@@ -77,7 +96,7 @@ def test_prepare_message_with_attachment(mock_open_func, mock_path):
     )
     assert "file.txt" in msg.as_string()
 
-@patch("os.path.join", return_value="settings.json")
+@patch("smartmailer.core.mailer._settings_path", return_value="settings.json")
 @patch("smartmailer.core.mailer.open")
 def test_prepare_message_attachment_failure(mock_open_func, mock_path):
     def open_side_effect(file, *args, **kwargs):
@@ -97,7 +116,7 @@ def test_prepare_message_attachment_failure(mock_open_func, mock_path):
 # ---------- Send Individual Tests ----------
 
 @patch("builtins.open", new_callable=mock_open, read_data=SETTINGS_JSON)
-@patch("os.path.join", return_value="settings.json")
+@patch("smartmailer.core.mailer._settings_path", return_value="settings.json")
 def test_send_individual_mail_success(mock_path, mock_file):
     sender = MailSender("user@gmail.com", "pass")
     mock_server = MagicMock(spec=smtplib.SMTP)
@@ -110,7 +129,7 @@ def test_send_individual_mail_success(mock_path, mock_file):
     assert mock_server.sendmail.called
 
 @patch("builtins.open", new_callable=mock_open, read_data=SETTINGS_JSON)
-@patch("os.path.join", return_value="settings.json")
+@patch("smartmailer.core.mailer._settings_path", return_value="settings.json")
 def test_send_individual_mail_failure(mock_path, mock_file):
     sender = MailSender("user@gmail.com", "pass")
     mock_server = MagicMock(spec=smtplib.SMTP)
@@ -123,7 +142,7 @@ def test_send_individual_mail_failure(mock_path, mock_file):
     assert result is False
 
 @patch("builtins.open", new_callable=mock_open, read_data=SETTINGS_JSON)
-@patch("os.path.join", return_value="settings.json")
+@patch("smartmailer.core.mailer._settings_path", return_value="settings.json")
 def test_send_individual_mail_no_content(mock_path, mock_file):
     sender = MailSender("user@gmail.com", "pass")
     mock_server = MagicMock(spec=smtplib.SMTP)
@@ -160,7 +179,7 @@ def test_preview_email_output(capsys):
 # ---------- Send Bulk Mail ----------
 
 @patch("builtins.open", new_callable=mock_open, read_data=SETTINGS_JSON)
-@patch("os.path.join", return_value="settings.json")
+@patch("smartmailer.core.mailer._settings_path", return_value="settings.json")
 @patch("smtplib.SMTP")
 @patch("time.sleep", return_value=None)
 @patch("smartmailer.core.mailer.MailSender.preview_email")
@@ -187,11 +206,14 @@ def test_send_bulk_mail_basic(mock_exit, mock_preview, mock_sleep, mock_smtp, mo
             "text_content": "Missing email field"
         }
     ]
-    sender.send_bulk_mail(recipients, session_manager=mock_session)
+    stats = sender.send_bulk_mail(recipients, session_manager=mock_session)
 
     assert smtp_instance.sendmail.called
     assert mock_session.add_recipient.called
-    mock_exit.assert_called_once_with(0)
+    assert (stats.sent, stats.failed) == (1, 1)
+    assert stats.histograms["sendmail"].count == 1
+    assert stats.histograms["db_insert"].count == 2  # the insert and the final flush
+    mock_exit.assert_not_called()
 
 @patch("smtplib.SMTP")
 @patch("time.sleep", return_value=None)
@@ -208,16 +230,24 @@ def test_keyboard_interrupt_during_loop(mock_exit, mock_preview, mock_sleep, moc
         "text_content": "Hi"
     }]
     session_manager = MagicMock()
-    sender.send_bulk_mail(recipients, session_manager)
-    mock_exit.assert_called_once_with(0)
+    stats = sender.send_bulk_mail(recipients, session_manager)
+    # stops like the pooled path, returning what was done so far
+    mock_exit.assert_not_called()
+    assert stats.sent == 0
+    session_manager.flush.assert_called_once()
+    smtp_instance.quit.assert_called_once()
 
+@patch("smtplib.SMTP")
 @patch("time.sleep", side_effect=KeyboardInterrupt)
 @patch("sys.exit")
-def test_keyboard_interrupt_before_loop(mock_exit, mock_sleep):
+def test_keyboard_interrupt_before_loop(mock_exit, mock_sleep, mock_smtp):
     sender = MailSender("user@gmail.com", "pass")
     recipients = [{"object": MagicMock(), "to_email": "r@example.com", "text_content": "Hi"}]
-    sender.send_bulk_mail(recipients, session_manager=MagicMock())
-    mock_exit.assert_called_once_with(0)
+    stats = sender.send_bulk_mail(recipients, session_manager=MagicMock())
+    mock_exit.assert_not_called()
+    mock_smtp.return_value.sendmail.assert_not_called()
+    mock_smtp.return_value.quit.assert_called_once()
+    assert stats.sent == 0
 
 @patch("smtplib.SMTP", side_effect=Exception("SMTP error"))
 @patch("sys.exit")
@@ -232,7 +262,7 @@ def test_keyboard_interrupt_on_connect(mock_exit, mock_smtp):
     sender.send_bulk_mail([{"object": MagicMock(), "to_email": "x", "text_content": "x"}], session_manager=MagicMock())
 
 @patch("sys.exit")
-def test_exit_finally(mock_exit):
+def test_send_bulk_mail_returns_instead_of_exiting(mock_exit):
     sender = MailSender("user@gmail.com", "pass")
     recipients = [{
         "object": MagicMock(),
@@ -242,5 +272,349 @@ def test_exit_finally(mock_exit):
     with patch("smtplib.SMTP") as mock_smtp:
         mock_smtp_instance = mock_smtp.return_value
         mock_smtp_instance.sendmail.return_value = None
-        sender.send_bulk_mail(recipients, session_manager=MagicMock())
-    mock_exit.assert_called_once_with(0)
\ No newline at end of file
+        stats = sender.send_bulk_mail(recipients, session_manager=MagicMock())
+    mock_exit.assert_not_called()
+    assert stats is sender.stats
+    assert stats.sent == 1
+    assert stats.finished_at is not None
+
+# ---------- Connection Pool ----------
+
+def test_pool_reuses_connections():
+    factory = MagicMock(side_effect=lambda: MagicMock(spec=smtplib.SMTP))
+    pool = SMTPConnectionPool(factory, size=2)
+
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    assert factory.call_count == 1
+
+    second = pool.acquire()
+    assert second is not first
+    assert factory.call_count == 2
+
+def test_pool_discards_disconnected_connection():
+    factory = MagicMock(side_effect=lambda: MagicMock(spec=smtplib.SMTP))
+    pool = SMTPConnectionPool(factory, size=1)
+
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        with pool.connection():
+            raise smtplib.SMTPServerDisconnected()
+
+    pool.acquire()
+    assert factory.call_count == 2
+
+def test_pool_close_quits_idle_connections():
+    server = MagicMock(spec=smtplib.SMTP)
+    pool = SMTPConnectionPool(lambda: server, size=1)
+    pool.release(pool.acquire())
+    pool.close()
+    server.quit.assert_called_once()
+
+def test_pool_rejects_invalid_size():
+    with pytest.raises(ValueError):
+        SMTPConnectionPool(MagicMock(), size=0)
+
+@patch("smtplib.SMTP")
+@patch("sys.exit")
+def test_send_bulk_mail_pooled(mock_exit, mock_smtp):
+    servers = []
+    def make_server(*args, **kwargs):
+        servers.append(MagicMock())
+        return servers[-1]
+    mock_smtp.side_effect = make_server
+    session_manager = MagicMock()
+
+    sender = MailSender("user@gmail.com", "pass", pool_size=3, rate_limiter=AdaptiveRateLimiter())
+    recipients = [
+        {"object": f"obj{i}", "to_email": f"r{i}@example.com", "text_content": "Hi"}
+        for i in range(20)
+    ]
+    stats = sender.send_bulk_mail(recipients, session_manager=session_manager, show_preview=False)
+
+    added = {call.args[0] for call in session_manager.add_recipient.call_args_list}
+    assert added == {f"obj{i}" for i in range(20)}
+    # never more than pool_size connections, each logged in once and reused
+    assert 1 <= len(servers) <= 3
+    for server in servers:
+        server.login.assert_called_once()
+    assert sum(server.sendmail.call_count for server in servers) == 20
+    assert stats.sent == 20
+    assert stats.histograms["mime"].count == 20
+    mock_exit.assert_not_called()
+
+@patch("smtplib.SMTP")
+@patch("sys.exit")
+def test_send_bulk_mail_pooled_skips_failed(mock_exit, mock_smtp):
+    server = mock_smtp.return_value
+    server.sendmail.side_effect = lambda frm, to, msg: (_ for _ in ()).throw(Exception("fail")) if "bad" in to[0] else {}
+    session_manager = MagicMock()
+
+    sender = MailSender("user@gmail.com", "pass", pool_size=2)
+    recipients = [
+        {"object": "good", "to_email": "good@example.com", "text_content": "Hi"},
+        {"object": "bad", "to_email": "bad@example.com", "text_content": "Hi"},
+    ]
+    sender.send_bulk_mail(recipients, session_manager=session_manager, show_preview=False)
+
+    session_manager.add_recipient.assert_called_once_with("good")
+
+@patch("smtplib.SMTP")
+@patch("sys.exit")
+def test_rows_that_can_never_be_sent_are_permanent_failures(mock_exit, mock_smtp):
+    session_manager = MagicMock()
+    sender = MailSender("user@gmail.com", "pass", rate_limiter=AdaptiveRateLimiter())
+    recipients = [
+        {"object": "missing", "text_content": "Hi"},
+        {"object": "invalid", "to_email": "not-an-address", "text_content": "Hi"},
+        {"object": "empty", "to_email": "empty@example.com"},
+    ]
+    sender.send_bulk_mail(recipients, session_manager=session_manager, show_preview=False)
+
+    mock_smtp.return_value.sendmail.assert_not_called()
+    failures = {call.args[0]: call for call in session_manager.record_failure.call_args_list}
+    assert set(failures) == {"missing", "invalid", "empty"}
+    for call in failures.values():
+        assert call.args[2].startswith("550 ")
+        assert call.kwargs["retryable"] is False
+
+@patch("smtplib.SMTP")
+@patch("sys.exit")
+def test_send_bulk_mail_pooled_replaces_connection_that_fails_probe(mock_exit, mock_smtp):
+    servers = []
+    def make_server(*args, **kwargs):
+        server = MagicMock()
+        server.sendmail.side_effect = lambda frm, to, msg: (_ for _ in ()).throw(
+            smtplib.SMTPDataError(451, b"try again later")) if "bad" in to[0] else {}
+        server.noop.side_effect = smtplib.SMTPServerDisconnected("gone")
+        servers.append(server)
+        return server
+    mock_smtp.side_effect = make_server
+
+    sender = MailSender("user@gmail.com", "pass", pool_size=2, rate_limiter=AdaptiveRateLimiter(cooldown=0))
+    bad = {"object": "bad", "to_email": "bad@example.com", "text_content": "Hi"}
+    good = {"object": "good", "to_email": "good@example.com", "text_content": "Hi"}
+
+    # the failed send is still reported, and the dead connection isn't reused
+    sent, reply = sender._send_batch_pooled([bad])[0]
+    assert not sent and reply.startswith("451")
+    servers[0].quit.assert_called_once()
+    assert sender._send_batch_pooled([good]) == [(True, None)]
+    assert len(servers) == 2
+
+@patch("smtplib.SMTP")
+@patch("sys.exit")
+def test_send_bulk_mail_accepts_generator(mock_exit, mock_smtp):
+    session_manager = MagicMock()
+    sender = MailSender("user@gmail.com", "pass")
+    rows = ({"object": f"obj{i}", "to_email": f"r{i}@example.com", "text_content": "Hi"} for i in range(3))
+
+    with patch.object(sender, "preview_email") as mock_preview:
+        sender.send_bulk_mail(rows, session_manager=session_manager, preview_timer=0)
+
+    assert mock_preview.call_args[0][0]["to_email"] == "r0@example.com"
+    assert mock_smtp.return_value.sendmail.call_count == 3
+    assert session_manager.add_recipient.call_count == 3
+
+@patch("smtplib.SMTP")
+@patch("sys.exit")
+def test_send_bulk_mail_pooled_bounds_in_flight_rows(mock_exit, mock_smtp):
+    session_manager = MagicMock()
+    sender = MailSender("user@gmail.com", "pass", pool_size=2, rate_limiter=AdaptiveRateLimiter())
+    produced = []
+    max_ahead = []
+
+    def rows():
+        for i in range(50):
+            produced.append(i)
+            max_ahead.append(len(produced) - session_manager.add_recipient.call_count)
+            yield {"object": f"obj{i}", "to_email": f"r{i}@example.com", "text_content": "Hi"}
+
+    sender.send_bulk_mail(rows(), session_manager=session_manager, show_preview=False)
+
+    assert session_manager.add_recipient.call_count == 50
+    assert max(max_ahead) <= sender.pool_size * 4 + 1
+
+# ---------- Rate Limiting Tests ----------
+
+def test_provider_limits_are_opt_in():
+    sender = MailSender("user@gmail.com", "pass")
+    assert sender.smtp_server == "smtp.gmail.com"
+    # limits depend on the account, so only throttling replies slow sending down
+    assert sender.rate_limiter.max_per_minute is None
+    assert sender.rate_limiter.daily_quota is None
+
+def test_provider_limits_can_be_set_in_settings(tmp_path):
+    settings_path = tmp_path / "settings.json"
+    settings_path.write_text('{"gmail": {"host": "smtp.gmail.com", "port": 587, "max_per_minute": 60, "daily_quota": 500}}')
+
+    with patch("smartmailer.core.mailer._settings_path", return_value=str(settings_path)):
+        sender = MailSender("user@gmail.com", "pass")
+    assert sender.rate_limiter.max_per_minute == 60
+    assert sender.rate_limiter.daily_quota == 500
+
+@patch("builtins.open", new_callable=mock_open, read_data=SETTINGS_JSON)
+@patch("smartmailer.core.mailer._settings_path", return_value="settings.json")
+def test_legacy_settings_have_no_limits(mock_path, mock_file):
+    sender = MailSender("user@gmail.com", "pass")
+    assert sender.rate_limiter.max_per_minute is None
+    assert sender.rate_limiter.daily_quota is None
+
+def test_throttling_reply_slows_down():
+    limiter = AdaptiveRateLimiter(max_per_minute=60, sleep=lambda s: None)
+    sender = MailSender("user@gmail.com", "pass", rate_limiter=limiter)
+    server = MagicMock()
+    server.sendmail.side_effect = smtplib.SMTPDataError(421, b"4.7.0 Try again later")
+
+    assert sender.send_individual_mail(server, "a@example.com", text_content="Hi") is False
+    assert limiter.throttled == 1
+    assert limiter.per_minute == 30
+
+@patch("smtplib.SMTP")
+@patch("sys.exit")
+def test_send_bulk_mail_stops_at_quota(mock_exit, mock_smtp):
+    session_manager = MagicMock()
+    sender = MailSender("user@gmail.com", "pass", rate_limiter=AdaptiveRateLimiter(daily_quota=2))
+    recipients = [
+        {"object": f"obj{i}", "to_email": f"r{i}@example.com", "text_content": "Hi"}
+        for i in range(5)
+    ]
+    sender.send_bulk_mail(recipients, session_manager=session_manager, show_preview=False)
+
+    assert mock_smtp.return_value.sendmail.call_count == 2
+    assert session_manager.add_recipient.call_count == 2
+
+@patch("smtplib.SMTP")
+@patch("sys.exit")
+def test_failed_sends_do_not_count_against_quota(mock_exit, mock_smtp):
+    def sendmail(frm, to, msg):
+        if to[0] == "bad@example.com":
+            raise smtplib.SMTPRecipientsRefused({"bad@example.com": (550, b"no such user")})
+        return {}
+    mock_smtp.return_value.sendmail.side_effect = sendmail
+    session_manager = MagicMock()
+    sender = MailSender("user@gmail.com", "pass", rate_limiter=AdaptiveRateLimiter(daily_quota=2))
+    recipients = [
+        {"object": name, "to_email": f"{name}@example.com", "text_content": "Hi"}
+        for name in ("bad", "first", "second", "third")
+    ]
+    sender.send_bulk_mail(recipients, session_manager=session_manager, show_preview=False)
+
+    assert mock_smtp.return_value.sendmail.call_count == 3
+    assert [call.args[0] for call in session_manager.add_recipient.call_args_list] == ["first", "second"]
+
+@patch("smtplib.SMTP")
+@patch("sys.exit")
+def test_send_bulk_mail_pooled_stops_at_quota(mock_exit, mock_smtp):
+    session_manager = MagicMock()
+    # slow sends keep several batches in flight when the quota runs out
+    mock_smtp.return_value.sendmail.side_effect = lambda *args: time.sleep(0.05)
+    sender = MailSender("user@gmail.com", "pass", pool_size=4, rate_limiter=AdaptiveRateLimiter(daily_quota=6))
+    recipients = [
+        {"object": f"obj{i}", "to_email": f"r{i}@example.com", "text_content": "Hi"}
+        for i in range(20)
+    ]
+    sender.send_bulk_mail(recipients, session_manager=session_manager, show_preview=False)
+
+    assert mock_smtp.return_value.sendmail.call_count == 6
+    delivered = {call.args[1][0] for call in mock_smtp.return_value.sendmail.call_args_list}
+    added = {call.args[0] for call in session_manager.add_recipient.call_args_list}
+    assert added == {f"obj{i}" for i in range(20) if f"r{i}@example.com" in delivered}
+
+# ---------- Retry Queue Tests ----------
+
+@patch("smtplib.SMTP")
+@patch("sys.exit")
+def test_send_bulk_mail_records_failures(mock_exit, mock_smtp):
+    def sendmail(frm, to, msg):
+        if to[0] == "soft@example.com":
+            raise smtplib.SMTPDataError(451, b"4.3.0 try again later")
+        if to[0] == "hard@example.com":
+            raise smtplib.SMTPRecipientsRefused({"hard@example.com": (550, b"no such user")})
+        return {}
+    mock_smtp.return_value.sendmail.side_effect = sendmail
+    session_manager = MagicMock()
+    sender = MailSender("user@gmail.com", "pass", rate_limiter=AdaptiveRateLimiter(cooldown=0))
+    recipients = [
+        {"object": name, "to_email": f"{name}@example.com", "subject": "Hi", "text_content": "Hello"}
+        for name in ("good", "soft", "hard")
+    ]
+    sender.send_bulk_mail(recipients, session_manager=session_manager, cc=["cc@example.com"], show_preview=False)
+
+    session_manager.add_recipient.assert_called_once_with("good")
+    failures = {call.args[0]: call for call in session_manager.record_failure.call_args_list}
+    assert set(failures) == {"soft", "hard"}
+
+    soft = failures["soft"]
+    payload = soft.args[1]
+    assert payload["to_email"] == "soft@example.com"
+    assert payload["cc"] == ["cc@example.com"]
+    assert soft.args[2] == "451 4.3.0 try again later"
+    assert soft.kwargs["retryable"] is True
+    assert failures["hard"].kwargs["retryable"] is False
+
+# ---------- Shared Envelopes ----------
+
+def announcement(name, **extra):
+    return {"object": name, "to_email": f"{name}@example.com", "subject": "News", "text_content": "Same for all", **extra}
+
+@patch("smtplib.SMTP")
+def test_fan_out_sends_identical_rows_in_one_envelope(mock_smtp):
+    server = mock_smtp.return_value
+    server.has_extn.return_value = False
+    server.sendmail.return_value = {"b@example.com": (550, b"no such user")}
+    session_manager = MagicMock()
+    sender = MailSender("user@gmail.com", "pass", rate_limiter=AdaptiveRateLimiter())
+    recipients = [announcement("a"), announcement("b"), announcement("c"),
+                  announcement("d", text_content="Different"), announcement("e", cc=["boss@example.com"])]
+
+    stats = sender.send_bulk_mail(recipients, session_manager=session_manager, show_preview=False, fan_out=10)
+
+    envelopes = [call.args[1] for call in server.sendmail.call_args_list]
+    assert ["a@example.com", "b@example.com", "c@example.com"] in envelopes
+    assert len(envelopes) == 3
+    shared = server.sendmail.call_args_list[envelopes.index(["a@example.com", "b@example.com", "c@example.com"])]
+    assert b"To: undisclosed-recipients:;" in shared.args[2]
+
+    added = {call.args[0] for call in session_manager.add_recipient.call_args_list}
+    assert added == {"a", "c", "d", "e"}
+    failure = session_manager.record_failure.call_args
+    assert failure.args[0] == "b" and failure.args[2] == "550 no such user"
+    assert (stats.sent, stats.failed) == (4, 1)
+
+@patch("smtplib.SMTP")
+def test_fan_out_respects_batch_size(mock_smtp):
+    server = mock_smtp.return_value
+    server.has_extn.return_value = False
+    server.sendmail.return_value = {}
+    sender = MailSender("user@gmail.com", "pass", rate_limiter=AdaptiveRateLimiter())
+
+    sender.send_bulk_mail([announcement(str(i)) for i in range(5)], session_manager=MagicMock(),
+                          show_preview=False, fan_out=2)
+
+    assert [len(call.args[1]) for call in server.sendmail.call_args_list] == [2, 2, 1]
+
+def test_sendmail_pipelined_writes_the_envelope_at_once():
+    server = MagicMock()
+    server.has_extn.return_value = True
+    server.getreply.side_effect = [(250, b"ok"), (250, b"ok"), (550, b"no such user")]
+    server.data.return_value = (250, b"queued")
+
+    refused = MailSender._sendmail_pipelined(server, "me@example.com", ["a@example.com", "b@example.com"], "msg")
+
+    server.send.assert_called_once_with(
+        "MAIL FROM:<me@example.com>\r\nRCPT TO:<a@example.com>\r\nRCPT TO:<b@example.com>\r\n"
+    )
+    server.data.assert_called_once_with("msg")
+    assert refused == {"b@example.com": (550, b"no such user")}
+    server.sendmail.assert_not_called()
+
+def test_sendmail_pipelined_all_refused():
+    server = MagicMock()
+    server.has_extn.return_value = True
+    server.getreply.side_effect = [(250, b"ok"), (550, b"no"), (550, b"no")]
+
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        MailSender._sendmail_pipelined(server, "me@example.com", ["a@example.com", "b@example.com"], "msg")
+    server.data.assert_not_called()
+    server.rset.assert_called_once()
@@ -0,0 +1,60 @@
+import pytest
+from smartmailer.utils.metrics import Histogram, SendStats, timed
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(seconds)
+
+    assert histogram.cumulative() == [("0.1", 2), ("1", 3), ("+Inf", 4)]
+    assert histogram.sum == pytest.approx(2.65)
+    assert histogram.max == 2.0
+
+
+def test_count_rejects_unknown_result():
+    stats = SendStats()
+    stats.count("sent", 3)
+    assert stats.sent == 3
+    with pytest.raises(ValueError):
+        stats.count("bounced")
+
+
+def test_timer_records_even_when_the_block_raises():
+    stats = SendStats()
+    with pytest.raises(RuntimeError):
+        with stats.timer("render"):
+            raise RuntimeError("boom")
+    assert stats.histograms["render"].count == 1
+
+
+def test_timed_without_stats_is_a_no_op():
+    with timed(None, "render"):
+        pass
+
+
+def test_prometheus_export(tmp_path):
+    stats = SendStats()
+    stats.count("sent", 2)
+    stats.count("skipped")
+    stats.observe("sendmail", 0.2)
+    stats.finish()
+
+    text = stats.to_prometheus()
+    assert 'smartmailer_emails_total{result="sent"} 2' in text
+    assert 'smartmailer_emails_total{result="skipped"} 1' in text
+    assert 'smartmailer_stage_duration_seconds_bucket{stage="sendmail",le="0.25"} 1' in text
+    assert 'smartmailer_stage_duration_seconds_count{stage="sendmail"} 1' in text
+    assert "# TYPE smartmailer_stage_duration_seconds histogram" in text
+
+    path = tmp_path / "smartmailer.prom"
+    stats.write_prometheus(str(path))
+    assert path.read_text() == stats.to_prometheus()
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_elapsed_stops_at_finish():
+    stats = SendStats()
+    stats.finish()
+    assert stats.elapsed == stats.elapsed
+    assert "0 sent, 0 skipped, 0 failed" in str(stats)
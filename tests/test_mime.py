@@ -0,0 +1,77 @@
+import re
+
+import pytest
+
+from smartmailer.core.mailer import MailSender
+from smartmailer.core.mime import HEADER_POLICY, MessageBuilder, fold_header
+
+BOUNDARY = re.compile(rb"={15}\d{19}==")
+
+
+def normalize(message: bytes) -> bytes:
+    # boundaries are random, so number them in the order they appear
+    seen = {}
+    return BOUNDARY.sub(lambda m: seen.setdefault(m.group(), b"BOUNDARY%d" % len(seen)), message)
+
+
+def legacy_bytes(sender, **kwargs):
+    # prepare_message's output as smtplib put it on the wire
+    message = sender.prepare_message(**kwargs).as_string()
+    return re.sub(r"\r\n|\r|\n", "\r\n", message).encode("ascii")
+
+
+@pytest.fixture
+def sender():
+    return MailSender("sender@example.com", "password")
+
+
+@pytest.fixture
+def attachment(tmp_path):
+    path = tmp_path / "brochure.pdf"
+    path.write_bytes(bytes(range(256)) * 40)
+    return str(path)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"text_content": "Hi"},
+    {"html_content": "<p>Hi</p>\n"},
+    {"text_content": "Hi\nthere\r\nold\rmac\n", "html_content": "<b>Hi</b>", "subject": "Hello"},
+    {"text_content": "Grüße aus Köln", "html_content": "<p>Grüße</p>", "subject": "Grüße, Jürgen"},
+    {"text_content": "x" * 5000, "subject": "A very long subject " * 10, "cc": ["a@example.com", "b@example.com"]},
+    {"text_content": ".starts with a dot\nFrom the start\n", "bcc": ["hidden@example.com"]},
+    {"text_content": "Hi", "subject": "line\nbreak"},
+])
+def test_matches_prepare_message(sender, kwargs):
+    built = sender.message_builder.build(to_email="to@example.com", **kwargs)
+    assert normalize(built) == normalize(legacy_bytes(sender, to_email="to@example.com", **kwargs))
+
+
+def test_matches_prepare_message_with_attachments(sender, attachment, tmp_path):
+    other = tmp_path / "Übersicht.txt"
+    other.write_text("notes")
+    kwargs = {
+        "to_email": "to@example.com", "text_content": "See attached", "html_content": "<p>See attached</p>",
+        "attachment_paths": [attachment, str(other), str(tmp_path / "missing.pdf")],
+    }
+    assert normalize(sender.message_builder.build(**kwargs)) == normalize(legacy_bytes(sender, **kwargs))
+
+
+def test_shared_attachment_is_serialized_once(sender, attachment):
+    for i in range(3):
+        sender.message_builder.build(to_email=f"r{i}@example.com", text_content="Hi", attachment_paths=[attachment])
+    info = sender.serialized_attachment_cache.cache_info()
+    assert (info.misses, info.hits) == (1, 2)
+
+
+def test_boundary_never_appears_in_content(monkeypatch):
+    builder = MessageBuilder("sender@example.com", lambda path: b"")
+    boundaries = iter(["=" * 15 + "1" * 19 + "==", "=" * 15 + "2" * 19 + "=="])
+    monkeypatch.setattr(MessageBuilder, "_new_boundary", staticmethod(lambda: next(boundaries)))
+
+    message = builder.build("to@example.com", text_content="--" + "=" * 15 + "1" * 19 + "==")
+    assert b'boundary="' + b"=" * 15 + b"2" * 19 + b'=="' in message
+
+
+@pytest.mark.parametrize("value", ["plain", "Grüße", "€ and \"quotes\" =?x?=", "a" * 200, "two\nlines"])
+def test_fold_header_matches_policy(value):
+    assert fold_header("Subject", value) == HEADER_POLICY.fold("Subject", value)
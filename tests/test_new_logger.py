@@ -1,7 +1,8 @@
 import os
 import re
 from datetime import datetime
-from smartmailer.utils.new_logger import Logger
+from unittest.mock import patch
+from smartmailer.utils.new_logger import Logger, RELATIVE_PATH_CACHE_SIZE
 
 def test_log_directory_created(tmp_path):
     logger = Logger(log_to_file=True, log_level="INFO")
@@ -46,3 +47,67 @@ def test_log_format_contains_timestamp_and_context(capsys):
     # Regex: YYYY-MM-DD HH:MM:SS | LEVEL | file:line | message
     pattern = r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} \| INFO \| .* \| Format check"
     assert re.search(pattern, captured.out)
+
+def test_file_lines_are_newline_terminated():
+    logger = Logger(log_to_file=True, log_level="INFO")
+    logger.info("first line")
+    logger.warning("second line")
+    path = logger.log_file_handle.path
+    logger.log_file_handle.close()
+
+    with open(path, "r") as f:
+        lines = f.read().splitlines()
+    assert lines[0].endswith("first line")
+    assert lines[1].endswith("second line")
+
+def test_flush_waits_for_background_writer():
+    logger = Logger(log_to_file=True, log_level="INFO")
+    for i in range(100):
+        logger.info(f"line {i}")
+    logger.flush()
+
+    with open(logger.log_file_handle.path, "r") as f:
+        assert len(f.read().splitlines()) == 100
+    logger.log_file_handle.close()
+
+def test_filtered_levels_skip_frame_inspection(capsys):
+    from unittest.mock import patch
+    logger = Logger(log_to_file=False, log_level="WARNING")
+    with patch("smartmailer.utils.new_logger.sys._getframe") as mock_frame:
+        logger.debug("hidden")
+        logger.info("hidden")
+    mock_frame.assert_not_called()
+    assert capsys.readouterr().out == ""
+
+def test_caller_context_points_at_logging_call(capsys):
+    logger = Logger(log_to_file=False, log_level="INFO")
+    logger.info("where am I")
+    out = capsys.readouterr().out
+    assert "test_new_logger.py L" in out
+
+def test_caller_lookup_can_be_disabled(capsys):
+    logger = Logger(log_to_file=False, log_level="INFO", include_caller=False)
+    logger.info("no caller")
+    assert "| INFO | - | no caller" in capsys.readouterr().out
+
+def test_bare_logger_keeps_existing_configuration():
+    Logger(log_to_file=False, log_level="ERROR")
+    shared = Logger()
+    assert shared.log_level == "ERROR"
+    Logger(log_level="INFO")
+
+def test_caller_path_ignores_patched_os_path(capsys):
+    logger = Logger(log_to_file=False, log_level="INFO")
+    with patch("os.path.join", return_value="settings.json"), patch("os.path.relpath", return_value="settings.json"):
+        logger.info("patched")
+    logger.info("unpatched")
+    out = capsys.readouterr().out
+    assert "settings.json L" not in out
+    assert "test_new_logger.py L" in out
+
+def test_caller_path_memo_is_bounded():
+    logger = Logger(log_to_file=False, log_level="INFO")
+    for index in range(RELATIVE_PATH_CACHE_SIZE + 10):
+        logger._relative_path(os.path.join(logger.cwd, f"file{index}.py"))
+    assert len(logger._relative_paths) <= RELATIVE_PATH_CACHE_SIZE
+    assert logger._relative_path(os.path.join(logger.cwd, "pkg", "mod.py")) == os.path.join("pkg", "mod.py")
@@ -0,0 +1,178 @@
+import os
+import time
+import smtplib
+from email import message_from_bytes
+from unittest.mock import MagicMock, patch
+import pytest
+from smartmailer.core.mailer import MailSender
+from smartmailer.core.outbox import Outbox
+from smartmailer.core.rate_limiter import AdaptiveRateLimiter
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    return Outbox(str(tmp_path / "outbox"))
+
+
+class Recipient:
+    def __init__(self, hash_):
+        self.hash_string = hash_
+
+
+def test_put_and_claim(outbox):
+    assert outbox.put("h1", "me@example.com", ["a@example.com", "cc@example.com"], b"Subject: hi\r\n\r\nbody")
+    assert "h1" in outbox
+    assert len(outbox) == 1
+    assert os.listdir(outbox.tmp_dir) == []
+
+    entry = outbox.claim("h1")
+    assert entry.recipient_hash == "h1"
+    assert entry.sender == "me@example.com"
+    assert entry.recipients == ["a@example.com", "cc@example.com"]
+    assert entry.message == b"Subject: hi\r\n\r\nbody"
+    assert outbox.claim("h1") is None
+
+    outbox.ack(entry)
+    assert len(outbox) == 0
+    assert "h1" not in outbox
+
+
+def test_put_is_idempotent(outbox):
+    assert outbox.put("h1", "me@example.com", ["a@example.com"], b"first")
+    assert not outbox.put("h1", "me@example.com", ["a@example.com"], b"second")
+    assert outbox.claim("h1").message == b"first"
+
+
+def test_release_and_reject(outbox):
+    outbox.put("h1", "me@example.com", ["a@example.com"], b"x")
+    outbox.put("h2", "me@example.com", ["b@example.com"], b"y")
+    entries = list(outbox)
+    assert {e.name for e in entries} == {"h1", "h2"}
+
+    outbox.release(entries[0])
+    outbox.reject(entries[1])
+    assert outbox.pending() == [entries[0].name]
+    assert os.listdir(outbox.failed_dir) == [entries[1].name]
+
+
+def test_put_skips_rejected(outbox):
+    outbox.put("h1", "me@example.com", ["a@example.com"], b"x")
+    outbox.reject(outbox.claim("h1"))
+    assert "h1" in outbox
+    assert not outbox.put("h1", "me@example.com", ["a@example.com"], b"x")
+    assert outbox.pending() == []
+
+
+def test_recover_abandoned_claims(outbox):
+    outbox.put("h1", "me@example.com", ["a@example.com"], b"x")
+    entry = outbox.claim("h1")
+    assert outbox.recover(older_than=60) == 0
+
+    old = time.time() - 120
+    os.utime(os.path.join(outbox.cur_dir, entry.name), (old, old))
+    assert outbox.recover(older_than=60) == 1
+    assert outbox.pending() == ["h1"]
+
+
+def make_sender():
+    return MailSender("user@gmail.com", "pass", rate_limiter=AdaptiveRateLimiter(cooldown=0))
+
+
+def test_spool_bulk_mail_builds_messages(outbox):
+    sender = make_sender()
+    rows = [
+        {"object": Recipient("h1"), "to_email": "a@example.com", "subject": "Hi", "text_content": "Hello", "cc": ["c@example.com"]},
+        {"object": Recipient("h2"), "to_email": "b@example.com", "subject": "Hi"},
+    ]
+    assert sender.spool_bulk_mail(rows, outbox) == 1
+
+    entry = outbox.claim("h1")
+    assert entry.recipients == ["a@example.com", "c@example.com"]
+    msg = message_from_bytes(entry.message)
+    assert msg["To"] == "a@example.com"
+    assert msg["Subject"] == "Hi"
+
+
+@patch("smtplib.SMTP")
+def test_send_spooled_delivers_and_acks(mock_smtp, outbox):
+    def sendmail(frm, to, msg):
+        if to[0] == "soft@example.com":
+            raise smtplib.SMTPDataError(451, b"try later")
+        if to[0] == "hard@example.com":
+            raise smtplib.SMTPDataError(550, b"no such user")
+        return {}
+    mock_smtp.return_value.sendmail.side_effect = sendmail
+    for name in ("good", "soft", "hard"):
+        outbox.put(name, "user@gmail.com", [f"{name}@example.com"], b"Subject: x\r\n\r\ny")
+    session_manager = MagicMock()
+
+    delivered = make_sender().send_spooled(outbox, session_manager)
+
+    assert delivered == 1
+    session_manager.add_recipient_hash.assert_called_once_with("good")
+    assert outbox.pending() == ["soft"]
+    assert os.listdir(outbox.failed_dir) == ["hard"]
+    assert os.listdir(outbox.cur_dir) == []
+
+
+@patch("smtplib.SMTP")
+def test_send_spooled_puts_messages_back_when_connecting_fails(mock_smtp, outbox):
+    mock_smtp.side_effect = OSError("no route to host")
+    outbox.put("h1", "user@gmail.com", ["a@example.com"], b"x")
+
+    assert make_sender().send_spooled(outbox, MagicMock()) == 0
+    assert outbox.pending() == ["h1"]
+
+
+@patch("smtplib.SMTP")
+def test_send_spooled_skips_messages_already_sent(mock_smtp, outbox):
+    # sent by a run that crashed before acking, then recovered
+    outbox.put("h1", "user@gmail.com", ["a@example.com"], b"x")
+    session_manager = MagicMock()
+    session_manager.get_sent_hashes.return_value = {"h1"}
+
+    assert make_sender().send_spooled(outbox, session_manager) == 0
+    mock_smtp.return_value.sendmail.assert_not_called()
+    assert len(outbox) == 0
+
+
+@patch("smtplib.SMTP")
+@patch("smartmailer.core.mailer.time.sleep")
+def test_send_spooled_follow_backs_off_transient_failures(mock_sleep, mock_smtp, outbox):
+    mock_smtp.return_value.sendmail.side_effect = smtplib.SMTPDataError(451, b"try later")
+    mock_sleep.side_effect = [None, None, KeyboardInterrupt]
+    outbox.put("soft", "user@gmail.com", ["soft@example.com"], b"x")
+
+    assert make_sender().send_spooled(outbox, MagicMock(), follow=True) == 0
+    # three polls, but the next attempt isn't due for five minutes
+    assert mock_smtp.return_value.sendmail.call_count == 1
+    assert outbox.pending() == ["soft"]
+
+
+@patch("smtplib.SMTP")
+def test_smartmailer_spool_then_drain(mock_smtp, tmp_path, monkeypatch):
+    from smartmailer.smartmailer import SmartMailer
+    from smartmailer.core.template import TemplateModel
+
+    class Person(TemplateModel):
+        email: str
+
+    monkeypatch.chdir(tmp_path)
+    template = MagicMock()
+    template.render.side_effect = lambda r: {"subject": "Hi", "text": f"Hello {r.email}", "html": None}
+    people = [Person(email=f"p{i}@example.com") for i in range(3)]
+
+    mailer = SmartMailer("user@gmail.com", "pass", "gmail", "outbox-session")
+    mailer.mailer.rate_limiter = AdaptiveRateLimiter()
+    try:
+        assert mailer.spool_emails(people, "email", template) == 3
+        # already waiting, so not rendered again
+        assert mailer.spool_emails(people, "email", template) == 0
+        assert template.render.call_count == 3
+
+        assert mailer.drain_outbox() == 3
+        assert mock_smtp.return_value.sendmail.call_count == 3
+        assert len(mailer.get_outbox()) == 0
+        assert mailer.session_manager.get_sent_hashes([p.hash_string for p in people]) == {p.hash_string for p in people}
+    finally:
+        mailer.session_manager.db.close()
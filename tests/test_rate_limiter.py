@@ -0,0 +1,110 @@
+import smtplib
+import pytest
+from smartmailer.core.rate_limiter import (
+    AdaptiveRateLimiter,
+    QuotaExceededError,
+    TokenBucket,
+    smtp_reply_code,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_allows_burst_then_spaces_out():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+    clock.now += 1.0
+    assert bucket.reserve() == pytest.approx(0.5)
+
+
+def test_token_bucket_rejects_bad_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0, capacity=1)
+
+
+def test_limiter_paces_to_max_rate():
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(max_per_minute=60, clock=clock, sleep=clock.sleep)
+    for _ in range(110):
+        limiter.acquire()
+    # a burst of 10, then one a second
+    assert clock.now == pytest.approx(100)
+
+
+def test_limiter_without_limits_never_waits():
+    limiter = AdaptiveRateLimiter()
+    assert all(limiter.reserve() == 0 for _ in range(1000))
+    assert limiter.per_minute is None
+
+
+def test_throttle_halves_rate_and_pauses():
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(max_per_minute=60, cooldown=30, clock=clock)
+    assert limiter.on_reply(421) is True
+    assert limiter.per_minute == pytest.approx(30)
+    assert limiter.reserve() == pytest.approx(30)
+    assert limiter.on_reply(550) is False
+    assert limiter.throttled == 1
+
+
+def test_throttle_respects_min_rate():
+    limiter = AdaptiveRateLimiter(max_per_minute=60, min_per_minute=20)
+    for _ in range(5):
+        limiter.on_throttle()
+    assert limiter.per_minute == pytest.approx(20)
+
+
+def test_rate_recovers_after_successes():
+    limiter = AdaptiveRateLimiter(max_per_minute=60, recovery_after=10)
+    limiter.on_throttle()
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.per_minute == pytest.approx(36)
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.per_minute == pytest.approx(60)
+
+
+def test_daily_quota_resets_after_a_day():
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(daily_quota=2, clock=clock)
+    limiter.reserve()
+    limiter.reserve()
+    with pytest.raises(QuotaExceededError):
+        limiter.reserve()
+    clock.now += 24 * 60 * 60
+    assert limiter.reserve() == 0
+
+
+def test_refunded_sends_do_not_count_against_quota():
+    limiter = AdaptiveRateLimiter(daily_quota=2)
+    limiter.reserve()
+    limiter.refund()
+    limiter.reserve()
+    limiter.reserve()
+    with pytest.raises(QuotaExceededError):
+        limiter.reserve()
+
+
+def test_from_settings():
+    limiter = AdaptiveRateLimiter.from_settings({"host": "smtp.example.com", "port": 587, "max_per_minute": 30})
+    assert limiter.max_per_minute == 30
+    assert limiter.daily_quota is None
+
+
+def test_smtp_reply_code():
+    assert smtp_reply_code(smtplib.SMTPDataError(451, b"slow down")) == 451
+    assert smtp_reply_code(smtplib.SMTPRecipientsRefused({"a@example.com": (454, b"later")})) == 454
+    assert smtp_reply_code(ValueError("boom")) is None
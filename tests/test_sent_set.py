@@ -0,0 +1,70 @@
+from unittest.mock import MagicMock
+
+import pytest
+from smartmailer.session_management.sent_set import SentSet
+from smartmailer.session_management.sqlite_store import SQLiteStore
+from smartmailer.utils.strings import get_hash
+
+
+@pytest.fixture
+def store():
+    store = SQLiteStore(":memory:")
+    yield store
+    store.close()
+
+
+def test_load_picks_a_set_for_small_sessions(store):
+    store.insert_recipient(get_hash("a"))
+    sent = SentSet.load(store)
+    assert sent.mode == "set" and sent.exact
+    assert get_hash("a") in sent
+    assert get_hash("b") not in sent
+
+
+def test_load_picks_a_bloom_filter_for_big_sessions(store):
+    for i in range(20):
+        store.insert_recipient(get_hash(str(i)))
+    sent = SentSet.load(store, max_exact=10)
+    assert sent.mode == "bloom" and not sent.exact
+    assert all(get_hash(str(i)) in sent for i in range(20))
+
+
+def test_load_includes_pending_rows(tmp_path):
+    store = SQLiteStore(str(tmp_path / "buffered.db"), batch_size=100, flush_interval=60)
+    store.insert_recipient("pending")
+    assert "pending" in SentSet.load(store)
+    store.close()
+
+
+def test_digests_and_other_keys_are_kept_apart():
+    sent = SentSet("set")
+    digest = get_hash("a")
+    sent.add(digest)
+    sent.add("hash1")
+    assert digest in sent and "hash1" in sent
+    # the uppercase spelling of a digest is a different key
+    assert digest.upper() not in sent
+
+
+def test_bloom_hits_are_confirmed_by_the_store():
+    sent = SentSet("bloom", capacity=100)
+    sent.add("sent")
+    store = MagicMock()
+    store.get_sent_hashes.return_value = {"sent"}
+
+    assert sent.get_sent_hashes(["sent", "unsent"], store) == {"sent"}
+    # "unsent" is a definite miss, so only the hit is looked up
+    store.get_sent_hashes.assert_called_once_with(["sent"])
+
+
+def test_exact_set_never_asks_the_store():
+    sent = SentSet("set")
+    sent.add("sent")
+    store = MagicMock()
+    assert sent.get_sent_hashes(["sent", "unsent"], store) == {"sent"}
+    store.get_sent_hashes.assert_not_called()
+
+
+def test_invalid_mode(store):
+    with pytest.raises(ValueError):
+        SentSet.load(store, mode="trie")
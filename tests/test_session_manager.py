@@ -26,7 +26,7 @@ def dummy_recipients():
 
 @pytest.fixture
 def mock_database():
-    with patch("smartmailer.session_management.session_manager.Database") as mock_db_class:
+    with patch("smartmailer.session_management.db.Database") as mock_db_class:
         mock_db = MagicMock()
         mock_db_class.return_value = mock_db
         yield mock_db
@@ -34,7 +34,8 @@ def mock_database():
 
 @pytest.fixture
 def session_manager(mock_database):
-    sm = SessionManager("test session")
+    # without the in-memory sent cache, so lookups go to the store
+    sm = SessionManager("test session", sent_cache=None)
     return sm
 
 
@@ -44,22 +45,28 @@ def test_get_current_session_id(session_manager):
     assert isinstance(session_id, str)
 
 
-def test_add_recipient_adds_only_if_not_sent(session_manager, mock_database):
+def test_add_recipient_inserts_without_lookup(session_manager, mock_database):
     recipient = DummyRecipient("abc123")
-    mock_database.check_recipient_sent.return_value = False
 
     session_manager.add_recipient(recipient)
 
     mock_database.insert_recipient.assert_called_once_with("abc123")
+    mock_database.check_recipient_sent.assert_not_called()
 
 
-def test_add_recipient_skips_if_already_sent(session_manager, mock_database):
+def test_add_recipient_leaves_duplicates_to_db(session_manager, mock_database):
+    # the insert is INSERT OR IGNORE, so an already sent recipient is a no-op in the DB
     recipient = DummyRecipient("abc123")
-    mock_database.check_recipient_sent.return_value = True
 
     session_manager.add_recipient(recipient)
+    session_manager.add_recipient(recipient)
+
+    assert mock_database.insert_recipient.call_count == 2
 
-    mock_database.insert_recipient.assert_not_called()
+
+def test_flush_delegates_to_db(session_manager, mock_database):
+    session_manager.flush()
+    mock_database.flush.assert_called_once()
 
 
 def test_get_sent_recipients_delegates_to_db(session_manager, mock_database):
@@ -69,15 +76,19 @@ def test_get_sent_recipients_delegates_to_db(session_manager, mock_database):
 
 def test_filter_sent_recipients(session_manager, mock_database, dummy_recipients):
     # DB says hash1 and hash2 are sent
-    mock_database.get_sent_recipients.return_value = [
-        {"recipient_hash": "hash1"},
-        {"recipient_hash": "hash2"}
-    ]
+    mock_database.get_sent_hashes.return_value = {"hash1", "hash2"}
 
     result = session_manager.filter_sent_recipients(dummy_recipients)
     result_hashes = [r.hash_string for r in result]
 
     assert set(result_hashes) == {"hash1", "hash2"}
+    mock_database.get_sent_hashes.assert_called_once_with(["hash0", "hash1", "hash2"])
+    mock_database.get_sent_recipients.assert_not_called()
+
+
+def test_get_sent_hashes_delegates_to_db(session_manager, mock_database):
+    mock_database.get_sent_hashes.return_value = {"hash1"}
+    assert session_manager.get_sent_hashes(["hash0", "hash1"]) == {"hash1"}
 
 
 def test__filter_unsent_recipients(session_manager, mock_database, dummy_recipients):
@@ -87,4 +98,110 @@ def test__filter_unsent_recipients(session_manager, mock_database, dummy_recipie
     result = session_manager._filter_unsent_recipients(dummy_recipients)
     result_hashes = [r.hash_string for r in result]
 
-    assert set(result_hashes) == {"hash0", "hash2"}
\ No newline at end of file
+    assert set(result_hashes) == {"hash0", "hash2"}
+
+def test_record_failure_stores_payload_as_json(session_manager, mock_database):
+    recipient = DummyRecipient("hash1")
+    session_manager.record_failure(recipient, {"to_email": "a@example.com"}, "421 try later")
+    mock_database.record_failure.assert_called_once_with(
+        "hash1", '{"to_email": "a@example.com"}', "421 try later", retryable=True
+    )
+
+
+def test_get_due_failures_returns_sendable_rows(session_manager, mock_database):
+    mock_database.get_due_failures.return_value = [
+        {"recipient_hash": "hash1", "payload": '{"to_email": "a@example.com", "subject": "Hi"}'}
+    ]
+    rows = session_manager.get_due_failures(limit=10)
+
+    mock_database.get_due_failures.assert_called_once_with(limit=10, max_attempts=None)
+    assert rows[0]["to_email"] == "a@example.com"
+    assert rows[0]["object"].hash_string == "hash1"
+
+
+def test_add_recipient_hash(session_manager, mock_database):
+    session_manager.add_recipient_hash("hash1")
+    mock_database.insert_recipient.assert_called_once_with("hash1")
+
+
+def test_in_shard_splits_every_hash_once():
+    from smartmailer.session_management.session_manager import in_shard
+    hashes = [f"{i:016x}" + "0" * 48 for i in range(12)]
+    shards = [[h for h in hashes if in_shard(h, (index, 3))] for index in range(3)]
+    assert sorted(sum(shards, [])) == hashes
+    assert all(len(shard) == 4 for shard in shards)
+
+
+def test_in_shard_rejects_invalid_shard():
+    from smartmailer.session_management.session_manager import in_shard
+    with pytest.raises(ValueError):
+        in_shard("ab", (3, 3))
+
+
+def test_claim_recipients_keeps_order(session_manager, mock_database, dummy_recipients):
+    mock_database.claim_recipients.return_value = {"hash2", "hash0"}
+    claimed = session_manager.claim_recipients(dummy_recipients, "worker-1", 60)
+    mock_database.claim_recipients.assert_called_once_with(["hash0", "hash1", "hash2"], "worker-1", 60)
+    assert claimed == [dummy_recipients[0], dummy_recipients[2]]
+
+
+def test_backend_is_chosen_by_name():
+    from smartmailer.session_management.db import Database
+    from smartmailer.session_management.sqlite_store import SQLiteStore
+    from smartmailer.session_management.session_manager import get_store_class
+
+    assert get_store_class("sqlalchemy") is Database
+    assert get_store_class("sqlite3") is SQLiteStore
+    with pytest.raises(ValueError, match="Unknown session backend"):
+        get_store_class("postgres")
+
+
+@patch("smartmailer.session_management.sqlite_store.SQLiteStore")
+def test_sqlite3_backend(mock_store_class):
+    sm = SessionManager("sqlite session", batch_size=5, backend="sqlite3")
+    assert sm.db is mock_store_class.return_value
+    mock_store_class.assert_called_once_with(sm.dbfile_path, batch_size=5, flush_interval=1.0)
+
+
+@pytest.fixture
+def cached_session(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sm = SessionManager("cached session", backend="sqlite3")
+    yield sm
+    sm.db.close()
+
+
+def test_sent_cache_is_loaded_once(cached_session, dummy_recipients):
+    cached_session.add_recipient_hash("hash1")
+    cached_session.db = MagicMock(wraps=cached_session.db)
+
+    assert cached_session.filter_sent_recipients(dummy_recipients) == [dummy_recipients[1]]
+    assert cached_session.get_sent_hashes(["hash0", "hash1"]) == {"hash1"}
+    cached_session.db.iter_sent_hashes.assert_called_once()
+    cached_session.db.get_sent_hashes.assert_not_called()
+
+
+def test_sent_cache_sees_recipients_sent_during_the_run(cached_session, dummy_recipients):
+    assert cached_session._filter_unsent_recipients(dummy_recipients) == dummy_recipients
+    cached_session.add_recipient(dummy_recipients[2])
+    assert cached_session._filter_unsent_recipients(dummy_recipients) == dummy_recipients[:2]
+
+
+def test_invalid_sent_cache(mock_database):
+    with pytest.raises(ValueError, match="Unknown sent cache mode"):
+        SessionManager("test session", sent_cache="trie")
+
+
+@pytest.mark.parametrize("backend", ["sqlalchemy", "sqlite3"])
+def test_sessions_in_one_process_are_isolated(tmp_path, monkeypatch, backend):
+    monkeypatch.chdir(tmp_path)
+    first = SessionManager("campaign one", backend=backend)
+    second = SessionManager("campaign two", backend=backend)
+    try:
+        first.add_recipient_hash("hash1")
+        assert first.get_sent_hashes(["hash1"]) == {"hash1"}
+        assert second.get_sent_hashes(["hash1"]) == set()
+        assert first.db.dbfile_path != second.db.dbfile_path
+    finally:
+        first.close()
+        second.close()
@@ -6,14 +6,15 @@ from smartmailer.smartmailer import SmartMailer
 @pytest.fixture
 def mock_dependencies():
     with patch("smartmailer.smartmailer.MailSender") as mock_mailer_cls, \
-         patch("smartmailer.smartmailer.TemplateEngine") as mock_template_cls, \
          patch("smartmailer.smartmailer.SessionManager") as mock_session_cls:
 
         mock_mailer = MagicMock()
         mock_mailer_cls.return_value = mock_mailer
+        # send_emails streams recipients, so drain them like the real sender would
+        consumed = []
+        mock_mailer.send_bulk_mail.side_effect = lambda recipients, **kwargs: consumed.append(list(recipients))
 
         mock_template = MagicMock()
-        mock_template_cls.return_value = mock_template
 
         mock_session = MagicMock()
         mock_session_cls.return_value = mock_session
@@ -21,7 +22,8 @@ def mock_dependencies():
         yield {
             "mailer": mock_mailer,
             "template": mock_template,
-            "session": mock_session
+            "session": mock_session,
+            "consumed": consumed
         }
 
 
@@ -56,7 +58,7 @@ def test_send_emails_filters_and_renders(mock_dependencies, dummy_recipients):
     assert mock_mailer.send_bulk_mail.called
 
     args, kwargs = mock_mailer.send_bulk_mail.call_args
-    assert len(kwargs["recipients"]) == 2
+    assert len(mock_dependencies["consumed"][0]) == 2
     assert kwargs["session_manager"] == mock_session
 
 
@@ -115,6 +117,170 @@ def test_rendering_exception_is_logged_and_skipped(mock_dependencies, dummy_reci
     assert mock_mailer.send_bulk_mail.called
 
     # Only 1 email should be prepared (the other failed in render)
-    recipients_arg = mock_mailer.send_bulk_mail.call_args[1]["recipients"]
+    recipients_arg = mock_dependencies["consumed"][0]
     assert len(recipients_arg) == 1
-    assert recipients_arg[0]["to_email"] == "a@example.com"
\ No newline at end of file
+    assert recipients_arg[0]["to_email"] == "a@example.com"
+
+def test_send_emails_accepts_generator_and_streams(mock_dependencies):
+    auto = SmartMailer("sender@example.com", "password", "gmail", "stream-session")
+    mock_session = mock_dependencies["session"]
+    mock_mailer = mock_dependencies["mailer"]
+    mock_template = mock_dependencies["template"]
+
+    mock_session.filter_sent_recipients.return_value = []
+    mock_template.render.return_value = {"subject": "S", "text": "T"}
+
+    produced = []
+    class Dummy:
+        def __init__(self, email):
+            self.__dict__["email"] = email
+
+    def recipients():
+        for i in range(1200):
+            produced.append(i)
+            yield Dummy(f"r{i}@example.com")
+
+    seen_when_first_sent = []
+    def consume(recipients, **kwargs):
+        for i, row in enumerate(recipients):
+            if i == 0:
+                seen_when_first_sent.append(len(produced))
+    mock_mailer.send_bulk_mail.side_effect = consume
+
+    auto.send_emails(recipients(), email_field="email", template=mock_template)
+
+    # sending starts after the first chunk, not after the whole list
+    assert seen_when_first_sent == [500]
+    assert mock_template.render.call_count == 1200
+    # the session is checked one chunk at a time
+    chunk_sizes = [len(call.args[0]) for call in mock_session.filter_sent_recipients.call_args_list]
+    assert chunk_sizes == [500, 500, 200]
+
+
+def test_retry_failed_sends_due_failures(mock_dependencies):
+    auto = SmartMailer("sender@example.com", "password", "gmail", "testsession")
+    mock_session = mock_dependencies["session"]
+    due = [{"to_email": "a@example.com", "subject": "Hi", "text_content": "Hello"}]
+    mock_session.get_due_failures.return_value = due
+
+    stats = auto.retry_failed(limit=100)
+
+    assert mock_dependencies["mailer"].send_bulk_mail.call_args.kwargs["stats"] is stats
+    mock_session.clear_sent_failures.assert_called_once()
+    mock_session.get_due_failures.assert_called_once_with(limit=100, max_attempts=5)
+    assert mock_dependencies["consumed"] == [due]
+
+
+def test_retry_failed_with_nothing_due(mock_dependencies, capsys):
+    auto = SmartMailer("sender@example.com", "password", "gmail", "testsession")
+    mock_dependencies["session"].get_due_failures.return_value = []
+
+    stats = auto.retry_failed()
+
+    assert stats.sent == stats.failed == 0
+    assert not mock_dependencies["mailer"].send_bulk_mail.called
+    assert "No failed emails are due" in capsys.readouterr().out
+
+
+def test_send_emails_renders_in_processes(mock_dependencies, dummy_recipients):
+    from jinja2 import Environment
+    from smartmailer.core.template import JinjaTemplateParser, JinjaTemplateRenderer, TemplateEngine, TemplateValidator
+
+    env = Environment()
+    engine = TemplateEngine(
+        parser=JinjaTemplateParser(env),
+        validator=TemplateValidator(),
+        renderer=JinjaTemplateRenderer(env),
+        subject="Hello {{ email }}",
+        text="Hi",
+    )
+    mock_dependencies["session"].filter_sent_recipients.return_value = []
+    auto = SmartMailer("sender@example.com", "password", "gmail", "testsession")
+
+    auto.send_emails(dummy_recipients, email_field="email", template=engine, render_processes=2)
+
+    rows = mock_dependencies["consumed"][0]
+    assert [row["subject"] for row in rows] == ["Hello a@example.com", "Hello b@example.com"]
+    assert [row["object"] for row in rows] == dummy_recipients
+
+
+def test_send_emails_times_rendering_without_touching_the_engine(mock_dependencies, dummy_recipients):
+    from jinja2 import Environment
+    from smartmailer.core.template import JinjaTemplateParser, JinjaTemplateRenderer, TemplateEngine, TemplateValidator
+
+    env = Environment()
+    engine = TemplateEngine(
+        parser=JinjaTemplateParser(env),
+        validator=TemplateValidator(),
+        renderer=JinjaTemplateRenderer(env),
+        subject="Hello {{ email }}",
+        text="Hi",
+    )
+    mock_dependencies["session"].filter_sent_recipients.return_value = []
+    auto = SmartMailer("sender@example.com", "password", "gmail", "testsession")
+
+    stats = auto.send_emails(dummy_recipients, email_field="email", template=engine)
+
+    rows = mock_dependencies["consumed"][0]
+    assert [row["subject"] for row in rows] == ["Hello a@example.com", "Hello b@example.com"]
+    assert stats.histograms["render"].count == 2
+    assert not hasattr(engine, "stats")
+
+
+def test_send_emails_leaves_recipients_claimed_elsewhere(mock_dependencies, dummy_recipients, capsys):
+    mock_session = mock_dependencies["session"]
+    mock_session.filter_sent_recipients.return_value = []
+    mock_session.claim_recipients.side_effect = lambda recipients, worker_id, ttl: recipients[1:]
+    auto = SmartMailer("sender@example.com", "password", "gmail", "testsession")
+
+    auto.send_emails(dummy_recipients, email_field="email", template=mock_dependencies["template"], worker_id="worker-1")
+
+    mock_session.claim_recipients.assert_called_once_with(dummy_recipients, "worker-1", 300.0)
+    assert [row["object"] for row in mock_dependencies["consumed"][0]] == dummy_recipients[1:]
+    assert "1 recipients are being sent by other workers" in capsys.readouterr().out
+    mock_session.release_leases.assert_called_once_with("worker-1")
+
+
+def test_send_emails_releases_leases_when_sending_fails(mock_dependencies, dummy_recipients):
+    mock_session = mock_dependencies["session"]
+    mock_session.filter_sent_recipients.return_value = []
+    mock_session.claim_recipients.side_effect = lambda recipients, worker_id, ttl: recipients
+    mock_dependencies["mailer"].send_bulk_mail.side_effect = KeyboardInterrupt
+    auto = SmartMailer("sender@example.com", "password", "gmail", "testsession")
+
+    with pytest.raises(KeyboardInterrupt):
+        auto.send_emails(dummy_recipients, email_field="email", template=mock_dependencies["template"], worker_id="worker-1")
+
+    mock_session.release_leases.assert_called_once_with("worker-1")
+
+
+def test_send_emails_sends_only_its_shard(mock_dependencies, dummy_recipients):
+    dummy_recipients[0].hash_string = "0" * 64
+    dummy_recipients[1].hash_string = "0" * 15 + "1" + "0" * 48
+    mock_session = mock_dependencies["session"]
+    mock_session.filter_sent_recipients.return_value = []
+    mock_session.claim_recipients.side_effect = lambda recipients, worker_id, ttl: recipients
+    auto = SmartMailer("sender@example.com", "password", "gmail", "testsession")
+
+    auto.send_emails(dummy_recipients, email_field="email", template=mock_dependencies["template"], shard=(1, 2))
+
+    assert [row["object"] for row in mock_dependencies["consumed"][0]] == [dummy_recipients[1]]
+
+
+def test_send_emails_returns_stats(mock_dependencies, dummy_recipients, tmp_path):
+    mock_dependencies["session"].filter_sent_recipients.return_value = [dummy_recipients[0]]
+    auto = SmartMailer("sender@example.com", "password", "gmail", "testsession")
+    metrics_path = tmp_path / "smartmailer.prom"
+
+    stats = auto.send_emails(dummy_recipients, email_field="email",
+                             template=mock_dependencies["template"], metrics_path=str(metrics_path))
+
+    assert stats.skipped == 1
+    assert mock_dependencies["mailer"].send_bulk_mail.call_args.kwargs["stats"] is stats
+    assert 'smartmailer_emails_total{result="skipped"} 1' in metrics_path.read_text()
+
+
+def test_context_manager_closes_the_session(mock_dependencies):
+    with SmartMailer("sender@example.com", "password", "gmail", "testsession") as auto:
+        assert isinstance(auto, SmartMailer)
+    mock_dependencies["session"].close.assert_called_once()
@@ -0,0 +1,151 @@
+import sqlite3
+import threading
+
+import pytest
+from smartmailer.session_management.db import Database
+from smartmailer.session_management.sqlite_store import SQLiteStore
+
+
+def _count_rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM sent").fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "session.db")
+
+
+def test_buffered_inserts_flush_by_count(store_path):
+    store = SQLiteStore(store_path, batch_size=2, flush_interval=60)
+    store.insert_recipient("a")
+    assert _count_rows(store_path) == 0
+    assert store.check_recipient_sent("a")
+
+    store.insert_recipient("b")
+    assert _count_rows(store_path) == 2
+    store.close()
+
+
+def test_close_flushes_pending(store_path):
+    store = SQLiteStore(store_path, batch_size=100, flush_interval=60)
+    store.insert_recipient("pending")
+    store.close()
+    assert _count_rows(store_path) == 1
+
+
+def test_failed_flush_keeps_pending(store_path):
+    store = SQLiteStore(store_path, batch_size=100, flush_interval=60)
+    store.insert_recipient("pending")
+    real_connection = store.connection
+    store.connection = None
+    with pytest.raises(AttributeError):
+        store.flush()
+    store.connection = real_connection
+
+    assert store.flush() == 1
+    store.close()
+
+
+def test_wal_mode_enabled(store_path):
+    store = SQLiteStore(store_path)
+    assert store.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    store.close()
+
+
+def test_reads_sessions_written_by_database(store_path):
+    db = Database(store_path)
+    db.insert_recipient("sent")
+    db.record_failure("failed", "{}", "421 try later")
+    db.claim_recipients(["leased"], "worker-1", ttl=60)
+    db.close()
+
+    store = SQLiteStore(store_path)
+    try:
+        assert store.check_recipient_sent("sent")
+        assert store.get_sent_recipients()[0]["sent_time"].year >= 2025
+        assert store.get_failed_recipients()[0]["attempts"] == 1
+        assert store.claim_recipients(["leased"], "worker-2", ttl=60) == set()
+        store.record_failure("failed", "{}", "451 busy")
+    finally:
+        store.close()
+
+    db = Database(store_path)
+    try:
+        failure = db.get_failed_recipients()[0]
+        assert failure["attempts"] == 2
+        assert failure["next_attempt_at"] > failure["last_attempt_at"]
+    finally:
+        db.close()
+
+
+def test_legacy_json_keys_migrated(store_path):
+    import json
+    from smartmailer.utils.strings import get_hash
+
+    legacy_key = json.dumps({"name": "ABC", "email": "a@example.com"})
+    conn = sqlite3.connect(store_path)
+    conn.execute("CREATE TABLE sent (recipient_hash VARCHAR NOT NULL PRIMARY KEY, sent_time DATETIME)")
+    conn.execute("INSERT INTO sent VALUES (?, '2025-01-01 10:00:00.000000')", (legacy_key,))
+    conn.commit()
+    conn.close()
+
+    store = SQLiteStore(store_path)
+    try:
+        assert store.check_recipient_sent(get_hash(legacy_key))
+        assert not store.check_recipient_sent(legacy_key)
+    finally:
+        store.close()
+
+
+def test_transaction_rolls_back_on_error(store_path):
+    store = SQLiteStore(store_path)
+    with pytest.raises(RuntimeError):
+        with store._transaction() as conn:
+            conn.execute("INSERT INTO sent VALUES ('rolled-back', NULL)")
+            raise RuntimeError("boom")
+    assert not store.check_recipient_sent("rolled-back")
+    store.close()
+
+
+def test_shared_between_threads(store_path):
+    store = SQLiteStore(store_path, batch_size=7, flush_interval=60)
+
+    def insert(worker):
+        for i in range(200):
+            store.insert_recipient(f"{worker}-{i}")
+            store.check_recipient_sent(f"{worker}-{i}")
+
+    threads = [threading.Thread(target=insert, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.close()
+    assert _count_rows(store_path) == 800
+
+
+def test_same_file_shares_one_connection(store_path):
+    from smartmailer.session_management.sqlite_store import CONNECTIONS
+
+    first = SQLiteStore(store_path)
+    second = SQLiteStore(store_path)
+    assert first.connection is second.connection
+
+    first.insert_recipient("shared")
+    first.close()
+    assert second.check_recipient_sent("shared")
+    second.close()
+    assert CONNECTIONS.users(store_path) == 0
+
+
+def test_memory_stores_are_private():
+    first = SQLiteStore(":memory:")
+    second = SQLiteStore(":memory:")
+    first.insert_recipient("private")
+    assert not second.check_recipient_sent("private")
+    first.close()
+    second.close()
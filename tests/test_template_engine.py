@@ -163,4 +163,135 @@ def test_validator_called(parser, validator, renderer, model):
 
     engine.render(model)
 
-    validator.validate_template.assert_called_once()
\ No newline at end of file
+    validator.validate_template.assert_called_once()
+
+def test_variables_extracted_once_at_build(parser, validator, renderer, model):
+    parser.extract_variables.return_value = {"name"}
+    renderer.render.return_value = "OK"
+
+    engine = TemplateEngine(parser, validator, renderer, subject="S {{ name }}", text="T {{ name }}")
+    assert parser.extract_variables.call_count == 2
+
+    engine.render(model)
+    engine.render(model)
+    assert parser.extract_variables.call_count == 2
+
+
+def test_validation_cached_per_model_class(validator, renderer):
+    from jinja2 import Environment
+    from smartmailer.core.template import JinjaTemplateParser, TemplateModel
+
+    class Person(TemplateModel):
+        name: str
+
+    renderer.render.return_value = "OK"
+    engine = TemplateEngine(JinjaTemplateParser(Environment()), validator, renderer, text="Hi {{ name }}")
+
+    for name in ["a", "b", "c"]:
+        engine.validate(Person(name=name))
+
+    validator.validate_template.assert_called_once_with({"name"}, {"name"})
+
+
+def test_mixed_model_classes_still_fail_fast(renderer):
+    from jinja2 import Environment
+    from smartmailer.core.template import JinjaTemplateParser, TemplateModel, TemplateValidator
+
+    class Person(TemplateModel):
+        name: str
+
+    class Company(TemplateModel):
+        title: str
+
+    engine = TemplateEngine(JinjaTemplateParser(Environment()), TemplateValidator(), renderer, text="Hi {{ name }}")
+    engine.validate(Person(name="a"))
+
+    with pytest.raises(ValueError):
+        engine.validate(Company(title="b"))
+    with pytest.raises(ValueError):
+        engine.validate(Company(title="c"))
+
+
+def test_non_pydantic_models_validated_every_time(parser, validator, renderer, model):
+    parser.extract_variables.return_value = {"name"}
+    engine = TemplateEngine(parser, validator, renderer, text="Hello {{ name }}")
+
+    engine.validate(model)
+    engine.validate(model)
+
+    assert validator.validate_template.call_count == 2
+
+
+class CountingModel:
+    dumps = 0
+
+    def __init__(self, name):
+        self.name = name
+
+    def to_dict(self):
+        CountingModel.dumps += 1
+        return {"name": self.name}
+
+
+def test_render_extracts_data_once(parser, validator, renderer):
+    parser.extract_variables.return_value = {"name"}
+    renderer.render.return_value = "OK"
+    engine = TemplateEngine(parser, validator, renderer, subject="S", text="T", html="H")
+
+    CountingModel.dumps = 0
+    engine.render(CountingModel("abc"))
+    assert CountingModel.dumps == 1
+
+
+def test_render_many_yields_compact_results_in_order():
+    from jinja2 import Environment
+    from smartmailer.core.template import JinjaTemplateParser, JinjaTemplateRenderer, TemplateValidator, RenderResult
+
+    env = Environment()
+    engine = TemplateEngine(
+        JinjaTemplateParser(env), TemplateValidator(), JinjaTemplateRenderer(env),
+        subject="Hi {{ name }}", html="<b>{{ name }}</b>",
+    )
+    CountingModel.dumps = 0
+    models = [CountingModel(name) for name in ["a", "b", "c"]]
+    results = list(engine.render_many(iter(models)))
+
+    assert CountingModel.dumps == 3
+    assert results[1] == RenderResult(models[1], "Hi b", None, "<b>b</b>")
+    assert [r.model for r in results] == models
+    assert all(r.error is None for r in results)
+
+
+def test_render_many_reports_errors_per_model(validator, renderer):
+    from jinja2 import Environment
+    from smartmailer.core.template import JinjaTemplateParser, TemplateModel, TemplateValidator
+
+    class Person(TemplateModel):
+        name: str
+
+    class Other(TemplateModel):
+        title: str
+
+    env = Environment()
+    renderer.render.side_effect = lambda template, data: data["name"]
+    engine = TemplateEngine(JinjaTemplateParser(env), TemplateValidator(), renderer, text="{{ name }}")
+
+    results = list(engine.render_many([Person(name="a"), Other(title="x"), Person(name="b")]))
+
+    assert [r.text for r in results] == ["a", None, "b"]
+    assert isinstance(results[1].error, ValueError)
+
+
+def test_render_times_each_stage_into_stats(parser, validator, renderer):
+    from smartmailer.utils.metrics import SendStats
+
+    parser.extract_variables.return_value = {"name"}
+    renderer.render.return_value = "OK"
+    engine = TemplateEngine(parser, validator, renderer, subject="S", text="T")
+    stats = SendStats()
+
+    list(engine.render_many([CountingModel("abc")], stats=stats))
+
+    counts = {stage: h.count for stage, h in stats.histograms.items()}
+    assert counts["dump"] == counts["validate"] == counts["render"] == 1
+    assert not hasattr(engine, "stats")
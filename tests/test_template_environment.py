@@ -0,0 +1,68 @@
+import os
+from unittest.mock import patch
+from jinja2 import FileSystemBytecodeCache
+from smartmailer.core.template import JinjaTemplateRenderer, create_environment
+from smartmailer.core.template.parallel import build_environment, environment_config
+
+
+def test_default_cache_dir_is_next_to_sessions(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    env = create_environment()
+    assert isinstance(env.bytecode_cache, FileSystemBytecodeCache)
+    assert os.path.isdir(tmp_path / "mail_sessions" / "jinja_cache")
+
+
+def test_options_are_passed_on(tmp_path):
+    env = create_environment(cache_dir=str(tmp_path), trim_blocks=True)
+    assert env.trim_blocks is True
+
+
+def test_second_run_loads_compiled_templates(tmp_path):
+    template = "{% for x in items %}{{ x|upper }} {% endfor %}"
+
+    first = JinjaTemplateRenderer(create_environment(cache_dir=str(tmp_path)))
+    assert first.render(template, {"items": ["a", "b"]}) == "A B "
+    assert len(os.listdir(tmp_path)) == 1
+
+    env = create_environment(cache_dir=str(tmp_path))
+    with patch.object(env, "compile", wraps=env.compile) as compile:
+        second = JinjaTemplateRenderer(env)
+        assert second.render(template, {"items": ["c"]}) == "C "
+    compile.assert_not_called()
+
+
+def test_each_source_gets_its_own_entry(tmp_path):
+    renderer = JinjaTemplateRenderer(create_environment(cache_dir=str(tmp_path)))
+    renderer.render("Hi {{ name }}", {"name": "a"})
+    renderer.render("Bye {{ name }}", {"name": "a"})
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_cache_goes_with_environment_to_workers(tmp_path):
+    env = create_environment(cache_dir=str(tmp_path))
+    rebuilt = build_environment(environment_config(env))
+    assert rebuilt.bytecode_cache.directory == str(tmp_path)
+
+
+def test_parser_saves_variables_with_the_cache(tmp_path):
+    from smartmailer.core.template import JinjaTemplateParser
+
+    template = "{{ name }} {% for x in items %}{{ x }}{% endfor %}"
+    first = JinjaTemplateParser(create_environment(cache_dir=str(tmp_path)))
+    assert first.extract_variables(template) == {"name", "items"}
+
+    env = create_environment(cache_dir=str(tmp_path))
+    with patch.object(env, "parse") as parse:
+        assert JinjaTemplateParser(env).extract_variables(template) == {"name", "items"}
+    parse.assert_not_called()
+
+
+def test_clearing_the_cache_removes_saved_variables(tmp_path):
+    from smartmailer.core.template import JinjaTemplateParser
+
+    env = create_environment(cache_dir=str(tmp_path))
+    JinjaTemplateParser(env).extract_variables("{{ name }}")
+    assert os.listdir(tmp_path)
+
+    env.bytecode_cache.clear()
+    assert os.listdir(tmp_path) == []
@@ -31,3 +31,70 @@ def test_model_empty_schema():
 
 
 
+
+
+def test_hash_string_is_fixed_length_digest():
+    class UserTemplate(TemplateModel):
+        name: str
+        bio: str
+
+    model = UserTemplate(name="ABC", bio="x" * 10_000)
+    assert len(model.hash_string) == 64
+    int(model.hash_string, 16)
+
+
+def test_hash_string_matches_legacy_json_digest():
+    import json
+    from smartmailer.utils.strings import get_hash
+
+    class UserTemplate(TemplateModel):
+        name: str
+        age: int
+
+    model = UserTemplate(name="ABC", age=20)
+    assert model.hash_string == get_hash(json.dumps({"name": "ABC", "age": 20}))
+
+
+def test_hash_string_computed_once_per_instance():
+    from unittest.mock import patch
+
+    class UserTemplate(TemplateModel):
+        name: str
+
+    model = UserTemplate(name="ABC")
+    with patch("smartmailer.core.template.model.get_hash", wraps=lambda s: "digest") as mock_hash:
+        first = model.hash_string
+        second = model.hash_string
+    assert first == second == "digest"
+    assert mock_hash.call_count == 1
+
+
+def test_hash_string_schema_cached_per_class():
+    from unittest.mock import patch
+
+    class UserTemplate(TemplateModel):
+        name: str
+
+    with patch.object(UserTemplate, "model_json_schema", wraps=UserTemplate.model_json_schema) as mock_schema:
+        UserTemplate(name="a").hash_string
+        UserTemplate(name="b").hash_string
+    assert mock_schema.call_count == 1
+
+
+def test_hash_string_updates_on_assignment():
+    class UserTemplate(TemplateModel):
+        name: str
+
+    model = UserTemplate(name="a")
+    before = model.hash_string
+    model.name = "b"
+    assert model.hash_string != before
+    assert model.hash_string == UserTemplate(name="b").hash_string
+
+
+def test_equal_models_share_hash():
+    class UserTemplate(TemplateModel):
+        name: str
+
+    assert UserTemplate(name="a").hash_string == UserTemplate(name="a").hash_string
+    assert UserTemplate(name="a") == UserTemplate(name="a")
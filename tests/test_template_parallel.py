@@ -0,0 +1,113 @@
+import pytest
+from jinja2 import Environment, StrictUndefined
+from smartmailer.core.template import (
+    JinjaTemplateParser,
+    JinjaTemplateRenderer,
+    TemplateEngine,
+    TemplateModel,
+    TemplateValidator,
+)
+from smartmailer.core.template.parallel import ParallelRenderer, build_environment, environment_config
+
+
+def shout(value):
+    return str(value).upper() + "!"
+
+
+def fail_on_boom(value):
+    if value == "boom":
+        raise ValueError("boom")
+    return value
+
+
+class Person(TemplateModel):
+    name: str
+    items: list
+
+
+def make_engine(env=None, **templates):
+    env = env or Environment()
+    return TemplateEngine(
+        parser=JinjaTemplateParser(env),
+        validator=TemplateValidator(),
+        renderer=JinjaTemplateRenderer(env),
+        **templates,
+    )
+
+
+def test_environment_round_trip():
+    env = Environment(trim_blocks=True, undefined=StrictUndefined, extensions=["jinja2.ext.loopcontrols"])
+    env.filters["shout"] = shout
+    rebuilt = build_environment(environment_config(env))
+
+    assert rebuilt.trim_blocks is True
+    assert rebuilt.undefined is StrictUndefined
+    assert rebuilt.filters["shout"] is shout
+    assert "jinja2.ext.LoopControlExtension" in rebuilt.extensions
+
+
+def test_lambda_filters_are_rejected():
+    env = Environment()
+    env.filters["bad"] = lambda value: value
+    with pytest.raises(ValueError):
+        ParallelRenderer(make_engine(env, subject="{{ name|bad }}"))
+
+
+def test_needs_jinja_renderer():
+    engine = make_engine(subject="{{ name }}")
+    engine.renderer = object()
+    with pytest.raises(ValueError):
+        ParallelRenderer(engine)
+
+
+def test_parallel_matches_serial_and_keeps_order():
+    env = Environment()
+    env.filters["shout"] = shout
+    engine = make_engine(
+        env,
+        subject="Hi {{ name|shout }}",
+        text="{% for item in items %}{{ item }},{% endfor %}",
+        html="<b>{{ name }}</b>",
+    )
+    people = [Person(name=f"p{i}", items=list(range(i % 4))) for i in range(100)]
+
+    with ParallelRenderer(engine, processes=2, chunk_size=7) as renderer:
+        results = list(renderer.render(iter(people)))
+
+    assert [model for model, _, _ in results] == people
+    assert [rendered for _, rendered, _ in results] == [engine.render(person) for person in people]
+
+
+def test_errors_are_reported_per_recipient():
+    env = Environment()
+    env.filters["fail_on_boom"] = fail_on_boom
+    engine = make_engine(env, subject="{{ name|fail_on_boom }}")
+    people = [Person(name="ok", items=[]), Person(name="boom", items=[]), Person(name="fine", items=[])]
+
+    with ParallelRenderer(engine, processes=1, chunk_size=2) as renderer:
+        results = list(renderer.render(people))
+
+    assert results[0][1] == {"subject": "ok", "text": None, "html": None}
+    assert results[1][1] is None and "boom" in str(results[1][2])
+    assert results[2][1]["subject"] == "fine"
+
+
+def test_validation_errors_are_reported_per_recipient():
+    engine = make_engine(subject="{{ missing }}")
+    with ParallelRenderer(engine, processes=1) as renderer:
+        (_, rendered, error), = renderer.render([Person(name="a", items=[])])
+    assert rendered is None
+    assert isinstance(error, ValueError)
+
+
+def test_render_times_are_recorded_in_stats():
+    from smartmailer.utils.metrics import SendStats
+
+    engine = make_engine(subject="Hi {{ name }}")
+    stats = SendStats()
+    people = [Person(name=str(i), items=[]) for i in range(5)]
+    with ParallelRenderer(engine, processes=1, chunk_size=2) as parallel:
+        list(parallel.render(people, stats=stats))
+
+    assert stats.histograms["render"].count == 5
+    assert stats.histograms["dump"].count == 5
@@ -92,3 +92,54 @@ def test_renderer_default_filter():
 
     assert out == "Guest"
 
+
+def test_renderer_caches_compiled_template():
+    env = Environment()
+    renderer = JinjaTemplateRenderer(env)
+
+    for name in ["a", "b", "c"]:
+        renderer.render("Hello {{ name }}", {"name": name})
+
+    info = renderer.cache_info()
+    assert info.misses == 1
+    assert info.hits == 2
+    assert info.currsize == 1
+
+
+def test_renderer_cache_evicts_least_recently_used():
+    env = Environment()
+    renderer = JinjaTemplateRenderer(env, cache_size=2)
+
+    renderer.render("{{ a }}", {"a": 1})
+    renderer.render("{{ b }}", {"b": 1})
+    renderer.render("{{ a }}", {"a": 1})
+    renderer.render("{{ c }}", {"c": 1})  # evicts "{{ b }}"
+    renderer.render("{{ a }}", {"a": 1})
+    renderer.render("{{ b }}", {"b": 1})
+
+    info = renderer.cache_info()
+    assert info.currsize == 2
+    assert info.hits == 2
+    assert info.misses == 4
+
+
+def test_renderer_does_not_cache_invalid_template():
+    env = Environment()
+    renderer = JinjaTemplateRenderer(env)
+
+    with pytest.raises(ValueError):
+        renderer.render("Hello {{ name ", {"name": "abc"})
+    assert renderer.cache_info().currsize == 0
+
+
+def test_renderer_clear_cache():
+    env = Environment()
+    renderer = JinjaTemplateRenderer(env)
+    renderer.render("{{ a }}", {"a": 1})
+    renderer.clear_cache()
+    assert renderer.cache_info() == (0, 0, 128, 0)
+
+
+def test_renderer_invalid_cache_size():
+    with pytest.raises(ValueError):
+        JinjaTemplateRenderer(Environment(), cache_size=0)